@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from rate_limiter import AsyncTokenBucket, MANGADEX_GLOBAL_RATE, MANGADEX_AT_HOME_RATE
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+def _stringify(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def encode_params(params):
+    """Chuyển params kiểu requests (list, dict order) sang list tuple cho aiohttp."""
+    if not params:
+        return None
+    query = []
+    for key, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                query.append((f"{key}[{sub_key}]", _stringify(sub_value)))
+        elif isinstance(value, (list, tuple, set)):
+            query.extend((key, _stringify(item)) for item in value)
+        else:
+            query.append((key, _stringify(value)))
+    return query
+
+
+def _retry_after(headers, default=60):
+    """Đọc thời gian chờ từ Retry-After hoặc X-RateLimit-Retry-After (epoch)."""
+    if headers.get("Retry-After"):
+        try:
+            return max(0.0, float(headers["Retry-After"]))
+        except ValueError:
+            pass
+    if headers.get("X-RateLimit-Retry-After"):
+        try:
+            return max(0.0, float(headers["X-RateLimit-Retry-After"]) - time.time())
+        except ValueError:
+            pass
+    return default
+
+
+class AsyncMangaDexAPI:
+    """Phiên bản asyncio của MangaDexAPI.
+
+    Mọi request đi qua một token bucket dùng chung (giới hạn toàn cục của MangaDex),
+    riêng /at-home/server còn phải qua bucket thứ hai chặt hơn. Nhờ vậy có thể
+    asyncio.gather hàng trăm lookup cùng lúc mà không bị 429.
+    """
+
+    def __init__(self, base_url="https://api.mangadex.org", max_retries=5, backoff_factor=2,
+                 rate_limiter=None, at_home_limiter=None, max_connections=20, timeout=10):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.rate_limiter = rate_limiter or AsyncTokenBucket(MANGADEX_GLOBAL_RATE)
+        self.at_home_limiter = at_home_limiter or AsyncTokenBucket(MANGADEX_AT_HOME_RATE, capacity=1)
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36",
+            "Referer": "https://mangadex.org/"
+        }
+        self.session = None
+
+    async def __aenter__(self):
+        await self._get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.max_connections)
+            )
+        return self.session
+
+    async def make_request(self, url, params=None):
+        """Thực hiện yêu cầu GET qua token bucket, retry khi 429/5xx hoặc lỗi mạng."""
+        session = await self._get_session()
+        query = encode_params(params)
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            if "/at-home/server/" in url:
+                await self.at_home_limiter.acquire()
+            try:
+                async with session.get(url, params=query) as response:
+                    if response.status == 429:
+                        retry_after = _retry_after(response.headers)
+                        logger.warning(f"Rate limited. Tạm dừng toàn bộ request trong {retry_after:.1f} giây.")
+                        self.rate_limiter.pause(retry_after)
+                        continue
+                    if response.status in RETRY_STATUSES and attempt < self.max_retries:
+                        await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+                        continue
+                    response.raise_for_status()
+                    data = await response.json()
+            except aiohttp.ClientResponseError as e:
+                logger.error(f"Yêu cầu thất bại: {str(e)}")
+                raise
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    logger.error(f"Yêu cầu thất bại: {str(e)}")
+                    raise aiohttp.ClientError(str(e)) from e
+                await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+                continue
+            if data.get("result") != "ok":
+                logger.error(f"API trả về lỗi: {data.get('errors', 'Không có thông tin lỗi')}")
+                return None
+            return data
+        raise aiohttp.ClientError(f"Hết {self.max_retries} lần retry cho {url}")
+
+    async def _get(self, url, params=None, error_message="Yêu cầu thất bại"):
+        try:
+            return await self.make_request(url, params)
+        except aiohttp.ClientError as e:
+            logger.error(f"{error_message}: {e}")
+            return None
+
+    async def search_manga(self, title=None, authors=None, artists=None, year=None, included_tags=None, excluded_tags=None, status=None, original_language=None, publication_demographic=None, ids=None, content_rating=None, created_at_since=None, updated_at_since=None, order=None, includes=None, has_available_chapters=None, has_unavailable_chapters=None, group=None, limit=10, offset=0):
+        """Tìm kiếm manga với các bộ lọc."""
+        params = {
+            "limit": min(limit, 100),
+            "offset": offset,
+            "title": title,
+            "authors[]": authors,
+            "artists[]": artists,
+            "year": year,
+            "includedTags[]": included_tags,
+            "excludedTags[]": excluded_tags,
+            "status[]": status,
+            "originalLanguage[]": original_language,
+            "publicationDemographic[]": publication_demographic,
+            "ids[]": ids,
+            "contentRating[]": content_rating,
+            "createdAtSince": created_at_since,
+            "updatedAtSince": updated_at_since,
+            "order": order,
+            "includes[]": includes,
+            "hasAvailableChapters": has_available_chapters,
+            "hasUnavailableChapters": has_unavailable_chapters,
+            "group": group
+        }
+        return await self._get(f"{self.base_url}/manga", params, "Lỗi khi tìm kiếm manga")
+
+    async def get_manga(self, manga_id, includes=None):
+        """Lấy thông tin chi tiết của manga theo ID."""
+        return await self._get(f"{self.base_url}/manga/{manga_id}", {"includes[]": includes},
+                               f"Lỗi khi lấy manga {manga_id}")
+
+    async def get_manga_aggregate(self, manga_id, translated_language=None):
+        """Lấy thông tin tập và chương của manga."""
+        return await self._get(f"{self.base_url}/manga/aggregate/{manga_id}",
+                               {"translatedLanguage[]": translated_language},
+                               f"Lỗi khi lấy tập và chương của manga {manga_id}")
+
+    async def get_manga_statistics(self, manga_id):
+        """Lấy thống kê manga (score, số lượt theo dõi)."""
+        return await self._get(f"{self.base_url}/statistics/manga/{manga_id}",
+                               error_message=f"Lỗi khi lấy thống kê manga {manga_id}")
+
+    async def get_chapters(self, manga_id=None, groups=None, translated_language=None, original_language=None, content_rating=None, include_future_updates="1", include_empty_pages=0, include_future_publish_at=0, include_external_url=0, include_unavailable="0", created_at_since=None, updated_at_since=None, publish_at_since=None, order=None, includes=None, limit=100, offset=0):
+        """Lấy danh sách chương với các bộ lọc."""
+        params = {
+            "limit": min(limit, 100),
+            "offset": offset,
+            "includeFutureUpdates": include_future_updates,
+            "includeEmptyPages": include_empty_pages,
+            "includeFuturePublishAt": include_future_publish_at,
+            "includeExternalUrl": include_external_url,
+            "includeUnavailable": include_unavailable,
+            "manga": manga_id,
+            "groups[]": groups,
+            "translatedLanguage[]": translated_language,
+            "originalLanguage[]": original_language,
+            "contentRating[]": content_rating,
+            "createdAtSince": created_at_since,
+            "updatedAtSince": updated_at_since,
+            "publishAtSince": publish_at_since,
+            "order": order,
+            "includes[]": includes
+        }
+        return await self._get(f"{self.base_url}/chapter", params, "Lỗi khi lấy danh sách chương")
+
+    async def get_chapter(self, chapter_id, includes=None):
+        """Lấy thông tin chi tiết của chương theo ID."""
+        return await self._get(f"{self.base_url}/chapter/{chapter_id}", {"includes[]": includes},
+                               f"Lỗi khi lấy chương {chapter_id}")
+
+    async def get_chapter_images(self, chapter_id, quality="data"):
+        """Lấy danh sách URL hình ảnh của chương (đi qua bucket riêng của /at-home/server)."""
+        data = await self._get(f"{self.base_url}/at-home/server/{chapter_id}",
+                               error_message=f"Lỗi khi lấy hình ảnh chương {chapter_id}")
+        if not data:
+            return None
+        base_url = data["baseUrl"]
+        chapter_hash = data["chapter"]["hash"]
+        pages = data["chapter"][quality]
+        return [f"{base_url}/{quality}/{chapter_hash}/{page}" for page in pages]
+
+    async def get_authors(self, name=None, ids=None, order=None, includes=None, limit=10, offset=0):
+        """Lấy danh sách tác giả với các bộ lọc."""
+        params = {
+            "limit": min(limit, 100),
+            "offset": offset,
+            "name": name,
+            "ids[]": ids,
+            "order": order,
+            "includes[]": includes
+        }
+        return await self._get(f"{self.base_url}/author", params, "Lỗi khi lấy danh sách tác giả")
+
+    async def get_author(self, author_id, includes=None):
+        """Lấy thông tin chi tiết của tác giả theo ID."""
+        return await self._get(f"{self.base_url}/author/{author_id}", {"includes[]": includes},
+                               f"Lỗi khi lấy tác giả {author_id}")
+
+    async def get_cover_arts(self, manga=None, ids=None, uploaders=None, locales=None, order=None, includes=None, limit=10, offset=0):
+        """Lấy danh sách ảnh bìa với các bộ lọc."""
+        params = {
+            "limit": min(limit, 100),
+            "offset": offset,
+            "manga[]": manga,
+            "ids[]": ids,
+            "uploaders[]": uploaders,
+            "locales[]": locales,
+            "order": order,
+            "includes[]": includes
+        }
+        return await self._get(f"{self.base_url}/cover", params, "Lỗi khi lấy danh sách ảnh bìa")
+
+    async def get_cover_art(self, cover_id, includes=None):
+        """Lấy thông tin chi tiết của ảnh bìa theo ID."""
+        return await self._get(f"{self.base_url}/cover/{cover_id}", {"includes[]": includes},
+                               f"Lỗi khi lấy ảnh bìa {cover_id}")
+
+    async def get_tags(self):
+        """Lấy danh sách thẻ."""
+        return await self._get(f"{self.base_url}/manga/tag", error_message="Lỗi khi lấy danh sách thẻ")
+
+    async def close(self):
+        """Đóng session HTTP."""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import MongoClient, ReplaceOne
+from pymongo.errors import OperationFailure
+
+from async_mangadex_api import AsyncMangaDexAPI
+
+# ===== CONFIG =====
+MONGO_URI = "mongodb://localhost:27017/"
+DB_NAME = "manga_raw_data"
+MANGA_COLLECTION = "mangadex_manga"  # Main fact table collection
+CHECKPOINT_COLLECTION = "mangadex_crawl_checkpoints"
+
+PAGE_SIZE = 100
+MAX_OFFSET_WINDOW = 10000  # MangaDex rejects offset + limit > 10000
+DEFAULT_WINDOWS = 8
+# /manga hides erotica/pornographic unless every rating is requested
+ALL_CONTENT_RATINGS = ["safe", "suggestive", "erotica", "pornographic"]
+INCLUDES = ["author", "artist", "cover_art"]
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# Sort field -> search_manga keyword for the matching *Since filter
+SINCE_PARAMS = {
+    "createdAt": "created_at_since",
+    "updatedAt": "updated_at_since"
+}
+
+# ===== Logging Setup =====
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('mangadex_crawl.log', encoding='utf-8'),
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _timestamp(value: str) -> str:
+    """MangaDex *Since filters take YYYY-MM-DDTHH:MM:SS without offset."""
+    return value[:19]
+
+
+def split_windows(start: str, end: str, count: int) -> List[Dict[str, Any]]:
+    """Split [start, end) into `count` equal time windows with fresh cursors."""
+    start_dt = datetime.strptime(start, TIMESTAMP_FORMAT)
+    end_dt = datetime.strptime(end, TIMESTAMP_FORMAT)
+    step = (end_dt - start_dt) / max(1, count)
+    bounds = [(start_dt + step * i).strftime(TIMESTAMP_FORMAT) for i in range(count)] + [end]
+    return [
+        {"start": bounds[i], "end": bounds[i + 1], "cursor": bounds[i], "offset": 0, "skip_ids": [], "done": False}
+        for i in range(count) if bounds[i] < bounds[i + 1]
+    ]
+
+
+class CatalogCrawler:
+    """Crawl the MangaDex catalog into `mangadex_manga`.
+
+    The timeline of the sort field (createdAt for a full crawl, updatedAt for an
+    incremental one) is split into windows that are crawled concurrently. All
+    windows share the client's token bucket, so concurrency only fills the global
+    rate limit instead of exceeding it. Each page is upserted as soon as it
+    arrives and the window cursor is checkpointed in Mongo, so memory stays flat
+    and an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, db, api: AsyncMangaDexAPI, field: str = "createdAt"):
+        self.db = db
+        self.api = api
+        self.field = field
+        self.run_id = f"catalog_{field}"
+        self.manga = db[MANGA_COLLECTION]
+        self.checkpoints = db[CHECKPOINT_COLLECTION]
+        self.saved = 0
+
+    def ensure_indexes(self):
+        """Upserts are keyed on `id`; without an index every page is a collection scan."""
+        try:
+            self.manga.create_index("id", unique=True)
+        except OperationFailure as e:
+            logger.warning(f"[WARN] Could not create unique index on {MANGA_COLLECTION}.id ({e}), using a plain index")
+            self.manga.create_index("id")
+
+    def load_run(self) -> Optional[Dict[str, Any]]:
+        run = self.checkpoints.find_one({"_id": self.run_id})
+        if run and not run.get("completed"):
+            return run
+        return None
+
+    def last_watermark(self) -> Optional[str]:
+        doc = self.checkpoints.find_one({"_id": "watermark"})
+        return doc["value"] if doc else None
+
+    async def first_timestamp(self) -> Optional[str]:
+        """Oldest value of the sort field in the catalog."""
+        data = await self.api.search_manga(order={self.field: "asc"}, content_rating=ALL_CONTENT_RATINGS, limit=1)
+        if not data or not data.get("data"):
+            return None
+        return _timestamp(data["data"][0]["attributes"][self.field])
+
+    async def start_run(self, since: Optional[str], window_count: int) -> Optional[Dict[str, Any]]:
+        started_at = datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+        start = since or await self.first_timestamp()
+        if not start:
+            logger.error("[ERROR] Could not determine where the catalog starts")
+            return None
+        run = {
+            "_id": self.run_id,
+            "started_at": started_at,
+            "windows": split_windows(start, started_at, window_count),
+            "completed": False
+        }
+        self.checkpoints.replace_one({"_id": self.run_id}, run, upsert=True)
+        logger.info(f"[START] {self.field} crawl from {start} to {started_at} in {len(run['windows'])} windows")
+        return run
+
+    def save_window(self, index: int, window: Dict[str, Any]):
+        self.checkpoints.update_one({"_id": self.run_id}, {"$set": {f"windows.{index}": window}})
+
+    def upsert(self, mangas: List[Dict[str, Any]]):
+        fetched_at = datetime.now().isoformat()
+        ops = [ReplaceOne({"id": m["id"]}, dict(m, fetched_at=fetched_at), upsert=True) for m in mangas]
+        self.manga.bulk_write(ops, ordered=False)
+
+    async def crawl_window(self, index: int, window: Dict[str, Any]) -> bool:
+        """Page through one window; when the offset cap is near, restart from the last timestamp."""
+        since_param = SINCE_PARAMS[self.field]
+        skip_ids = set(window["skip_ids"])
+        boundary_ts, boundary_ids = None, set()
+        while True:
+            data = await self.api.search_manga(
+                **{since_param: window["cursor"]},
+                order={self.field: "asc"},
+                content_rating=ALL_CONTENT_RATINGS,
+                includes=INCLUDES,
+                limit=PAGE_SIZE,
+                offset=window["offset"]
+            )
+            if data is None:
+                logger.error(f"[ERROR] Window {index} stopped at {window['cursor']} (offset {window['offset']}); rerun to resume")
+                return False
+
+            items = data.get("data", [])
+            batch = []
+            past_end = False
+            for manga in items:
+                ts = _timestamp(manga["attributes"][self.field])
+                if ts >= window["end"]:
+                    past_end = True
+                    break
+                if ts != boundary_ts:
+                    boundary_ts, boundary_ids = ts, set()
+                boundary_ids.add(manga["id"])
+                if manga["id"] not in skip_ids:
+                    batch.append(manga)
+            if batch:
+                await asyncio.to_thread(self.upsert, batch)
+                self.saved += len(batch)
+
+            if past_end or len(items) < PAGE_SIZE:
+                window["done"] = True
+            elif window["offset"] + 2 * PAGE_SIZE > MAX_OFFSET_WINDOW:
+                # Restart the window at the last timestamp; manga already stored at that instant are skipped
+                window["cursor"] = boundary_ts
+                window["offset"] = 0
+                skip_ids = set(boundary_ids)
+                window["skip_ids"] = sorted(skip_ids)
+            else:
+                window["offset"] += PAGE_SIZE
+            await asyncio.to_thread(self.save_window, index, window)
+
+            if window["done"]:
+                logger.info(f"[SUCCESS] Window {index} ({window['start']} -> {window['end']}) done")
+                return True
+            if window["offset"] == 0:
+                logger.info(f"[WINDOW] Window {index} moved to {window['cursor']} ({self.saved} manga saved so far)")
+
+    async def run(self, window_count: int = DEFAULT_WINDOWS, since: Optional[str] = None) -> bool:
+        self.ensure_indexes()
+        run = self.load_run()
+        if run:
+            pending = sum(not w["done"] for w in run["windows"])
+            logger.info(f"[RESUME] Resuming {self.field} crawl started at {run['started_at']} ({pending} windows left)")
+        else:
+            run = await self.start_run(since, window_count)
+            if not run:
+                return False
+
+        results = await asyncio.gather(*(
+            self.crawl_window(i, w) for i, w in enumerate(run["windows"]) if not w["done"]
+        ))
+        if not all(results):
+            logger.warning(f"[WARN] {results.count(False)} windows did not finish; progress is checkpointed")
+            return False
+
+        self.checkpoints.update_one({"_id": self.run_id}, {"$set": {"completed": True}})
+        # Anything updated after the crawl started is picked up by the next incremental run
+        self.checkpoints.replace_one({"_id": "watermark"}, {"_id": "watermark", "value": run["started_at"]}, upsert=True)
+        logger.info(f"[SUCCESS] Crawl completed: {self.saved} manga upserted, watermark {run['started_at']}")
+        return True
+
+
+async def crawl(args) -> bool:
+    mongo_client = MongoClient(MONGO_URI)
+    try:
+        db = mongo_client[DB_NAME]
+        if args.reset:
+            db[CHECKPOINT_COLLECTION].delete_many({"_id": {"$regex": "^catalog_"}})
+            logger.info("[RESET] Crawl checkpoints cleared")
+        async with AsyncMangaDexAPI() as api:
+            if args.incremental:
+                crawler = CatalogCrawler(db, api, field="updatedAt")
+                since = args.since or crawler.last_watermark()
+                if not since and not crawler.load_run():
+                    logger.error("[ERROR] No watermark found; run a full crawl first or pass --since")
+                    return False
+            else:
+                crawler = CatalogCrawler(db, api, field="createdAt")
+                since = args.since
+            return await crawler.run(args.windows, since)
+    finally:
+        mongo_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl the full MangaDex catalog into MongoDB")
+    parser.add_argument("--windows", type=int, default=DEFAULT_WINDOWS,
+                        help="Number of time windows crawled concurrently")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only fetch manga updated since the last completed crawl (updatedAtSince)")
+    parser.add_argument("--since", type=str, default=None,
+                        help="Override the start timestamp (YYYY-MM-DDTHH:MM:SS)")
+    parser.add_argument("--reset", action="store_true",
+                        help="Discard unfinished crawl checkpoints and start over")
+
+    args = parser.parse_args()
+    try:
+        ok = asyncio.run(crawl(args))
+    except KeyboardInterrupt:
+        logger.info("[PAUSE] Process interrupted by user. Progress saved.")
+        ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# TTL mặc định (giây) theo loại entity
+DEFAULT_TTLS = {
+    "author": 24 * 3600,
+    "cover_art": 24 * 3600,
+    "tag": 7 * 24 * 3600,
+    # URL node MangaDex@Home chỉ sống khoảng 15 phút
+    "at_home": 5 * 60
+}
+DEFAULT_TTL = 3600
+
+
+class EntityCache:
+    """Cache LRU có TTL theo loại entity cho các lookup của MangaDexAPI.
+
+    - Các lookup đồng thời cùng (loại, ID) chỉ tạo một request (singleflight)
+    - Có thể ghi xuống file SQLite (db_path) để dùng lại sau khi khởi động lại
+    """
+
+    def __init__(self, max_entries=10000, ttls=None, db_path=None):
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS entities (
+                    entity_type TEXT NOT NULL,
+                    entity_id TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (entity_type, entity_id)
+                )
+            """)
+            self._db.commit()
+
+    def _get_locked(self, key):
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+            del self._entries[key]
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT expires_at, value FROM entities WHERE entity_type = ? AND entity_id = ? AND expires_at > ?",
+                (key[0], key[1], now)).fetchone()
+            if row:
+                value = json.loads(row[1])
+                self._store_locked(key, row[0], value)
+                return value
+        return None
+
+    def _store_locked(self, key, expires_at, value):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, entity_type, entity_id):
+        """Trả về giá trị còn hạn hoặc None."""
+        with self._lock:
+            return self._get_locked((entity_type, entity_id))
+
+    def put(self, entity_type, entity_id, value, ttl=None):
+        """Ghi một entity vào cache (và xuống đĩa nếu có)."""
+        expires_at = time.time() + (ttl if ttl is not None else self.ttls.get(entity_type, DEFAULT_TTL))
+        key = (entity_type, entity_id)
+        with self._lock:
+            self._store_locked(key, expires_at, value)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?)",
+                                 (entity_type, entity_id, expires_at, json.dumps(value, ensure_ascii=False)))
+                self._db.commit()
+
+    def get_or_fetch(self, entity_type, entity_id, fetch):
+        """Lấy từ cache, nếu không có thì gọi fetch(); các lời gọi đồng thời cùng khóa dùng chung một kết quả."""
+        key = (entity_type, entity_id)
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.hits += 1
+        if not owner:
+            return future.result()
+
+        try:
+            value = fetch()
+            if value is not None:
+                self.put(entity_type, entity_id, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        logger.info(f"Entity cache: {self.hits} hit, {self.misses} miss.")
@@ -1,17 +1,26 @@
 import time
 import requests
 import argparse
+import asyncio
+import itertools
 import json
 import os
+import queue
+import socket
+import subprocess
 import sys
-from datetime import datetime
-from pymongo import MongoClient
-from typing import List, Dict, Any, Optional
+import threading
+from datetime import datetime, timedelta, timezone
+from pymongo import MongoClient, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional
 import logging
 
+from rate_limiter import AIMDController, MANGADEX_GLOBAL_RATE
+
 # ===== CONFIG =====
 BASE_URL = "https://api.mangadex.org"
-MONGO_URI = "mongodb://localhost:27017/"
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")  # Workers on other machines point here
 DB_NAME = "manga_raw_data"
 MANGA_COLLECTION = "mangadex_manga"  # Main fact table collection
 
@@ -27,15 +36,58 @@ COLLECTIONS = {
 }
 
 # API Configuration
-MIN_DELAY = 0.1
-MAX_DELAY = 5.0
+MAX_CONCURRENCY = 8       # Upper bound of the AIMD in-flight window
+LATENCY_TARGET = 2.0      # Seconds; slower responses count as congestion
+RETRY_BACKOFF = 0.5       # Per-call retry backoff base (seconds), doubled per attempt
+CONTROLLER_LOG_INTERVAL = 30.0
 MAX_RETRIES = 5
-BURST_SUCCESS_THRESHOLD = 10
 INITIAL_BATCH_SIZE = 100
 MIN_BATCH_SIZE = 10
+ENTITY_BATCH_SIZE = 100  # Max ids[] per request on /cover, /author, /group, /manga
+# /manga hides erotica/pornographic unless every rating is requested
+ALL_CONTENT_RATINGS = ["safe", "suggestive", "erotica", "pornographic"]
+RELATED_INCLUDES = ["cover_art", "author", "artist"]
+
+# Concurrent phase scheduler (--concurrent)
+# Phase -> phases whose output it reads; phases without a path between them run in parallel
+PHASE_DEPENDENCIES = {
+    'tags': [],
+    'statistics': [],
+    'chapters': [],
+    'related': [],
+    'covers': ['chapters', 'related']
+}
+# Relationship type -> entity stream fed while chapters/related are still running
+STREAM_TYPES = {
+    'cover_art': 'cover_arts',
+    'author': 'creators',
+    'artist': 'creators',
+    'scanlation_group': 'groups'
+}
+STREAM_FLUSH_SECONDS = 2.0  # Flush a partial batch when upstream has been quiet this long
+
+# Chapter delta sync (--phase chapters_delta)
+STATE_COLLECTION = "mangadex_sync_state"  # Watermarks live next to the data, not in the progress file
+MAX_OFFSET_WINDOW = 10000  # MangaDex rejects offset + limit > 10000
 
 # Progress tracking
-PROGRESS_FILE = "manga_progress.json"
+PROGRESS_FILE = "manga_progress.json"  # Legacy; imported once into STATE_COLLECTION if present
+LEDGER_COLLECTION = "mangadex_checkpoints"  # One status record per (phase, entity ID)
+LEDGER_FLUSH_SIZE = 500
+SCOPED_QUERY_LIMIT = 1000  # Below this many IDs, load done/ledger state with $in instead of a full scan
+
+# Statistics snapshots (time-series collection)
+STATS_TIMESERIES = {"timeField": "snapshotTime", "metaField": "mangaId", "granularity": "hours"}
+STATS_LEGACY_COLLECTION = "mangadex_statistics_legacy"  # Old per-document collection kept by --migrate-statistics
+STATS_MIGRATE_BATCH = 5000
+STATS_TRACKED_FIELDS = ("follows", "rating")  # --skip-unchanged compares these against the last snapshot
+
+# Lease-based work queue (--workers / --worker)
+WORK_QUEUE_COLLECTION = "mangadex_work_queue"
+WORK_CHUNK_SIZE = 200
+LEASE_SECONDS = 15 * 60  # A crashed worker's chunk becomes claimable again after this; renewed as items finish
+DUPLICATE_KEY = 11000
+WORKER_PHASES = ['statistics', 'chapters', 'related']  # Phases that are sharded per manga
 
 # ===== Logging Setup =====
 # Fix Unicode encoding issues for Windows
@@ -65,113 +117,422 @@ logger = logging.getLogger(__name__)
 mongo_client = MongoClient(MONGO_URI)
 db = mongo_client[DB_NAME]
 
+
+def _retry_after(headers, default: float = 60.0) -> float:
+    """Seconds to wait from Retry-After or X-RateLimit-Retry-After (epoch)."""
+    try:
+        if headers.get("Retry-After"):
+            return max(0.0, float(headers["Retry-After"]))
+        if headers.get("X-RateLimit-Retry-After"):
+            return max(0.0, float(headers["X-RateLimit-Retry-After"]) - time.time())
+    except ValueError:
+        pass
+    return default
+
+
+def slim_statistics(stat: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep the statistics fields the exports use; rating.distribution alone is most of the blob."""
+    rating = stat.get("rating") or {}
+    return {
+        "follows": stat.get("follows"),
+        "rating": {"average": rating.get("average"), "bayesian": rating.get("bayesian")},
+        "unavailableChaptersCount": stat.get("unavailableChaptersCount"),
+        "comments": stat.get("comments")
+    }
+
+
+def is_timeseries(name: str) -> bool:
+    info = next(iter(db.list_collections(filter={"name": name})), None)
+    return bool(info and info.get("type") == "timeseries")
+
+
+def create_statistics_collection():
+    """Create the statistics collection as a time-series collection (MongoDB 5.0+)."""
+    try:
+        db.create_collection(COLLECTIONS['statistics'], timeseries=STATS_TIMESERIES)
+        logger.info(f"[OK] Created time-series collection: {COLLECTIONS['statistics']}")
+    except OperationFailure as e:
+        logger.warning(f"[WARN] Time-series collections not supported ({e}); using a regular collection")
+        db.create_collection(COLLECTIONS['statistics'])
+    db[COLLECTIONS['statistics']].create_index([("mangaId", 1), ("snapshotTime", -1)])
+
+
+def migrate_statistics():
+    """Move snapshots from the old per-document collection into the time-series one.
+
+    The old collection is renamed to STATS_LEGACY_COLLECTION and kept; drop it
+    once the exports look right.
+    """
+    name = COLLECTIONS['statistics']
+    if name in db.list_collection_names():
+        if is_timeseries(name):
+            logger.info(f"[SKIP] {name} is already a time-series collection")
+            return
+        db[name].rename(STATS_LEGACY_COLLECTION)
+    if STATS_LEGACY_COLLECTION not in db.list_collection_names():
+        logger.info(f"[SKIP] No legacy statistics to migrate")
+        return
+    create_statistics_collection()
+
+    migrated = 0
+    batch = []
+    for doc in db[STATS_LEGACY_COLLECTION].find({}, {"_id": 0}).batch_size(STATS_MIGRATE_BATCH):
+        snapshot = doc.get("snapshotTime")
+        if isinstance(snapshot, (int, float)):
+            snapshot = datetime.fromtimestamp(snapshot, timezone.utc)
+        elif not isinstance(snapshot, datetime):
+            snapshot = datetime.fromisoformat(doc["fetched_at"]) if doc.get("fetched_at") else None
+        if not doc.get("mangaId") or snapshot is None:
+            continue
+        batch.append({
+            "mangaId": doc["mangaId"],
+            "snapshotTime": snapshot,
+            "source": doc.get("source", "mangadex"),
+            "statistics": slim_statistics(doc.get("statistics") or {})
+        })
+        if len(batch) >= STATS_MIGRATE_BATCH:
+            db[name].insert_many(batch, ordered=False)
+            migrated += len(batch)
+            batch = []
+    if batch:
+        db[name].insert_many(batch, ordered=False)
+        migrated += len(batch)
+    logger.info(f"[SUCCESS] Migrated {migrated} statistics snapshots into time-series {name}")
+
+
+def only_duplicate_keys(error: BulkWriteError) -> bool:
+    """True if every write error in an unordered bulk write is a duplicate key."""
+    return all(err.get("code") == DUPLICATE_KEY for err in error.details.get("writeErrors", []))
+
+
+def insert_ignore_duplicates(collection, docs: List[Dict[str, Any]]) -> int:
+    """insert_many(ordered=False) that tolerates documents another worker already stored.
+
+    Returns how many documents were inserted; any error other than a duplicate key is raised.
+    """
+    try:
+        return len(collection.insert_many(docs, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        if not only_duplicate_keys(e):
+            raise
+        return e.details.get("nInserted", 0)
+
+
+class DoneSet:
+    """In-memory set of keys that already exist in a collection.
+
+    Keys are streamed once through an index-only (covered) projection, then every
+    "already done?" check is a local set lookup instead of a Mongo round trip.
+    Call add()/update() as new documents land so the set stays current.
+    """
+
+    def __init__(self, collection, key: str = "_id", within: Optional[List[str]] = None,
+                 query: Optional[Dict[str, Any]] = None):
+        self.key = key
+        if key != "_id":
+            collection.create_index(key)
+        projection = {key: 1} if key == "_id" else {key: 1, "_id": 0}
+        query = dict(query or {})
+        # A worker handling one chunk only needs the keys of that chunk
+        if within is not None and len(within) <= SCOPED_QUERY_LIMIT:
+            query[key] = {"$in": within}
+        cursor = collection.find(query, projection).hint([(key, 1)]).batch_size(10000)
+        self._keys = {doc[key] for doc in cursor if key in doc}
+        logger.info(f"[DONE_SET] Loaded {len(self._keys)} existing {key} values from {collection.name}")
+
+    @classmethod
+    def empty(cls, key: str = "_id") -> "DoneSet":
+        """A DoneSet that starts empty without querying Mongo; only keys added during this run count."""
+        done = cls.__new__(cls)
+        done.key = key
+        done._keys = set()
+        return done
+
+    def __contains__(self, value) -> bool:
+        return value in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, value):
+        self._keys.add(value)
+
+    def update(self, values):
+        self._keys.update(values)
+
+    def missing(self, values: List[str]) -> List[str]:
+        """Values from `values` (order kept) that are not done yet."""
+        return [v for v in values if v not in self._keys]
+
+
+class CheckpointLedger:
+    """Per-(phase, entity) checkpoint records in Mongo.
+
+    Resuming is an indexed query for pending/failed IDs instead of a scan for a
+    "last processed" pointer, so it does not depend on ID order, works with
+    parallel phases, and failed IDs can be retried on their own. Status updates
+    are buffered and written with batched bulk upserts.
+    """
+
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    MISSING = "missing"  # Not found upstream; not retried
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection.create_index([("phase", 1), ("status", 1), ("entity_id", 1)])
+        self._buffer: List[UpdateOne] = []
+        self._lock = threading.Lock()
+
+    def resume(self, phase: str, entity_ids: List[str], retry_failed: bool = True) -> List[str]:
+        """Register unseen IDs as pending and return the ones still to do (input order kept).
+
+        Registration is a $setOnInsert upsert, so existing records are left alone and a concurrent
+        resume registering the same IDs is harmless. Only pending/failed records are read back
+        (covered by the ledger index), so resuming costs O(remaining work), not O(all IDs).
+        """
+        unique_ids = list(dict.fromkeys(entity_ids))
+        now = datetime.now().isoformat()
+        for i in range(0, len(unique_ids), LEDGER_FLUSH_SIZE * 10):
+            try:
+                self.collection.bulk_write([
+                    UpdateOne({"_id": f"{phase}:{eid}"}, {"$setOnInsert": {
+                        "phase": phase, "entity_id": eid, "status": self.PENDING, "attempts": 0, "updated_at": now
+                    }}, upsert=True)
+                    for eid in unique_ids[i:i + LEDGER_FLUSH_SIZE * 10]
+                ], ordered=False)
+            except BulkWriteError as e:
+                # Two upserts racing on the same _id: the other one already registered it
+                if not only_duplicate_keys(e):
+                    raise
+
+        statuses = [self.PENDING, self.FAILED] if retry_failed else [self.PENDING]
+        query = {"phase": phase, "status": {"$in": statuses}}
+        if len(unique_ids) <= SCOPED_QUERY_LIMIT:
+            query["entity_id"] = {"$in": unique_ids}
+        todo = {doc["entity_id"] for doc in self.collection.find(
+            query, {"entity_id": 1, "_id": 0}).hint([("phase", 1), ("status", 1), ("entity_id", 1)])}
+        remaining = [eid for eid in unique_ids if eid in todo]
+        if len(remaining) < len(entity_ids):
+            logger.info(f"[RESUME] {phase}: {len(remaining)} of {len(entity_ids)} IDs left to process")
+        return remaining
+
+    def mark(self, phase: str, entity_ids, status: str, error: Optional[str] = None):
+        """Buffer a status change for the given IDs; flushed every LEDGER_FLUSH_SIZE updates."""
+        now = datetime.now().isoformat()
+        with self._lock:
+            for eid in entity_ids:
+                self._buffer.append(UpdateOne({"_id": f"{phase}:{eid}"}, {
+                    "$set": {"status": status, "updated_at": now, "error": error},
+                    "$inc": {"attempts": 1},
+                    "$setOnInsert": {"phase": phase, "entity_id": eid}
+                }, upsert=True))
+            if len(self._buffer) < LEDGER_FLUSH_SIZE:
+                return
+            ops, self._buffer = self._buffer, []
+        self.collection.bulk_write(ops, ordered=False)
+
+    def flush(self):
+        with self._lock:
+            ops, self._buffer = self._buffer, []
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+
+    def summary(self, phase: str) -> Dict[str, int]:
+        return {doc["_id"]: doc["count"] for doc in self.collection.aggregate([
+            {"$match": {"phase": phase}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ])}
+
+
+class WorkQueue:
+    """Lease-based queue of manga ID chunks shared by worker processes/machines.
+
+    A worker claims one chunk at a time with an atomic find_one_and_update that sets
+    an owner and a lease expiry. Chunks whose lease expired (worker crashed or was
+    killed) match the same claim query, so they are picked up again automatically.
+    """
+
+    def __init__(self, collection, lease_seconds: int = LEASE_SECONDS):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.collection.create_index([("phase", 1), ("status", 1), ("lease_expires", 1)])
+
+    def seed(self, phase: str, manga_ids: List[str], chunk_size: int = WORK_CHUNK_SIZE) -> int:
+        """Split IDs into chunks for a phase, unless the phase still has open chunks. Returns chunks added."""
+        if self.collection.count_documents({"phase": phase, "status": {"$ne": "done"}}, limit=1):
+            logger.info(f"[QUEUE] {phase} already has open chunks, not reseeding")
+            return 0
+        self.collection.delete_many({"phase": phase})
+        chunks = [
+            {"_id": f"{phase}:{n}", "phase": phase, "ids": manga_ids[i:i + chunk_size], "status": "pending",
+             "owner": None, "lease_expires": None, "attempts": 0}
+            for n, i in enumerate(range(0, len(manga_ids), chunk_size))
+        ]
+        if chunks:
+            self.collection.insert_many(chunks)
+        logger.info(f"[QUEUE] Seeded {len(chunks)} {phase} chunks of up to {chunk_size} manga")
+        return len(chunks)
+
+    def claim(self, phase: str, owner: str) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        return self.collection.find_one_and_update(
+            {"phase": phase, "$or": [
+                {"status": "pending"},
+                {"status": "leased", "lease_expires": {"$lt": now}}
+            ]},
+            {"$set": {"status": "leased", "owner": owner, "lease_expires": now + timedelta(seconds=self.lease_seconds)},
+             "$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def renew(self, chunk: Dict[str, Any], owner: str) -> bool:
+        """Push the lease expiry forward while the owner is still working. False if the lease was lost."""
+        result = self.collection.update_one(
+            {"_id": chunk["_id"], "owner": owner, "status": "leased"},
+            {"$set": {"lease_expires": datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)}}
+        )
+        return result.matched_count == 1
+
+    def complete(self, chunk: Dict[str, Any], owner: str) -> bool:
+        """Mark a chunk done. False if the lease expired and another worker took it over."""
+        result = self.collection.update_one(
+            {"_id": chunk["_id"], "owner": owner, "status": "leased"},
+            {"$set": {"status": "done", "finished_at": datetime.now(timezone.utc)}}
+        )
+        return result.modified_count == 1
+
+    def release(self, chunk: Dict[str, Any], owner: str):
+        """Give a chunk back right away instead of waiting for its lease to expire."""
+        self.collection.update_one({"_id": chunk["_id"], "owner": owner, "status": "leased"},
+                                   {"$set": {"status": "pending", "owner": None, "lease_expires": None}})
+
+    def open_chunks(self, phase: str) -> int:
+        return self.collection.count_documents({"phase": phase, "status": {"$ne": "done"}})
+
+
 class MangaDataFetcher:
-    def __init__(self):
-        self.delay = 0.0
-        self.success_streak = 0
+    def __init__(self, rate: float = MANGADEX_GLOBAL_RATE, track_phases: bool = True,
+                 skip_unchanged_stats: bool = False):
+        self.skip_unchanged_stats = skip_unchanged_stats
+        self.rate = rate
         self.batch_size = INITIAL_BATCH_SIZE
+        self.ledger = CheckpointLedger(db[LEDGER_COLLECTION])
+        # Workers only see one chunk at a time, so they must not flip phase-level completed flags
+        self.track_phases = track_phases
         self.progress = self.load_progress()
+        # One controller shared by every phase/thread; it converges on the sustainable rate/concurrency
+        self.controller = AIMDController(rate, max_window=MAX_CONCURRENCY, latency_target=LATENCY_TARGET)
+        self._last_controller_log = 0.0
+        self.streams = None
+        self._progress_lock = threading.Lock()
+        # Set by run_worker to renew the chunk lease; phases call it after each manga/batch
+        self.heartbeat: Optional[Callable[[], Any]] = None
         self.ensure_collections()
         
     def ensure_collections(self):
         """Ensure all required collections exist."""
+        existing = db.list_collection_names()
         for collection_name in COLLECTIONS.values():
-            if collection_name not in db.list_collection_names():
-                db.create_collection(collection_name)
-                logger.info(f"[OK] Created collection: {collection_name}")
+            if collection_name in existing:
+                continue
+            if collection_name == COLLECTIONS['statistics']:
+                create_statistics_collection()
+                continue
+            db.create_collection(collection_name)
+            logger.info(f"[OK] Created collection: {collection_name}")
+        if COLLECTIONS['statistics'] in existing and not is_timeseries(COLLECTIONS['statistics']):
+            logger.warning(f"[WARN] {COLLECTIONS['statistics']} is a regular collection; run with --migrate-statistics")
                 
     def load_progress(self) -> Dict[str, Any]:
-        """Load progress from file if exists."""
-        if os.path.exists(PROGRESS_FILE):
+        """Load phase-level flags from Mongo (importing the legacy progress file once)."""
+        default_progress = {
+            'tags': {'completed': False},
+            'statistics': {'completed': False, 'batch_size': INITIAL_BATCH_SIZE},
+            'chapters': {'completed': False},
+            'cover_arts': {'completed': False},
+            'creators': {'completed': False},
+            'groups': {'completed': False},
+            'related': {'completed': False}
+        }
+        progress_data = {}
+        state = db[STATE_COLLECTION].find_one({"_id": "phases"}) if self.track_phases else None
+        if state:
+            progress_data = state.get("phases", {})
+        elif self.track_phases and os.path.exists(PROGRESS_FILE):
             try:
                 with open(PROGRESS_FILE, 'r', encoding='utf-8') as f:
                     progress_data = json.load(f)
-                    # Ensure all required keys exist
-                    default_progress = {
-                        'tags': {'completed': False, 'last_processed': None},
-                        'statistics': {'completed': False, 'last_processed': None, 'batch_size': INITIAL_BATCH_SIZE},
-                        'chapters': {'completed': False, 'last_processed': None},
-                        'cover_arts': {'completed': False, 'last_processed': None},
-                        'creators': {'completed': False, 'last_processed': None},
-                        'groups': {'completed': False, 'last_processed': None},
-                        'related': {'completed': False, 'last_processed': None}
-                    }
-                    
-                    # Merge existing progress with default structure
-                    for key in default_progress:
-                        if key not in progress_data:
-                            progress_data[key] = default_progress[key]
-                        else:
-                            # Ensure all sub-keys exist
-                            for sub_key in default_progress[key]:
-                                if sub_key not in progress_data[key]:
-                                    progress_data[key][sub_key] = default_progress[key][sub_key]
-                    
-                    return progress_data
+                logger.info(f"[MIGRATE] Imported phase flags from {PROGRESS_FILE}; per-ID progress now lives in {LEDGER_COLLECTION}")
             except Exception as e:
                 logger.warning(f"Could not load progress file: {e}. Starting fresh.")
-                
-        return {
-            'tags': {'completed': False, 'last_processed': None},
-            'statistics': {'completed': False, 'last_processed': None, 'batch_size': INITIAL_BATCH_SIZE},
-            'chapters': {'completed': False, 'last_processed': None},
-            'cover_arts': {'completed': False, 'last_processed': None},
-            'creators': {'completed': False, 'last_processed': None},
-            'groups': {'completed': False, 'last_processed': None},
-            'related': {'completed': False, 'last_processed': None}
-        }
+
+        # Merge existing progress with default structure
+        for key, defaults in default_progress.items():
+            phase_state = progress_data.setdefault(key, {})
+            phase_state.pop('last_processed', None)
+            for sub_key, value in defaults.items():
+                phase_state.setdefault(sub_key, value)
+        return progress_data
     
     def save_progress(self):
-        """Save current progress to file."""
-        with open(PROGRESS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(self.progress, f, indent=2, ensure_ascii=False)
+        """Persist phase-level flags and flush buffered ledger updates."""
+        self.ledger.flush()
+        if not self.track_phases:
+            return
+        with self._progress_lock:
+            db[STATE_COLLECTION].replace_one({"_id": "phases"}, {"_id": "phases", "phases": self.progress}, upsert=True)
     
     def request_api(self, endpoint: str, params: Optional[Dict] = None) -> Optional[Dict]:
-        """Make API request with intelligent retry and adaptive delay."""
+        """Make API request through the shared AIMD controller, retrying 429/5xx/network errors."""
         retries = 0
         while retries < MAX_RETRIES:
+            started_at = self.controller.acquire()
             try:
                 response = requests.get(f"{BASE_URL}{endpoint}", params=params, timeout=30)
-                
-                if response.status_code == 200:
-                    self.success_streak += 1
-                    if self.delay > 0:
-                        self.delay = max(MIN_DELAY, self.delay * 0.9)
-                        if self.success_streak >= BURST_SUCCESS_THRESHOLD:
-                            self.delay = 0.0
-                            logger.info("[SPEED] Back to SPAM mode")
-                    return response.json()
-                    
-                elif response.status_code == 400:
-                    logger.warning(f"[WARN] API returned 400 for endpoint {endpoint}")
-                    if "statistics" in endpoint:
-                        # Reduce batch size for statistics API
-                        self.batch_size = max(MIN_BATCH_SIZE, self.batch_size // 2)
-                        logger.info(f"[REDUCE] Reduced batch size to {self.batch_size}")
-                    return None
-                    
-                elif response.status_code == 429:  # Rate limit
-                    self.success_streak = 0
-                    self.delay = min(MAX_DELAY, self.delay * 2 if self.delay > 0 else MIN_DELAY)
-                    logger.warning(f"[RATE_LIMIT] Rate limited. Increasing delay to {self.delay:.2f}s")
-                    time.sleep(self.delay)
-                    retries += 1
-                    continue
-                    
-                else:
-                    raise Exception(f"HTTP {response.status_code}")
-                    
-            except Exception as e:
-                self.success_streak = 0
-                if self.delay == 0.0:
-                    self.delay = MIN_DELAY
-                self.delay = min(MAX_DELAY, self.delay * 2)
+            except requests.exceptions.RequestException as e:
+                self.controller.release(started_at, ok=False)
+                retries += 1
+                logger.warning(f"[ERROR] {e}. Retry {retries}/{MAX_RETRIES} {self.controller.snapshot()}")
+                time.sleep(RETRY_BACKOFF * 2 ** retries)
+                continue
+
+            if response.status_code == 429:  # Rate limit
+                retry_after = _retry_after(response.headers)
+                self.controller.release(started_at, ok=False, retry_after=retry_after)
+                retries += 1
+                logger.warning(f"[RATE_LIMIT] Rate limited, pausing all requests {retry_after:.1f}s {self.controller.snapshot()}")
+                continue
+            if response.status_code >= 500:
+                self.controller.release(started_at, ok=False)
                 retries += 1
-                logger.warning(f"[ERROR] {e}. Retry {retries}/{MAX_RETRIES}, delay={self.delay:.2f}s")
-                time.sleep(self.delay)
+                logger.warning(f"[ERROR] HTTP {response.status_code}. Retry {retries}/{MAX_RETRIES} {self.controller.snapshot()}")
+                time.sleep(RETRY_BACKOFF * 2 ** retries)
+                continue
+
+            # Any other answer means the API kept up; let the controller grow
+            self.controller.release(started_at, ok=True)
+            self._log_controller()
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code == 400:
+                logger.warning(f"[WARN] API returned 400 for endpoint {endpoint}")
+                if "statistics" in endpoint:
+                    # Reduce batch size for statistics API
+                    self.batch_size = max(MIN_BATCH_SIZE, self.batch_size // 2)
+                    logger.info(f"[REDUCE] Reduced batch size to {self.batch_size}")
+                return None
+            raise Exception(f"HTTP {response.status_code}")
         
         raise Exception(f"[FAILED] Failed after {MAX_RETRIES} retries")
     
+    def _log_controller(self):
+        now = time.monotonic()
+        if now - self._last_controller_log >= CONTROLLER_LOG_INTERVAL:
+            self._last_controller_log = now
+            logger.info(f"[SPEED] {self.controller.snapshot()}")
+
     def get_manga_ids(self) -> List[str]:
         """Get all manga IDs from the main collection."""
         try:
@@ -266,32 +627,27 @@ class MangaDataFetcher:
             
         logger.info(f"[START] Fetching statistics for {len(manga_ids)} manga in batches of {self.batch_size}")
         
-        # Find starting point
-        start_idx = 0
-        if self.progress['statistics']['last_processed']:
-            try:
-                start_idx = manga_ids.index(self.progress['statistics']['last_processed'])
-                start_idx += 1  # Start from next item
-                logger.info(f"[RESUME] Resuming statistics from index {start_idx}")
-            except ValueError:
-                start_idx = 0
+        # Each statistics run is one snapshot round; only this round's snapshots count as done
+        if not self.progress['statistics'].get('run_started'):
+            self.progress['statistics']['run_started'] = datetime.now(timezone.utc).isoformat()
+            self.save_progress()
+        run_started = datetime.fromisoformat(self.progress['statistics']['run_started'])
+        done = DoneSet(db[COLLECTIONS['statistics']], "mangaId", within=manga_ids,
+                       query={"snapshotTime": {"$gte": run_started}})
+        remaining = self.ledger.resume('statistics', manga_ids)
         
-        for i in range(start_idx, len(manga_ids), self.batch_size):
-            batch_ids = manga_ids[i:i+self.batch_size]
+        for i in range(0, len(remaining), self.batch_size):
+            self._heartbeat()
+            batch_ids = remaining[i:i+self.batch_size]
             batch_num = i//self.batch_size + 1
-            total_batches = (len(manga_ids) + self.batch_size - 1)//self.batch_size
+            total_batches = (len(remaining) + self.batch_size - 1)//self.batch_size
             
             logger.info(f"\n--- Processing batch {batch_num}/{total_batches} ---")
             logger.info(f"   Manga IDs: {batch_ids[:5]}{'...' if len(batch_ids) > 5 else ''}")
             
-            # Check existing statistics
-            existing_stats = db[COLLECTIONS['statistics']].find(
-                {"mangaId": {"$in": batch_ids}}, 
-                {"mangaId": 1}
-            )
-            existing_manga_ids = set(doc["mangaId"] for doc in existing_stats)
-            ids_to_fetch = [mid for mid in batch_ids if mid not in existing_manga_ids]
+            ids_to_fetch = done.missing(batch_ids)
             
+            self.ledger.mark('statistics', [mid for mid in batch_ids if mid in done], CheckpointLedger.DONE)
             if not ids_to_fetch:
                 logger.info(f"   [SKIP] All statistics already exist for this batch, skipping")
                 continue
@@ -305,52 +661,72 @@ class MangaDataFetcher:
                 data = self.request_api("/statistics/manga", params=params)
                 if not data:
                     logger.warning(f"   [WARN] Batch failed: API returned no data, skipping")
+                    self.ledger.mark('statistics', ids_to_fetch, CheckpointLedger.FAILED, "no data")
                     continue
                     
                 stats_data = data.get("statistics", {})
                 if not stats_data:
                     logger.warning(f"   [WARN] No statistics data in response")
+                    self.ledger.mark('statistics', ids_to_fetch, CheckpointLedger.MISSING)
                     continue
                     
-                # Insert statistics
-                inserted_count = 0
-                for mid, stat in stats_data.items():
-                    try:
-                        stats_doc = {
-                            "_id": f"{mid}_{int(time.time())}",
-                            "mangaId": mid,
-                            "source": "mangadex",
-                            "statistics": stat,
-                            "snapshotTime": time.time(),
-                            "fetched_at": datetime.now().isoformat()
-                        }
-                        db[COLLECTIONS['statistics']].insert_one(stats_doc)
-                        inserted_count += 1
-                    except Exception as e:
-                        logger.error(f"     [ERROR] Failed to insert stats for {mid}: {e}")
+                inserted_count, unchanged = self._save_statistics(stats_data)
+                done.update(stats_data.keys())
+                self.ledger.mark('statistics', list(stats_data.keys()), CheckpointLedger.DONE)
+                self.ledger.mark('statistics', [mid for mid in ids_to_fetch if mid not in stats_data], CheckpointLedger.MISSING)
                         
-                logger.info(f"   [SUCCESS] Saved statistics for {inserted_count}/{len(stats_data)} manga")
+                logger.info(f"   [SUCCESS] Saved statistics for {inserted_count}/{len(stats_data)} manga"
+                            + (f" ({unchanged} unchanged, skipped)" if unchanged else ""))
                 
                 # Update progress
-                self.progress['statistics']['last_processed'] = batch_ids[-1]
                 self.progress['statistics']['batch_size'] = self.batch_size
                 self.save_progress()
                 
             except Exception as e:
                 logger.error(f"   [ERROR] Batch failed: {e}")
+                self.ledger.mark('statistics', ids_to_fetch, CheckpointLedger.FAILED, str(e))
                 # Continue with next batch instead of stopping
             
-            # Adaptive delay
-            if self.delay > 0:
-                logger.info(f"   [WAIT] Waiting {self.delay:.2f}s...")
-                time.sleep(self.delay)
-            else:
-                time.sleep(0.1)  # Minimum delay
         
-        self.progress['statistics']['completed'] = True
         self.save_progress()
+        summary = self.ledger.summary('statistics')
+        if summary.get(CheckpointLedger.FAILED):
+            logger.warning(f"[WARN] {summary[CheckpointLedger.FAILED]} manga failed; rerun to retry only those")
+        else:
+            self.progress['statistics']['completed'] = True
+            self.save_progress()
         logger.info("[SUCCESS] Statistics fetching completed")
     
+    def _last_statistics(self, manga_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Latest stored snapshot per manga (tracked fields only)."""
+        pipeline = [
+            {"$match": {"mangaId": {"$in": manga_ids}}},
+            {"$sort": {"mangaId": 1, "snapshotTime": -1}},
+            {"$group": {"_id": "$mangaId", **{f: {"$first": f"$statistics.{f}"} for f in STATS_TRACKED_FIELDS}}}
+        ]
+        return {doc["_id"]: doc for doc in db[COLLECTIONS['statistics']].aggregate(pipeline)}
+
+    def _save_statistics(self, stats_data: Dict[str, Dict[str, Any]]):
+        """Insert one snapshot per manga with a single insert_many; returns (inserted, unchanged)."""
+        snapshot_time = datetime.now(timezone.utc)
+        docs = [
+            {"mangaId": mid, "snapshotTime": snapshot_time, "source": "mangadex", "statistics": slim_statistics(stat)}
+            for mid, stat in stats_data.items()
+        ]
+        unchanged = 0
+        if self.skip_unchanged_stats:
+            last = self._last_statistics(list(stats_data.keys()))
+            fresh = [
+                doc for doc in docs
+                if doc["mangaId"] not in last
+                or any(doc["statistics"][f] != last[doc["mangaId"]].get(f) for f in STATS_TRACKED_FIELDS)
+            ]
+            unchanged = len(docs) - len(fresh)
+            docs = fresh
+        if docs:
+            db[COLLECTIONS['statistics']].insert_many(docs, ordered=False)
+        return len(docs), unchanged
+
     def fetch_chapters(self, manga_ids: List[str]):
         """Fetch all chapter metadata."""
         if self.progress['chapters']['completed']:
@@ -363,23 +739,18 @@ class MangaDataFetcher:
                 self.progress['chapters']['completed'] = False
             
         logger.info(f"[START] Fetching chapters for {len(manga_ids)} manga...")
+        done = DoneSet(db[COLLECTIONS['chapters']], "mangaId", within=manga_ids)
+        remaining = self.ledger.resume('chapters', manga_ids)
         
-        # Find starting point
-        start_idx = 0
-        if self.progress['chapters']['last_processed']:
-            try:
-                start_idx = manga_ids.index(self.progress['chapters']['last_processed'])
-                start_idx += 1
-                logger.info(f"[RESET] Resuming chapters from index {start_idx}")
-            except ValueError:
-                start_idx = 0
-        
-        for i, mid in enumerate(manga_ids[start_idx:], start_idx + 1):
-            if db[COLLECTIONS['chapters']].count_documents({"mangaId": mid}) > 0:
+        for i, mid in enumerate(remaining, 1):
+            self._heartbeat()
+            if mid in done:
+                self.ledger.mark('chapters', [mid], CheckpointLedger.DONE)
                 continue
                 
             all_chapters = []
             offset = 0
+            failed = False
             
             while True:
                 params = {
@@ -389,9 +760,14 @@ class MangaDataFetcher:
                     "order[chapter]": "asc"
                 }
                 
-                data = self.request_api("/chapter", params)
+                try:
+                    data = self.request_api("/chapter", params)
+                except Exception as e:
+                    data = None
+                    logger.error(f"[ERROR] Failed to fetch chapters for manga {mid}: {e}")
                 if not data:
                     logger.warning(f"[WARN] Could not fetch chapters for manga {mid}")
+                    failed = True
                     break
                     
                 chapters = data.get("data", [])
@@ -399,33 +775,122 @@ class MangaDataFetcher:
                     break
                     
                 for c in chapters:
+                    self._publish_relationships(c.get("relationships", []))
                     c["_id"] = c["id"]
                     c["mangaId"] = mid
                     c["fetched_at"] = datetime.now().isoformat()
                     all_chapters.append(c)
                     
                 offset += 100
-                if self.delay > 0:
-                    time.sleep(self.delay)
                     
+            if failed:
+                # Partial pages are dropped; the whole manga is retried on the next run
+                self.ledger.mark('chapters', [mid], CheckpointLedger.FAILED, "chapter feed request failed")
+                continue
+
             if all_chapters:
-                db[COLLECTIONS['chapters']].insert_many(all_chapters)
+                # A worker that took over an expired lease may already have stored some of these
+                insert_ignore_duplicates(db[COLLECTIONS['chapters']], all_chapters)
+                done.add(mid)
+            self.ledger.mark('chapters', [mid], CheckpointLedger.DONE)
                 
-            logger.info(f"[{i}/{len(manga_ids)}] [SUCCESS] {len(all_chapters)} chapters saved for {mid}")
-            
-            # Update progress
-            self.progress['chapters']['last_processed'] = mid
-            self.save_progress()
-            
-            if self.delay > 0:
-                time.sleep(self.delay)
+            logger.info(f"[{i}/{len(remaining)}] [SUCCESS] {len(all_chapters)} chapters saved for {mid}")
                 
-        self.progress['chapters']['completed'] = True
         self.save_progress()
+        summary = self.ledger.summary('chapters')
+        if summary.get(CheckpointLedger.FAILED):
+            logger.warning(f"[WARN] {summary[CheckpointLedger.FAILED]} manga failed; rerun to retry only those")
+        else:
+            self.progress['chapters']['completed'] = True
+            self.save_progress()
         logger.info("[SUCCESS] Chapters fetching completed")
     
+    def sync_chapters_delta(self, manga_ids: List[str]):
+        """Upsert chapters changed since the stored watermark using the global feed.
+
+        Walks `/chapter?updatedAtSince=<watermark>&order[updatedAt]=asc` instead of every
+        manga's feed, keeps chapters of manga in the fact table, and bulk-upserts them by _id.
+        The watermark (last updatedAt plus the chapter IDs already seen at that second) is
+        saved after every page, so an interrupted sync resumes without gaps.
+        """
+        state = db[STATE_COLLECTION]
+        chapters_col = db[COLLECTIONS['chapters']]
+        cursor = state.find_one({"_id": "chapters_delta"})
+        if cursor:
+            since, skip_ids = cursor["watermark"], set(cursor.get("skip_ids", []))
+        else:
+            # First delta run: start from the newest chapter the full crawl stored
+            chapters_col.create_index("attributes.updatedAt")
+            latest = chapters_col.find_one({}, {"attributes.updatedAt": 1}, sort=[("attributes.updatedAt", -1)])
+            if not latest:
+                logger.error("[ERROR] No chapters stored yet; run the chapters phase first")
+                return
+            since, skip_ids = latest["attributes"]["updatedAt"][:19], set()
+
+        tracked = set(manga_ids)
+        logger.info(f"[START] Chapter delta sync from {since}...")
+        offset = 0
+        upserted_count = 0
+        ignored_count = 0
+        requests_made = 0
+
+        while True:
+            params = {
+                "updatedAtSince": since,
+                "order[updatedAt]": "asc",
+                "contentRating[]": ALL_CONTENT_RATINGS,
+                "limit": 100,
+                "offset": offset
+            }
+            data = self.request_api("/chapter", params)
+            requests_made += 1
+            if not data:
+                logger.warning(f"[WARN] Delta sync stopped at {since} (offset {offset}); rerun to resume")
+                return
+            chapters = data.get("data", [])
+
+            fetched_at = datetime.now().isoformat()
+            ops = []
+            for c in chapters:
+                if c["id"] in skip_ids:
+                    continue
+                manga_id = next((rel["id"] for rel in c.get("relationships", []) if rel["type"] == "manga"), None)
+                if manga_id not in tracked:
+                    ignored_count += 1
+                    continue
+                c["_id"] = c["id"]
+                c["mangaId"] = manga_id
+                c["fetched_at"] = fetched_at
+                ops.append(ReplaceOne({"_id": c["_id"]}, c, upsert=True))
+            if ops:
+                chapters_col.bulk_write(ops, ordered=False)
+                upserted_count += len(ops)
+
+            if chapters:
+                last_ts = chapters[-1]["attributes"]["updatedAt"][:19]
+                at_last = {c["id"] for c in chapters if c["attributes"]["updatedAt"][:19] == last_ts}
+                if last_ts == since:
+                    # The whole page shares one second: page forward within it
+                    skip_ids |= at_last
+                    offset += 100
+                    if offset + 100 > MAX_OFFSET_WINDOW:
+                        logger.error(f"[ERROR] More than {MAX_OFFSET_WINDOW} chapters updated at {since}; cannot page further")
+                        return
+                else:
+                    since, skip_ids, offset = last_ts, at_last, 0
+                state.replace_one({"_id": "chapters_delta"},
+                                  {"_id": "chapters_delta", "watermark": since, "skip_ids": sorted(skip_ids),
+                                   "updated_at": fetched_at}, upsert=True)
+
+            if len(chapters) < 100:
+                break
+
+        logger.info(f"[SUMMARY] Chapter delta: {upserted_count} upserted, {ignored_count} for untracked manga, "
+                    f"{requests_made} requests, watermark now {since}")
+        logger.info("[SUCCESS] Chapter delta sync completed")
+
     def fetch_related(self, manga_ids: List[str]):
-        """Fetch related manga information."""
+        """Fetch relationships via batched /manga?ids[], storing expanded covers/creators inline."""
         if self.progress['related']['completed']:
             # Double check if data actually exists
             if db[COLLECTIONS['related']].count_documents({}) > 0:
@@ -436,71 +901,101 @@ class MangaDataFetcher:
                 self.progress['related']['completed'] = False
         
         logger.info(f"[START] Fetching related manga for {len(manga_ids)} manga...")
-        
-        # Find starting point
-        start_idx = 0
-        if self.progress['related']['last_processed']:
-            try:
-                start_idx = manga_ids.index(self.progress['related']['last_processed'])
-                start_idx += 1  # Start from next item
-                logger.info(f"[RESUME] Resuming related manga from index {start_idx}")
-            except ValueError:
-                start_idx = 0
+        done = DoneSet(db[COLLECTIONS['related']], within=manga_ids)
         
         processed_count = 0
         skipped_count = 0
         error_count = 0
+        expanded_count = 0
         
-        for i, mid in enumerate(manga_ids[start_idx:], start_idx + 1):
-            if db[COLLECTIONS['related']].count_documents({"_id": mid}) > 0:
-                continue
-                
+        pending = self.ledger.resume('related', manga_ids)
+        remaining = done.missing(pending)
+        self.ledger.mark('related', [mid for mid in pending if mid in done], CheckpointLedger.DONE)
+        for i in range(0, len(remaining), ENTITY_BATCH_SIZE):
+            self._heartbeat()
+            batch_ids = remaining[i:i + ENTITY_BATCH_SIZE]
+            params = {
+                "ids[]": batch_ids,
+                "includes[]": RELATED_INCLUDES,
+                "contentRating[]": ALL_CONTENT_RATINGS,
+                "limit": len(batch_ids)
+            }
             try:
-                data = self.request_api(f"/manga/{mid}")
-                if not data:
-                    logger.warning(f"[WARN] Could not fetch manga {mid} - skipping")
-                    skipped_count += 1
-                    continue
-                    
-                relationships = data.get("data", {}).get("relationships", [])
-                db[COLLECTIONS['related']].insert_one({
-                    "_id": mid,
-                    "relationships": relationships,
-                    "fetched_at": datetime.now().isoformat()
-                })
-                
-                processed_count += 1
-                logger.info(f"[{i}/{len(manga_ids)}] [SUCCESS] Related saved for {mid}")
-                
-                # Update progress
-                self.progress['related']['last_processed'] = mid
-                self.save_progress()
-                
+                data = self.request_api("/manga", params=params)
             except Exception as e:
-                if "404" in str(e) or "HTTP 404" in str(e):
-                    logger.warning(f"[SKIP] Manga {mid} not found (404) - skipping")
+                logger.error(f"[ERROR] Failed to fetch manga batch starting at {batch_ids[0]}: {e}")
+                error_count += len(batch_ids)
+                self.ledger.mark('related', batch_ids, CheckpointLedger.FAILED, str(e))
+                continue
+            if not data:
+                logger.warning(f"[WARN] Could not fetch manga batch starting at {batch_ids[0]} - skipping")
+                skipped_count += len(batch_ids)
+                self.ledger.mark('related', batch_ids, CheckpointLedger.FAILED, "no data")
+                continue
+
+            fetched_at = datetime.now().isoformat()
+            related_docs = []
+            for manga in data.get("data", []):
+                relationships = manga.get("relationships", [])
+                self._publish_relationships(relationships)
+                expanded_count += self._store_expanded_entities(relationships, fetched_at)
+                related_docs.append({
+                    "_id": manga["id"],
+                    # Attributes of expanded entities live in their own collections
+                    "relationships": [{k: v for k, v in rel.items() if k != "attributes"} for rel in relationships],
+                    "fetched_at": fetched_at
+                })
+
+            # Only IDs the batch did not return get a not-found marker
+            returned = {doc["_id"] for doc in related_docs}
+            for mid in batch_ids:
+                if mid not in returned:
+                    logger.warning(f"[SKIP] Manga {mid} not found - skipping")
                     skipped_count += 1
-                    # Still save a record to avoid re-processing
-                    db[COLLECTIONS['related']].insert_one({
+                    related_docs.append({
                         "_id": mid,
                         "relationships": [],
-                        "fetched_at": datetime.now().isoformat(),
+                        "fetched_at": fetched_at,
                         "error": "404 - Manga not found"
                     })
-                else:
-                    logger.error(f"[ERROR] Failed to fetch manga {mid}: {e}")
-                    error_count += 1
-                    # Continue with next manga instead of stopping
-                    continue
-            
-            if self.delay > 0:
-                time.sleep(self.delay)
+
+            try:
+                db[COLLECTIONS['related']].insert_many(related_docs, ordered=False)
+            except BulkWriteError as e:
+                logger.warning(f"[WARN] {len(e.details.get('writeErrors', []))} related docs already existed")
+            done.update(doc["_id"] for doc in related_docs)
+            processed_count += len(returned)
+            self.ledger.mark('related', list(returned), CheckpointLedger.DONE)
+            self.ledger.mark('related', [mid for mid in batch_ids if mid not in returned], CheckpointLedger.MISSING)
+
+            logger.info(f"[{min(i + ENTITY_BATCH_SIZE, len(remaining))}/{len(remaining)}] [SUCCESS] Related saved for {len(returned)} manga")
                 
+        logger.info(f"[INFO] Stored {expanded_count} expanded cover/creator documents inline")
         logger.info(f"[SUMMARY] Related manga: {processed_count} processed, {skipped_count} skipped, {error_count} errors")
-        self.progress['related']['completed'] = True
+        if not error_count:
+            self.progress['related']['completed'] = True
         self.save_progress()
         logger.info("[SUCCESS] Related manga fetching completed")
     
+    def _store_expanded_entities(self, relationships: List[Dict[str, Any]], fetched_at: str) -> int:
+        """Upsert cover/creator entities that came back expanded via includes[]. Returns how many."""
+        ops = {}
+        for rel in relationships:
+            collection_key = STREAM_TYPES.get(rel.get("type"))
+            if not rel.get("attributes") or collection_key not in ("cover_arts", "creators"):
+                continue
+            entity = {
+                "id": rel["id"],
+                "type": "author" if rel["type"] == "artist" else rel["type"],
+                "attributes": rel["attributes"],
+                "relationships": []
+            }
+            doc = {"_id": rel["id"], "result": "ok", "response": "entity", "data": entity, "fetched_at": fetched_at}
+            ops.setdefault(collection_key, []).append(ReplaceOne({"_id": rel["id"]}, doc, upsert=True))
+        for collection_key, collection_ops in ops.items():
+            db[COLLECTIONS[collection_key]].bulk_write(collection_ops, ordered=False)
+        return sum(len(collection_ops) for collection_ops in ops.values())
+
     def fetch_covers_creators_groups(self, manga_ids: List[str]):
         """Fetch cover art, creators, and scanlation groups using existing relationships."""
         if (self.progress['cover_arts']['completed'] and 
@@ -524,175 +1019,322 @@ class MangaDataFetcher:
                     self.progress['groups']['completed'] = False
         
         logger.info(f"[START] Fetching covers, creators, and groups for {len(manga_ids)} manga...")
-    
-        # Collect all unique IDs from relationships
-        all_cover_ids = set()
-        all_creator_ids = set()
-        all_group_ids = set()
-        
-        # First pass: collect IDs from relationships in the related collection
-        logger.info("[COLLECT] Collecting IDs from 'related' collection...")
-        related_docs = db[COLLECTIONS['related']].find({})
-        for doc in related_docs:
-            for rel in doc.get("relationships", []):
-                rid = rel.get("id")
-                if not rid:
-                    continue
-                if rel["type"] == "cover_art":
-                    all_cover_ids.add(rid)
-                elif rel["type"] in ["author", "artist"]:
-                    all_creator_ids.add(rid)
-                elif rel["type"] == "scanlation_group":
-                    all_group_ids.add(rid)
-    
-        # Second pass: collect scanlation_group IDs from chapter relationships
-        logger.info("[COLLECT] Collecting scanlation groups from 'chapters' collection...")
-        chapter_docs = db[COLLECTIONS['chapters']].find({}, {"relationships": 1})
-        for doc in chapter_docs:
-            for rel in doc.get("relationships", []):
-                if rel.get("type") == "scanlation_group":
-                    rid = rel.get("id")
-                    if rid:
-                        all_group_ids.add(rid)
-    
-        logger.info(f"[INFO] Found {len(all_cover_ids)} cover IDs, {len(all_creator_ids)} creator IDs, {len(all_group_ids)} group IDs")
-    
-        # Fetch cover arts
-        if not self.progress['cover_arts']['completed'] and all_cover_ids:
-            self._fetch_covers(list(all_cover_ids))
-            
-        # Fetch creators
-        if not self.progress['creators']['completed'] and all_creator_ids:
-            self._fetch_creators(list(all_creator_ids))
-            
-        # Fetch groups
-        if not self.progress['groups']['completed'] and all_group_ids:
-            self._fetch_groups(list(all_group_ids))
-    
 
-    def _fetch_covers(self, cover_ids: List[str]):
-        """Fetch cover art data."""
-        logger.info(f"[START] Fetching {len(cover_ids)} cover arts...")
-        
+        # IDs are discovered server-side and anti-joined against what is already stored,
+        # so only missing IDs come back, streamed straight into the batched fetchers
+        if not self.progress['cover_arts']['completed']:
+            self._fetch_covers(self._missing_relationship_ids(['related'], ["cover_art"], 'cover_arts'))
+
+        if not self.progress['creators']['completed']:
+            self._fetch_creators(self._missing_relationship_ids(['related'], ["author", "artist"], 'creators'))
+
+        if not self.progress['groups']['completed']:
+            self._fetch_groups(self._missing_relationship_ids(['related', 'chapters'], ["scanlation_group"], 'groups'))
+
+    def _missing_relationship_ids(self, source_keys: List[str], types: List[str], target_key: str) -> Iterator[str]:
+        """Distinct relationship IDs of `types` in the source collections that are not in the target yet.
+
+        Runs as one aggregation ($unwind relationships, $match type, $group by id, $lookup
+        anti-join on the target _id) with allowDiskUse, and yields IDs as cursor batches arrive.
+        """
+        extract = [
+            {"$project": {"_id": 0, "relationships.id": 1, "relationships.type": 1}},
+            {"$unwind": "$relationships"},
+            {"$match": {"relationships.type": {"$in": types}, "relationships.id": {"$type": "string"}}},
+            {"$project": {"id": "$relationships.id"}}
+        ]
+        pipeline = list(extract)
+        for key in source_keys[1:]:
+            pipeline.append({"$unionWith": {"coll": COLLECTIONS[key], "pipeline": extract}})
+        pipeline += [
+            {"$group": {"_id": "$id"}},
+            {"$lookup": {"from": COLLECTIONS[target_key], "localField": "_id", "foreignField": "_id", "as": "stored"}},
+            {"$match": {"stored.0": {"$exists": False}}},
+            {"$project": {"_id": 1}}
+        ]
+        logger.info(f"[COLLECT] Aggregating missing {'/'.join(types)} IDs from {', '.join(COLLECTIONS[k] for k in source_keys)}...")
+        cursor = db[COLLECTIONS[source_keys[0]]].aggregate(pipeline, allowDiskUse=True, batchSize=ENTITY_BATCH_SIZE * 10)
+        for doc in cursor:
+            yield doc["_id"]
+
+    def _fetch_entities_batched(self, kind: str, endpoint: str, collection_key: str, ids: Iterable[str]):
+        """Fetch entities through the `ids[]` list endpoint, up to ENTITY_BATCH_SIZE per request.
+
+        `ids` may be a lazy stream of IDs that are not stored yet (see _missing_relationship_ids);
+        only IDs stored during this run are skipped. Each page is written with a single
+        insert_many(ordered=False), and only IDs missing from a batch response fall back to
+        `/{endpoint}/{id}`. Stored documents keep the single-entity response shape.
+        """
+        logger.info(f"[START] Fetching {kind} in batches of {ENTITY_BATCH_SIZE}...")
+        collection = db[COLLECTIONS[collection_key]]
+        done = DoneSet.empty()
+
         processed_count = 0
         skipped_count = 0
         error_count = 0
-        
-        for i, rid in enumerate(cover_ids, 1):
-            if db[COLLECTIONS['cover_arts']].count_documents({"_id": rid}) > 0:
-                skipped_count += 1
+        fallback_count = 0
+        seen_count = 0
+
+        ids = iter(ids)
+        while True:
+            batch_ids = list(itertools.islice(ids, ENTITY_BATCH_SIZE))
+            if not batch_ids:
+                break
+            seen_count += len(batch_ids)
+            ids_to_fetch = done.missing(batch_ids)
+            skipped_count += len(batch_ids) - len(ids_to_fetch)
+            if not ids_to_fetch:
                 continue
-                
+
+            processed, fallbacks, errors = self._fetch_entity_batch(kind, endpoint, collection, ids_to_fetch, done)
+            processed_count += processed
+            fallback_count += fallbacks
+            error_count += errors
+            logger.info(f"[PROGRESS] {seen_count} {kind} processed")
+
+        logger.info(f"[SUMMARY] {kind.capitalize()}: {processed_count} processed, {skipped_count} skipped, "
+                    f"{fallback_count} single fetches, {error_count} errors")
+
+    def _fetch_entity_batch(self, kind: str, endpoint: str, collection, ids_to_fetch: List[str], done: DoneSet):
+        """Fetch and store one batch of at most ENTITY_BATCH_SIZE IDs. Returns (processed, fallbacks, errors)."""
+        processed_count = 0
+        fallback_count = 0
+        error_count = 0
+        fetched_at = datetime.now().isoformat()
+        docs = []
+        try:
+            data = self.request_api(f"/{endpoint}", params={"ids[]": ids_to_fetch, "limit": len(ids_to_fetch)})
+            for entity in (data or {}).get("data", []):
+                docs.append({
+                    "_id": entity["id"],
+                    "result": "ok",
+                    "response": "entity",
+                    "data": entity,
+                    "fetched_at": fetched_at
+                })
+        except Exception as e:
+            logger.warning(f"[WARN] Batch request for {len(ids_to_fetch)} {kind} failed: {e}")
+
+        # Anything the list endpoint did not return is fetched one by one
+        returned = {doc["_id"] for doc in docs}
+        for rid in ids_to_fetch:
+            if rid in returned:
+                continue
+            fallback_count += 1
             try:
-                cover = self.request_api(f"/cover/{rid}")
-                if cover:
-                    cover["_id"] = rid
-                    cover["fetched_at"] = datetime.now().isoformat()
-                    db[COLLECTIONS['cover_arts']].insert_one(cover)
-                    processed_count += 1
+                entity = self.request_api(f"/{endpoint}/{rid}")
+                if entity:
+                    entity["_id"] = rid
+                    entity["fetched_at"] = fetched_at
+                    docs.append(entity)
                 else:
                     error_count += 1
-                    
             except Exception as e:
-                logger.warning(f"[WARN] Failed to fetch cover {rid}: {e}")
+                logger.warning(f"[WARN] Failed to fetch {endpoint} {rid}: {e}")
                 error_count += 1
-                # Continue with next cover instead of stopping
-                continue
-                
-            if i % 100 == 0:
-                logger.info(f"[PROGRESS] {i}/{len(cover_ids)} covers processed")
-                
-            if self.delay > 0:
-                time.sleep(self.delay)
-                
-        logger.info(f"[SUMMARY] Covers: {processed_count} processed, {skipped_count} skipped, {error_count} errors")
+
+        if docs:
+            try:
+                processed_count += len(collection.insert_many(docs, ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                # Duplicates from a concurrent run are fine; count what actually landed
+                processed_count += e.details.get("nInserted", 0)
+            done.update(doc["_id"] for doc in docs)
+        return processed_count, fallback_count, error_count
+
+    def _heartbeat(self):
+        if self.heartbeat is not None:
+            self.heartbeat()
+
+    def _publish_relationships(self, relationships: List[Dict[str, Any]]):
+        """Hand related IDs to the streaming entity phases (no-op outside run_concurrent)."""
+        if self.streams is None:
+            return
+        for rel in relationships:
+            if rel.get("attributes"):
+                continue  # Already stored inline by fetch_related
+            stream = self.streams.get(STREAM_TYPES.get(rel.get("type")))
+            if stream is not None and rel.get("id"):
+                stream.put(rel["id"])
+
+    def _stream_entities(self, kind: str, endpoint: str, collection_key: str):
+        """Consume IDs published by upstream phases and fetch them in batches as they arrive."""
+        collection = db[COLLECTIONS[collection_key]]
+        done = DoneSet(collection)
+        stream = self.streams[collection_key]
+        seen = set()
+        pending: List[str] = []
+        processed_count = 0
+        finished = False
+
+        while not finished or pending:
+            if not finished:
+                try:
+                    rid = stream.get(timeout=STREAM_FLUSH_SECONDS)
+                    if rid is None:
+                        finished = True
+                    elif rid not in seen and rid not in done:
+                        seen.add(rid)
+                        pending.append(rid)
+                    if not finished and len(pending) < ENTITY_BATCH_SIZE:
+                        continue
+                except queue.Empty:
+                    if not pending:
+                        continue
+            # Full batch, upstream went quiet for a moment, or upstream finished
+            batch, pending = pending[:ENTITY_BATCH_SIZE], pending[ENTITY_BATCH_SIZE:]
+            processed, _, _ = self._fetch_entity_batch(kind, endpoint, collection, batch, done)
+            processed_count += processed
+
+        logger.info(f"[STREAM] {kind.capitalize()}: {processed_count} fetched while upstream phases were running")
+
+    def _fetch_covers(self, cover_ids: Iterable[str]):
+        """Fetch cover art data."""
+        self._fetch_entities_batched("covers", "cover", "cover_arts", cover_ids)
         self.progress['cover_arts']['completed'] = True
         self.save_progress()
         logger.info("[SUCCESS] Cover arts fetching completed")
-    
-    def _fetch_creators(self, creator_ids: List[str]):
+
+    def _fetch_creators(self, creator_ids: Iterable[str]):
         """Fetch creator data."""
-        logger.info(f"[START] Fetching {len(creator_ids)} creators...")
-        
-        processed_count = 0
-        skipped_count = 0
-        error_count = 0
-        
-        for i, rid in enumerate(creator_ids, 1):
-            if db[COLLECTIONS['creators']].count_documents({"_id": rid}) > 0:
-                skipped_count += 1
-                continue
-                
-            try:
-                creator = self.request_api(f"/author/{rid}")
-                if creator:
-                    creator["_id"] = rid
-                    creator["fetched_at"] = datetime.now().isoformat()
-                    db[COLLECTIONS['creators']].insert_one(creator)
-                    processed_count += 1
-                else:
-                    error_count += 1
-                    
-            except Exception as e:
-                logger.warning(f"[WARN] Failed to fetch creator {rid}: {e}")
-                error_count += 1
-                # Continue with next creator instead of stopping
-                continue
-                
-            if i % 100 == 0:
-                logger.info(f"[PROGRESS] {i}/{len(creator_ids)} creators processed")
-                
-            if self.delay > 0:
-                time.sleep(self.delay)
-                
-        logger.info(f"[SUMMARY] Creators: {processed_count} processed, {skipped_count} skipped, {error_count} errors")
+        self._fetch_entities_batched("creators", "author", "creators", creator_ids)
         self.progress['creators']['completed'] = True
         self.save_progress()
         logger.info("[SUCCESS] Creators fetching completed")
-    
-    def _fetch_groups(self, group_ids: List[str]):
+
+    def _fetch_groups(self, group_ids: Iterable[str]):
         """Fetch scanlation group data."""
-        logger.info(f"[START] Fetching {len(group_ids)} scanlation groups...")
-        
-        processed_count = 0
-        skipped_count = 0
-        error_count = 0
-        
-        for i, rid in enumerate(group_ids, 1):
-            if db[COLLECTIONS['groups']].count_documents({"_id": rid}) > 0:
-                skipped_count += 1
-                continue
-                
-            try:
-                group = self.request_api(f"/group/{rid}")
-                if group:
-                    group["_id"] = rid
-                    group["fetched_at"] = datetime.now().isoformat()
-                    db[COLLECTIONS['groups']].insert_one(group)
-                    processed_count += 1
-                else:
-                    error_count += 1
-                    
-            except Exception as e:
-                logger.warning(f"[WARN] Failed to fetch group {rid}: {e}")
-                error_count += 1
-                # Continue with next group instead of stopping
-                continue
-                
-            if i % 100 == 0:
-                logger.info(f"[PROGRESS] {i}/{len(group_ids)} groups processed")
-                
-            if self.delay > 0:
-                time.sleep(self.delay)
-                
-        logger.info(f"[SUMMARY] Groups: {processed_count} processed, {skipped_count} skipped, {error_count} errors")
+        self._fetch_entities_batched("groups", "group", "groups", group_ids)
         self.progress['groups']['completed'] = True
         self.save_progress()
         logger.info("[SUCCESS] Groups fetching completed")
-    
-    def run(self, phase: str = "all"):
+
+    async def run_concurrent(self):
+        """Run all phases as a DAG (PHASE_DEPENDENCIES) on worker threads.
+
+        Independent phases run in parallel. While chapters/related are running, every
+        cover/creator/group ID they see is streamed to batch fetchers, so those entities
+        arrive alongside their upstream data; the covers phase then only has to catch up
+        on IDs from earlier runs. All threads share self.controller.
+        """
+        manga_ids = await asyncio.to_thread(self.get_manga_ids)
+        phase_calls = {
+            'tags': self.fetch_tags,
+            'statistics': lambda: self.fetch_statistics(manga_ids),
+            'chapters': lambda: self.fetch_chapters(manga_ids),
+            'related': lambda: self.fetch_related(manga_ids),
+            'covers': lambda: self.fetch_covers_creators_groups(manga_ids)
+        }
+
+        self.streams = {key: queue.Queue() for key in set(STREAM_TYPES.values())}
+        streamers = asyncio.gather(*(
+            asyncio.to_thread(self._stream_entities, kind, endpoint, key)
+            for kind, endpoint, key in [("covers", "cover", "cover_arts"), ("creators", "author", "creators"), ("groups", "group", "groups")]
+            if not self.progress[key]['completed']
+        ))
+
+        tasks = {}
+
+        async def run_phase(name: str):
+            await asyncio.gather(*(tasks[dep] for dep in PHASE_DEPENDENCIES[name]))
+            if name == 'covers':
+                await streamers
+            logger.info(f"[PHASE] {name} started")
+            await asyncio.to_thread(phase_calls[name])
+            logger.info(f"[PHASE] {name} finished")
+
+        async def close_streams():
+            # Producers are the phases that publish relationships; stop consumers once they are done
+            await asyncio.gather(tasks['chapters'], tasks['related'], return_exceptions=True)
+            for stream in self.streams.values():
+                stream.put(None)
+
+        for name in PHASE_DEPENDENCIES:
+            tasks[name] = asyncio.ensure_future(run_phase(name))
+        try:
+            await asyncio.gather(*tasks.values(), close_streams(), streamers)
+        finally:
+            self.streams = None
+
+    def run_worker(self, phase: str, worker_id: str) -> int:
+        """Claim chunks of `phase` from the work queue until none are left. Returns chunks completed."""
+        work_queue = WorkQueue(db[WORK_QUEUE_COLLECTION])
+        phase_calls = {
+            'statistics': self.fetch_statistics,
+            'chapters': self.fetch_chapters,
+            'related': self.fetch_related
+        }
+        completed = 0
+        logger.info(f"[WORKER] {worker_id} started on {phase}")
+        while True:
+            chunk = work_queue.claim(phase, worker_id)
+            if not chunk:
+                break
+            # Phase methods flag themselves completed after each call; in a worker that only means this chunk
+            self.progress[phase]['completed'] = False
+            # Long chunks keep their lease as long as items keep finishing; a hung worker still loses it
+            self.heartbeat = lambda chunk=chunk: work_queue.renew(chunk, worker_id)
+            try:
+                phase_calls[phase](chunk["ids"])
+                self.save_progress()
+            except Exception as e:
+                logger.error(f"[ERROR] {worker_id} failed chunk {chunk['_id']}: {e}")
+                work_queue.release(chunk, worker_id)
+                continue
+            finally:
+                self.heartbeat = None
+            if work_queue.complete(chunk, worker_id):
+                completed += 1
+            else:
+                # Work is idempotent (ledger + DoneSet), the other owner will just find it done
+                logger.warning(f"[WARN] {worker_id} lost the lease on {chunk['_id']} before finishing")
+        logger.info(f"[WORKER] {worker_id} finished {completed} {phase} chunks")
+        return completed
+
+    def run_workers(self, workers: int, phase: str = "all"):
+        """Seed the work queue and run `workers` local worker processes per sharded phase.
+
+        Local workers share one egress IP, so the configured --rate is split between them.
+        Workers on other machines can join with `--worker --phase <phase>` against the same MONGO_URI.
+        """
+        manga_ids = self.get_manga_ids()
+        work_queue = WorkQueue(db[WORK_QUEUE_COLLECTION])
+        if phase in ["all", "tags"]:
+            self.fetch_tags()
+
+        rate = self.rate / workers
+        for worker_phase in WORKER_PHASES:
+            if phase not in ["all", worker_phase] or self.progress[worker_phase]['completed']:
+                continue
+            work_queue.seed(worker_phase, self.ledger.resume(worker_phase, manga_ids))
+            logger.info(f"[START] {worker_phase} with {workers} workers at {rate:.2f} req/s each")
+            processes = [
+                subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", "--phase", worker_phase,
+                                  "--rate", str(rate)] + (["--skip-unchanged"] if self.skip_unchanged_stats else []))
+                for _ in range(workers)
+            ]
+            for process in processes:
+                process.wait()
+
+            open_chunks = work_queue.open_chunks(worker_phase)
+            if open_chunks:
+                logger.warning(f"[WARN] {open_chunks} {worker_phase} chunks still open; rerun to resume")
+            elif not self.ledger.summary(worker_phase).get(CheckpointLedger.FAILED):
+                self.progress[worker_phase]['completed'] = True
+                self.save_progress()
+
+        if phase in ["all", "covers", "creators", "groups"]:
+            self.fetch_covers_creators_groups(manga_ids)
+
+    def run(self, phase: str = "all", concurrent: bool = False):
         """Run the data fetching process."""
         try:
+            if concurrent and phase == "all":
+                logger.info("[START] Starting all phases concurrently...")
+                asyncio.run(self.run_concurrent())
+                logger.info("[SUCCESS] All tasks completed successfully!")
+                return
+
             manga_ids = self.get_manga_ids()
             
             logger.info(f"[START] Starting {phase} phase...")
@@ -703,6 +1345,8 @@ class MangaDataFetcher:
                 self.fetch_statistics(manga_ids)
             if phase in ["all", "chapters"]:
                 self.fetch_chapters(manga_ids)
+            if phase == "chapters_delta":
+                self.sync_chapters_delta(manga_ids)
             if phase in ["all", "related"]:
                 self.fetch_related(manga_ids)
             if phase in ["all", "covers", "creators", "groups"]:
@@ -721,18 +1365,48 @@ class MangaDataFetcher:
 def main():
     parser = argparse.ArgumentParser(description="Fetch all related manga data from MangaDex API")
     parser.add_argument("--phase", type=str, default="all", 
-                       help="Phase to run: all|tags|statistics|chapters|covers|creators|groups|related")
+                       help="Phase to run: all|tags|statistics|chapters|chapters_delta|covers|creators|groups|related")
     parser.add_argument("--reset-progress", action="store_true", 
                        help="Reset progress and start from beginning")
+    parser.add_argument("--concurrent", action="store_true",
+                       help="Run independent phases in parallel under one shared AIMD controller (phase=all only)")
+    parser.add_argument("--workers", type=int, default=0,
+                       help="Shard statistics/chapters/related across N local worker processes")
+    parser.add_argument("--worker", action="store_true",
+                       help="Run as a queue worker for --phase (can be started on other machines)")
+    parser.add_argument("--rate", type=float, default=MANGADEX_GLOBAL_RATE,
+                       help="Maximum requests per second for this process")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                       help="Do not write a statistics snapshot when follows and rating match the last one")
+    parser.add_argument("--migrate-statistics", action="store_true",
+                       help="Move the old statistics collection into the time-series collection and exit")
     
     args = parser.parse_args()
+
+    if args.migrate_statistics:
+        migrate_statistics()
+        return
+
+    if args.worker:
+        if args.phase not in WORKER_PHASES:
+            parser.error(f"--worker needs --phase {'|'.join(WORKER_PHASES)}")
+        fetcher = MangaDataFetcher(rate=args.rate, track_phases=False, skip_unchanged_stats=args.skip_unchanged)
+        fetcher.run_worker(args.phase, f"{socket.gethostname()}:{os.getpid()}")
+        return
     
-    if args.reset_progress and os.path.exists(PROGRESS_FILE):
-        os.remove(PROGRESS_FILE)
+    if args.reset_progress:
+        db[LEDGER_COLLECTION].delete_many({})
+        db[WORK_QUEUE_COLLECTION].delete_many({})
+        db[STATE_COLLECTION].delete_one({"_id": "phases"})
+        if os.path.exists(PROGRESS_FILE):
+            os.remove(PROGRESS_FILE)
         logger.info("[RESET] Progress reset. Starting fresh...")
     
-    fetcher = MangaDataFetcher()
-    fetcher.run(args.phase)
+    fetcher = MangaDataFetcher(rate=args.rate, skip_unchanged_stats=args.skip_unchanged)
+    if args.workers > 0:
+        fetcher.run_workers(args.workers, args.phase)
+    else:
+        fetcher.run(args.phase, concurrent=args.concurrent)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,142 @@
+import os
+import queue
+import threading
+import logging
+from io import BytesIO
+from concurrent.futures import Future, ProcessPoolExecutor
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {
+    "JPEG": (".jpg", ".jpeg"),
+    "WEBP": (".webp",),
+    "PNG": (".png",)
+}
+
+_STOP = object()
+
+
+def process_image(data, image_path, image_format="JPEG", quality=85, max_size=None, thumbnail_size=None):
+    """Decode, thu nhỏ và encode lại một trang. Chạy trong process con nên phải là hàm top-level."""
+    image = Image.open(BytesIO(data))
+    if max_size and image.format == "JPEG":
+        # Draft mode cho phép libjpeg decode thẳng ở độ phân giải 1/2, 1/4, 1/8
+        image.draft("RGB", tuple(max_size))
+    image = image.convert("RGB")
+    if max_size:
+        image.thumbnail(tuple(max_size))
+
+    tmp_path = f"{image_path}.tmp"
+    image.save(tmp_path, image_format, quality=quality)
+    os.replace(tmp_path, image_path)
+
+    if thumbnail_size:
+        root, ext = os.path.splitext(image_path)
+        image.thumbnail(tuple(thumbnail_size))
+        image.save(f"{root}.thumb{ext}", image_format, quality=quality)
+    return image_path
+
+
+class ImagePostProcessor:
+    """Stage hậu xử lý ảnh chạy trên ProcessPoolExecutor.
+
+    Downloader đưa bytes thô vào một hàng đợi có giới hạn; một thread điều phối lấy ra và
+    gửi sang process pool. Khi hàng đợi và các slot đang xử lý đều đầy thì submit() sẽ block,
+    nhờ vậy bộ nhớ không phình ra khi mạng nhanh hơn CPU.
+
+    Mỗi submit() trả về một Future của riêng trang đó, xong khi file đã được ghi (hoặc mang lỗi
+    của trang). Nếu process pool hỏng (không submit được nữa), các trang còn lại bị tính là lỗi,
+    submit() báo lỗi ngay cho downloader và close() raise lại lỗi đó.
+    """
+
+    def __init__(self, max_workers=None, queue_size=32, image_format="JPEG", quality=85, max_size=None, thumbnail_size=None):
+        self.image_format = image_format.upper()
+        self.options = {
+            "image_format": self.image_format,
+            "quality": quality,
+            "max_size": max_size,
+            "thumbnail_size": thumbnail_size
+        }
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._slots = threading.BoundedSemaphore((max_workers or os.cpu_count() or 1) * 2)
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self._error = None
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    @property
+    def extension(self):
+        """Phần mở rộng của file đầu ra."""
+        return FORMAT_EXTENSIONS.get(self.image_format, (f".{self.image_format.lower()}",))[0]
+
+    def needs_processing(self, page_url):
+        """Trang có cần decode/encode không, hay có thể ghi nguyên byte xuống đĩa."""
+        if self.options["max_size"] or self.options["thumbnail_size"]:
+            return True
+        source_ext = os.path.splitext(page_url)[1].lower()
+        return source_ext not in FORMAT_EXTENSIONS.get(self.image_format, ())
+
+    def submit(self, data, image_path):
+        """Đưa một trang vào hàng đợi xử lý (block nếu hàng đợi đầy).
+
+        Trả về Future có kết quả là image_path khi file đã ghi xong, hoặc exception nếu trang lỗi.
+        """
+        if self._error is not None:
+            raise RuntimeError(f"Không thể hậu xử lý ảnh: {self._error}") from self._error
+        page = Future()
+        self.queue.put((data, image_path, page))
+        return page
+
+    def _dispatch(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            data, image_path, page = item
+            self._slots.acquire()
+            try:
+                future = self.executor.submit(process_image, data, image_path, **self.options)
+            except Exception as e:
+                # Vẫn trả slot và tiếp tục lấy khỏi hàng đợi, nếu không submit() sẽ block mãi
+                self._slots.release()
+                with self._lock:
+                    self.failed += 1
+                    if self._error is None:
+                        self._error = e
+                logger.error(f"Lỗi khi gửi ảnh {image_path} sang process pool: {e}")
+                page.set_exception(e)
+                continue
+            future.add_done_callback(lambda f, path=image_path, page=page: self._on_done(f, path, page))
+
+    def _on_done(self, future, image_path, page):
+        self._slots.release()
+        try:
+            result = future.result()
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.error(f"Lỗi khi xử lý ảnh {image_path}: {e}")
+            page.set_exception(e)
+            return
+        with self._lock:
+            self.processed += 1
+        page.set_result(result)
+
+    def close(self):
+        """Chờ xử lý hết các trang đang chờ rồi dừng process pool; raise nếu pool đã hỏng giữa chừng."""
+        self.queue.put(_STOP)
+        self._dispatcher.join()
+        self.executor.shutdown(wait=True)
+        logger.info(f"Hậu xử lý ảnh: {self.processed} trang thành công, {self.failed} trang lỗi.")
+        if self._error is not None:
+            raise RuntimeError(f"Process pool hậu xử lý ảnh bị hỏng: {self._error}") from self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
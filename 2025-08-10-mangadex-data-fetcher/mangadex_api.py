@@ -5,10 +5,18 @@ import logging
 import os
 import pyodbc
 import datetime
+import json
+import queue
+import shutil
+import threading
+from contextlib import contextmanager
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
 from PIL import Image
 from io import BytesIO
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from image_pipeline import ImagePostProcessor
+from entity_cache import EntityCache
 
 # Cấu hình logging
 logging.basicConfig(
@@ -18,20 +26,111 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# API từ chối offset + limit > 10.000
+MAX_OFFSET_WINDOW = 10000
+WINDOW_SINCE_PARAMS = {
+    "createdAt": "created_at_since",
+    "publishAt": "publish_at_since",
+    "updatedAt": "updated_at_since"
+}
+MANIFEST_FILE = "manifest.json"
+# Ghi lại manifest sau mỗi bấy nhiêu chương để không mất tiến độ khi bị ngắt
+MANIFEST_FLUSH_INTERVAL = 10
+
+# Các bảng cho đường ghi hàng loạt, theo thứ tự khóa ngoại: (bảng, cột, cột khóa, cột được cập nhật khi đã tồn tại)
+BULK_TABLES = [
+    ("Manga", ["mangaId", "mangaType", "title", "description", "coverArt", "mangadexScore", "originalLanguage", "lastChapter",
+               "publicationDemographic", "status", "year", "contentRating", "createdAt", "updatedAt"], ["mangaId"], []),
+    ("AltTitles", ["mangaId", "language", "title"], ["mangaId", "language", "title"], []),
+    ("MangaByTags", ["tagId", "mangaId"], ["tagId", "mangaId"], []),
+    ("AvailableTranslatedLanguages", ["mangaId", "language"], ["mangaId", "language"], []),
+    ("Creator", ["creatorId", "creatorName", "biography"], ["creatorId"], []),
+    ("CreatorSocialMedia", ["creatorId", "platform", "url"], ["creatorId", "platform", "url"], []),
+    ("CreatorMangaWorks", ["creatorId", "mangaId", "role"], ["creatorId", "mangaId"], []),
+    ("Chapter", ["chapterId", "mangaId", "chapterNumber", "chapterTitle", "translatedLanguage", "publishedAt", "totalPages"], ["chapterId"], []),
+    ("Page", ["chapterId", "pageNumber", "pageImg"], ["chapterId", "pageNumber"], []),
+    ("UsersMangaDownloads", ["userId", "mangaId"], ["userId", "mangaId"], []),
+]
+# Chỉ gắn tag đã có trong bảng Tags (giống đường ghi từng dòng)
+BULK_SOURCE_FILTERS = {
+    "MangaByTags": "WHERE EXISTS (SELECT 1 FROM Tags t WHERE t.tagId = s.tagId)"
+}
+# Role được nối thêm vào danh sách đã có thay vì ghi đè (giống đường ghi từng dòng), cần SQL Server 2017+
+_MISSING_ROLES = "FROM STRING_SPLIT(src.role, ',') r WHERE CHARINDEX(',' + r.value + ',', ',' + ISNULL(tgt.role, '') + ',') = 0"
+BULK_MATCHED_CLAUSES = {
+    "CreatorMangaWorks": f"""WHEN MATCHED AND EXISTS (SELECT 1 {_MISSING_ROLES}) THEN
+                    UPDATE SET tgt.role = CONCAT(NULLIF(tgt.role, '') + ',', (SELECT STRING_AGG(r.value, ',') {_MISSING_ROLES}))"""
+}
+
+
+# /manga mặc định bỏ qua erotica/pornographic, cần liệt kê đủ để batch không thiếu manga
+ALL_CONTENT_RATINGS = ["safe", "suggestive", "erotica", "pornographic"]
+API_BATCH_SIZE = 100
+
+
+def _to_sql_datetime(value):
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _chapter_sort_key(chapter_number):
+    try:
+        return (float(chapter_number), "")
+    except (TypeError, ValueError):
+        return (float("inf"), str(chapter_number))
+
+class DBConnectionPool:
+    """Pool nhỏ các kết nối pyodbc, dùng lại giữa nhiều lần ghi thay vì mở/đóng cho từng manga."""
+
+    def __init__(self, conn_str, size=2):
+        self.conn_str = conn_str
+        self.size = size
+        self._pool = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return pyodbc.connect(self.conn_str)
+        return self._pool.get()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+        logger.info("Đã đóng pool kết nối cơ sở dữ liệu.")
+
+
 class MangaDexAPI:
-    def __init__(self, base_url="https://api.mangadex.org", max_retries=5, backoff_factor=2, db_conn_str=None):
+    def __init__(self, base_url="https://api.mangadex.org", max_retries=5, backoff_factor=2, db_conn_str=None, cache=None):
         self.base_url = base_url
+        # Cache tác giả/ảnh bìa/thẻ; truyền EntityCache(db_path=...) để giữ lại giữa các lần chạy
+        self.cache = cache if cache is not None else EntityCache()
         self.session = requests.Session()
         self.session.headers.update({
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36",
             "Referer": "https://mangadex.org/"
         })
         retries = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=[429, 500, 502, 503, 504])
-        self.session.mount('https://', HTTPAdapter(max_retries=retries))
+        self.session.mount('https://', HTTPAdapter(max_retries=retries, pool_maxsize=16))
         self.db_conn_str = db_conn_str
         self.conn = None
         self.cursor = None
         self.language_priority = ["vi", "en"]  # Ưu tiên tiếng Việt trước tiếng Anh
+        self.preferred_groups = []  # ID nhóm dịch được ưu tiên khi cùng ngôn ngữ
         self.map_languages = {
             "vi": "Vietnamese Translation",
             "en": "English Translation"
@@ -124,7 +223,11 @@ class MangaDexAPI:
         if group:
             params["group"] = group
         try:
-            return self.make_request(url, params, use_proxy, verify_ssl)
+            data = self.make_request(url, params, use_proxy, verify_ssl)
+            if data:
+                for manga in data.get("data", []):
+                    self._prime_cache(manga.get("relationships", []))
+            return data
         except requests.exceptions.RequestException as e:
             logger.error(f"Lỗi khi tìm kiếm manga: {e}")
             return None
@@ -136,7 +239,10 @@ class MangaDexAPI:
         if includes:
             params["includes[]"] = includes
         try:
-            return self.make_request(url, params)
+            data = self.make_request(url, params)
+            if data:
+                self._prime_cache(data["data"].get("relationships", []))
+            return data
         except requests.exceptions.RequestException as e:
             logger.error(f"Lỗi khi lấy manga {manga_id}: {e}")
             return None
@@ -162,6 +268,15 @@ class MangaDexAPI:
             logger.error(f"Lỗi khi lấy thống kê manga {manga_id}: {e}")
             return None
 
+    def get_mangas_statistics(self, manga_ids):
+        """Lấy thống kê cho nhiều manga trong một request (tối đa 100 ID)."""
+        url = f"{self.base_url}/statistics/manga"
+        try:
+            return self.make_request(url, {"manga[]": manga_ids})
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Lỗi khi lấy thống kê cho {len(manga_ids)} manga: {e}")
+            return None
+
     def get_chapters(self, manga_id=None, groups=None, translated_language=None, original_language=None, content_rating=None, include_future_updates="1", include_empty_pages=0, include_future_publish_at=0, include_external_url=0, include_unavailable="0", created_at_since=None, updated_at_since=None, publish_at_since=None, order=None, includes=None, limit=100, offset=0):
         """Lấy danh sách chương với các bộ lọc."""
         url = f"{self.base_url}/chapter"
@@ -191,7 +306,8 @@ class MangaDexAPI:
         if publish_at_since:
             params["publishAtSince"] = publish_at_since
         if order:
-            params["order"] = order
+            for key, direction in order.items():
+                params[f"order[{key}]"] = direction
         if includes:
             params["includes[]"] = includes
         try:
@@ -200,6 +316,67 @@ class MangaDexAPI:
             logger.error(f"Lỗi khi lấy danh sách chương: {e}")
             return None
 
+    def iter_chapters(self, manga_id=None, window_field="createdAt", page_size=100, prefetch=True, **filters):
+        """Duyệt toàn bộ feed /chapter và trả về từng chương một (generator).
+
+        Trang N+1 được tải trước trong lúc người gọi xử lý trang N. Khi offset tiến gần giới hạn
+        10.000 của API, feed chuyển sang cửa sổ mới bắt đầu từ mốc {window_field} cuối cùng
+        (publishAtSince/createdAtSince/updatedAtSince), nên bộ nhớ không phụ thuộc số chương.
+        """
+        since_param = WINDOW_SINCE_PARAMS[window_field]
+        order = {window_field: "asc"}
+        since = filters.pop(since_param, None)
+        offset = 0
+        # Các chương trùng mốc thời gian với `since` đã được trả về ở cửa sổ trước
+        boundary_ids = set()
+        last_ts, last_ts_ids = None, set()
+
+        def fetch(since, offset):
+            return self.get_chapters(manga_id=manga_id, order=order, limit=page_size, offset=offset,
+                                     **{since_param: since}, **filters)
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        submit = (lambda *args: executor.submit(fetch, *args)) if prefetch else (lambda *args: args)
+        result = (lambda pending: pending.result()) if prefetch else (lambda pending: fetch(*pending))
+        try:
+            pending = submit(since, offset)
+            while pending is not None:
+                data = result(pending)
+                if data is None:
+                    logger.error(f"Dừng duyệt chương của manga {manga_id} tại offset {offset} do lỗi API.")
+                    return
+                chapters = data.get("data", [])
+                if not chapters:
+                    return
+
+                next_offset = offset + len(chapters)
+                page_last_ts = chapters[-1]["attributes"][window_field][:19]
+                pending = None
+                if next_offset < data.get("total", 0):
+                    if next_offset + page_size <= MAX_OFFSET_WINDOW:
+                        offset = next_offset
+                        pending = submit(since, offset)
+                    elif page_last_ts != since:
+                        since, offset = page_last_ts, 0
+                        pending = submit(since, offset)
+                    else:
+                        logger.warning(f"Hơn {MAX_OFFSET_WINDOW} chương có cùng {window_field}={since}, không thể duyệt tiếp.")
+
+                for ch in chapters:
+                    if ch["id"] in boundary_ids:
+                        continue
+                    ts = ch["attributes"][window_field][:19]
+                    if ts != last_ts:
+                        last_ts, last_ts_ids = ts, set()
+                    last_ts_ids.add(ch["id"])
+                    yield ch
+
+                if pending is not None and offset == 0:
+                    boundary_ids = last_ts_ids if last_ts == since else set()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
     def get_chapter(self, chapter_id, includes=None):
         """Lấy thông tin chi tiết của chương theo ID."""
         url = f"{self.base_url}/chapter/{chapter_id}"
@@ -213,10 +390,14 @@ class MangaDexAPI:
             return None
 
     def get_chapter_images(self, chapter_id, quality="data"):
-        """Lấy danh sách URL hình ảnh của chương."""
+        """Lấy danh sách URL hình ảnh của chương.
+
+        Kết quả /at-home/server được cache ngắn hạn (URL node hết hạn sau vài phút), nên
+        lập kế hoạch rồi tải ngay sau đó không tốn thêm request vào endpoint bị giới hạn chặt này.
+        """
         url = f"{self.base_url}/at-home/server/{chapter_id}"
         try:
-            data = self.make_request(url)
+            data = self.cache.get_or_fetch("at_home", chapter_id, lambda: self.make_request(url))
             if data and data["result"] == "ok":
                 base_url = data["baseUrl"]
                 chapter_hash = data["chapter"]["hash"]
@@ -227,12 +408,32 @@ class MangaDexAPI:
             logger.error(f"Lỗi khi lấy hình ảnh chương {chapter_id}: {e}")
             return None
 
-    def download_chapter_images(self, chapter_id, manga_title, chapter_number, save_path="DB", quality="data"):
-        """Tải hình ảnh chương và lưu vào thư mục."""
+    def download_chapter_images(self, chapter_id, manga_title, chapter_number, save_path="DB", quality="data", concurrent=False, max_workers=8, post_processor=None):
+        """Tải hình ảnh chương và lưu vào thư mục.
+
+        Với concurrent=True các trang được tải song song (tối đa max_workers), ghi thẳng
+        xuống đĩa theo từng chunk và bỏ qua những trang đã tải xong ở lần chạy trước.
+        Trang cần chuyển định dạng được giao cho post_processor (ImagePostProcessor);
+        nếu không truyền vào thì tạo một processor riêng cho chương này.
+        """
+        downloaded_pages, _ = self.download_chapter_pages(chapter_id, manga_title, chapter_number, save_path, quality, concurrent, max_workers, post_processor)
+        return downloaded_pages > 0
+
+    def download_chapter_pages(self, chapter_id, manga_title, chapter_number, save_path="DB", quality="data", concurrent=False, max_workers=8, post_processor=None):
+        """Như download_chapter_images nhưng trả về (số trang đã có trên đĩa, tổng số trang).
+
+        Chương chỉ được coi là tải xong khi hai số bằng nhau; (0, 0) nếu không lấy được danh sách trang.
+        """
+        if concurrent:
+            if post_processor is None:
+                with ImagePostProcessor() as processor:
+                    return self._download_chapter_images_concurrent(chapter_id, manga_title, chapter_number, save_path, quality, max_workers, processor)
+            return self._download_chapter_images_concurrent(chapter_id, manga_title, chapter_number, save_path, quality, max_workers, post_processor)
+
         image_urls = self.get_chapter_images(chapter_id, quality)
         if not image_urls:
             logger.error(f"Không tìm thấy hình ảnh cho chương {chapter_number}.")
-            return False
+            return 0, 0
 
         chapter_folder = os.path.join(save_path, manga_title, f"Chapter {chapter_number}")
         os.makedirs(chapter_folder, exist_ok=True)
@@ -254,7 +455,78 @@ class MangaDexAPI:
                 continue
 
         logger.info(f"Đã tải {downloaded_pages}/{total_pages} trang cho chương {chapter_number}.")
-        return downloaded_pages > 0
+        return downloaded_pages, total_pages
+
+    def _download_chapter_images_concurrent(self, chapter_id, manga_title, chapter_number, save_path, quality, max_workers, post_processor):
+        image_urls = self.get_chapter_images(chapter_id, quality)
+        if not image_urls:
+            logger.error(f"Không tìm thấy hình ảnh cho chương {chapter_number}.")
+            return 0, 0
+
+        chapter_folder = os.path.join(save_path, manga_title, f"Chapter {chapter_number}")
+        os.makedirs(chapter_folder, exist_ok=True)
+        total_pages = len(image_urls)
+        downloaded_pages = 0
+        skipped_pages = 0
+        transcodes = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self._download_page, page_url, os.path.join(chapter_folder, f"{index}{post_processor.extension}"), post_processor): index
+                for index, page_url in enumerate(image_urls, start=1)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Lỗi khi tải trang {index} cho chương {chapter_number}: {e}")
+                    continue
+                if isinstance(result, Future):
+                    transcodes[result] = index
+                    continue
+                if not result:
+                    skipped_pages += 1
+                downloaded_pages += 1
+
+        # Trang cần chuyển định dạng chỉ được tính khi process con đã ghi xong file
+        for page, index in transcodes.items():
+            try:
+                page.result()
+                downloaded_pages += 1
+            except Exception as e:
+                logger.error(f"Lỗi khi chuyển định dạng trang {index} cho chương {chapter_number}: {e}")
+
+        logger.info(f"Đã tải {downloaded_pages}/{total_pages} trang cho chương {chapter_number} ({skipped_pages} trang đã có sẵn).")
+        return downloaded_pages, total_pages
+
+    def _download_page(self, page_url, image_path, post_processor):
+        """Tải một trang. Trả về False nếu trang đã được tải xong từ trước, True nếu đã ghi xong,
+        hoặc Future của post_processor nếu trang đang chờ chuyển định dạng."""
+        # File đích chỉ xuất hiện sau khi rename (từ .part hoặc từ process con), nên tồn tại nghĩa là đã xong
+        if os.path.exists(image_path):
+            return False
+
+        if post_processor.needs_processing(page_url):
+            response = self.session.get(page_url, timeout=10)
+            response.raise_for_status()
+            return post_processor.submit(response.content, image_path)
+
+        # Định dạng nguồn đã đúng: stream nguyên byte xuống đĩa, không decode/encode lại
+        part_path = f"{image_path}.part"
+        with self.session.get(page_url, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            expected_size = response.headers.get("Content-Length")
+            written = 0
+            with open(part_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    written += len(chunk)
+        if expected_size is not None and written != int(expected_size):
+            os.remove(part_path)
+            raise IOError(f"Tải thiếu dữ liệu ({written}/{expected_size} bytes)")
+        os.replace(part_path, image_path)
+        return True
 
     def get_authors(self, name=None, ids=None, order=None, includes=None, limit=10, offset=0):
         """Lấy danh sách tác giả với các bộ lọc."""
@@ -272,13 +544,22 @@ class MangaDexAPI:
         if includes:
             params["includes[]"] = includes
         try:
-            return self.make_request(url, params)
+            data = self.make_request(url, params)
+            if data and not includes:
+                for author in data.get("data", []):
+                    self.cache.put("author", author["id"], {"result": "ok", "response": "entity", "data": author})
+            return data
         except requests.exceptions.RequestException as e:
             logger.error(f"Lỗi khi lấy danh sách tác giả: {e}")
             return None
 
     def get_author(self, author_id, includes=None):
-        """Lấy thông tin chi tiết của tác giả theo ID."""
+        """Lấy thông tin chi tiết của tác giả theo ID (qua cache nếu không có includes)."""
+        if not includes:
+            return self.cache.get_or_fetch("author", author_id, lambda: self._fetch_author(author_id))
+        return self._fetch_author(author_id, includes)
+
+    def _fetch_author(self, author_id, includes=None):
         url = f"{self.base_url}/author/{author_id}"
         params = {}
         if includes:
@@ -315,7 +596,12 @@ class MangaDexAPI:
             return None
 
     def get_cover_art(self, cover_id, includes=None):
-        """Lấy thông tin chi tiết của ảnh bìa theo ID."""
+        """Lấy thông tin chi tiết của ảnh bìa theo ID (qua cache nếu không có includes)."""
+        if not includes:
+            return self.cache.get_or_fetch("cover_art", cover_id, lambda: self._fetch_cover_art(cover_id))
+        return self._fetch_cover_art(cover_id, includes)
+
+    def _fetch_cover_art(self, cover_id, includes=None):
         url = f"{self.base_url}/cover/{cover_id}"
         params = {}
         if includes:
@@ -327,7 +613,10 @@ class MangaDexAPI:
             return None
 
     def get_tags(self):
-        """Lấy danh sách thẻ."""
+        """Lấy danh sách thẻ (qua cache)."""
+        return self.cache.get_or_fetch("tag", "all", self._fetch_tags)
+
+    def _fetch_tags(self):
         url = f"{self.base_url}/manga/tag"
         try:
             return self.make_request(url)
@@ -335,10 +624,275 @@ class MangaDexAPI:
             logger.error(f"Lỗi khi lấy danh sách thẻ: {e}")
             return None
 
-    def save_manga_to_db(self, manga_id, user_id):
-        """Lưu thông tin manga, chương, và các dữ liệu liên quan vào cơ sở dữ liệu."""
+    def _prime_cache(self, relationships):
+        """Đưa các entity đã được mở rộng qua includes[] vào cache để khỏi phải gọi lại API."""
+        for rel in relationships:
+            if not rel.get("attributes"):
+                continue
+            if rel["type"] in ("author", "artist"):
+                entity = {"id": rel["id"], "type": "author", "attributes": rel["attributes"], "relationships": []}
+                self.cache.put("author", rel["id"], {"result": "ok", "response": "entity", "data": entity})
+            elif rel["type"] == "cover_art":
+                entity = {"id": rel["id"], "type": "cover_art", "attributes": rel["attributes"], "relationships": []}
+                self.cache.put("cover_art", rel["id"], {"result": "ok", "response": "entity", "data": entity})
+
+    def _fetch_manga_bundle(self, manga_id, existing_chapter_ids, lazy_pages=False):
+        """Tải toàn bộ dữ liệu mạng của một manga (chưa đụng tới cơ sở dữ liệu)."""
+        manga_data = self.get_manga(manga_id, includes=["author", "artist", "cover_art"])
+        if not manga_data or manga_data["result"] != "ok":
+            logger.error(f"Không tìm thấy manga với ID {manga_id}.")
+            return None
+        relationships = manga_data["data"]["relationships"]
+
+        cover_url = None
+        cover_id = next((rel["id"] for rel in relationships if rel["type"] == "cover_art"), None)
+        if cover_id:
+            cover_data = self.get_cover_art(cover_id)
+            if cover_data and cover_data["result"] == "ok":
+                cover_url = f"https://uploads.mangadex.org/covers/{manga_id}/{cover_data['data']['attributes']['fileName']}"
+
+        stats_data = self.get_manga_statistics(manga_id)
+        score = stats_data["statistics"].get(manga_id, {}).get("rating", {}).get("average", None) if stats_data else None
+
+        creators = []
+        for rel in relationships:
+            if rel["type"] in ("author", "artist"):
+                creator_data = self.get_author(rel["id"])
+                if creator_data and creator_data["result"] == "ok":
+                    creators.append((rel["id"], rel["type"], creator_data["data"]["attributes"]))
+
+        chapters = self._fetch_chapter_bundle(manga_id, existing_chapter_ids, lazy_pages)
+        return {"manga": manga_data["data"], "cover_url": cover_url, "score": score, "creators": creators, "chapters": chapters}
+
+    def _fetch_chapter_bundle(self, manga_id, existing_chapter_ids, lazy_pages=False):
+        """Lấy các chương theo language_priority; chỉ chương chưa có trong DB mới lấy URL trang.
+
+        Với lazy_pages=True không gọi /at-home/server, URL trang được lấy lúc đọc/tải.
+        """
+        chapters = []
+        for lang in self.language_priority:
+            for ch in self.iter_chapters(manga_id=manga_id, translated_language=[lang], includes=["scanlation_group"]):
+                image_urls = None
+                if not lazy_pages and ch["id"] not in existing_chapter_ids:
+                    image_urls = self.get_chapter_images(ch["id"], quality="data")
+                chapters.append((lang, ch, image_urls))
+        return chapters
+
+    def _fetch_manga_bundles(self, manga_ids, existing_chapter_ids, max_workers, lazy_pages=False):
+        """Tải dữ liệu mạng cho nhiều manga: metadata, thống kê và tác giả theo lô 100 ID, chương song song."""
+        mangas, stats, creators = {}, {}, {}
+        for start in range(0, len(manga_ids), API_BATCH_SIZE):
+            batch = manga_ids[start:start + API_BATCH_SIZE]
+            data = self.search_manga(ids=batch, includes=["author", "artist", "cover_art"],
+                                     content_rating=ALL_CONTENT_RATINGS, limit=API_BATCH_SIZE)
+            for manga in (data or {}).get("data", []):
+                mangas[manga["id"]] = manga
+            stats_data = self.get_mangas_statistics(batch)
+            stats.update((stats_data or {}).get("statistics", {}))
+        for manga_id in manga_ids:
+            if manga_id not in mangas:
+                logger.error(f"Không tìm thấy manga với ID {manga_id}.")
+
+        creator_ids = list(dict.fromkeys(
+            rel["id"] for manga in mangas.values() for rel in manga["relationships"] if rel["type"] in ("author", "artist")))
+        # Tác giả đã có trong cache (kể cả vừa được mở rộng qua includes[]) không cần gọi lại
+        missing_ids = [creator_id for creator_id in creator_ids if self.cache.get("author", creator_id) is None]
+        for start in range(0, len(missing_ids), API_BATCH_SIZE):
+            self.get_authors(ids=missing_ids[start:start + API_BATCH_SIZE], limit=API_BATCH_SIZE)
+        for creator_id in creator_ids:
+            cached = self.cache.get("author", creator_id)
+            if cached is not None:
+                creators[creator_id] = cached["data"]["attributes"]
+
+        found_ids = [manga_id for manga_id in manga_ids if manga_id in mangas]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            chapters = dict(zip(found_ids, executor.map(
+                lambda manga_id: self._fetch_chapter_bundle(manga_id, existing_chapter_ids, lazy_pages), found_ids)))
+
+        bundles = []
+        for manga_id in found_ids:
+            manga = mangas[manga_id]
+            cover = next((rel for rel in manga["relationships"] if rel["type"] == "cover_art"), None)
+            cover_url = None
+            if cover and cover.get("attributes"):
+                # includes[]=cover_art đã trả về fileName, không cần gọi /cover/{id}
+                cover_url = f"https://uploads.mangadex.org/covers/{manga_id}/{cover['attributes']['fileName']}"
+            bundles.append({
+                "manga": manga,
+                "cover_url": cover_url,
+                "score": stats.get(manga_id, {}).get("rating", {}).get("average", None),
+                "creators": [(rel["id"], rel["type"], creators[rel["id"]]) for rel in manga["relationships"]
+                             if rel["type"] in ("author", "artist") and rel["id"] in creators],
+                "chapters": chapters[manga_id]
+            })
+        return bundles
+
+    def _collect_manga_rows(self, bundle, user_id, rows=None):
+        """Gom một manga đã tải thành các dòng theo từng bảng, khử trùng lặp theo cột khóa."""
+        if rows is None:
+            rows = {table: {} for table, _, _, _ in BULK_TABLES}
+        key_positions = {table: [columns.index(k) for k in keys] for table, columns, keys, _ in BULK_TABLES}
+
+        def add(table, *values):
+            rows[table][tuple(values[i] for i in key_positions[table])] = values
+
+        manga = bundle["manga"]
+        manga_id = manga["id"]
+        attr = manga["attributes"]
+        title = attr["title"].get("en", next(iter(attr["title"].values()), ""))
+        description = attr["description"].get("en", next(iter(attr["description"].values()), ""))
+        add("Manga", manga_id, manga["type"], title, description, bundle["cover_url"], bundle["score"],
+            attr["originalLanguage"], attr.get("lastChapter", None), attr.get("publicationDemographic", None),
+            attr["status"], attr.get("year", None), attr["contentRating"],
+            _to_sql_datetime(attr["createdAt"]), _to_sql_datetime(attr["updatedAt"]))
+
+        for alt_title in attr.get("altTitles", []):
+            for lang, title_text in alt_title.items():
+                add("AltTitles", manga_id, lang, title_text)
+        for tag in attr.get("tags", []):
+            add("MangaByTags", tag["id"], manga_id)
+        for lang in attr.get("availableTranslatedLanguages", []):
+            add("AvailableTranslatedLanguages", manga_id, lang)
+
+        roles = {}
+        for creator_id, role, creator_attr in bundle["creators"]:
+            roles.setdefault(creator_id, []).append(role)
+            add("Creator", creator_id, creator_attr.get("name", "Unknown"), (creator_attr.get("biography") or {}).get("en", ""))
+            for platform, url in (creator_attr.get("social") or {}).items():
+                add("CreatorSocialMedia", creator_id, platform, url)
+        for creator_id, creator_roles in roles.items():
+            add("CreatorMangaWorks", creator_id, manga_id, ",".join(dict.fromkeys(creator_roles)))
+
+        for lang, ch, image_urls in bundle["chapters"]:
+            ch_attr = ch["attributes"]
+            add("Chapter", ch["id"], manga_id, ch_attr.get("chapter", ""), ch_attr.get("title", ""), lang,
+                _to_sql_datetime(ch_attr["publishAt"]), len(image_urls) if image_urls else ch_attr.get("pages"))
+            for idx, page_url in enumerate(image_urls or [], start=1):
+                add("Page", ch["id"], idx, page_url)
+
+        add("UsersMangaDownloads", user_id, manga_id)
+        return rows
+
+    def _merge_rows(self, rows, cursor=None):
+        """Đẩy từng bảng vào bảng tạm bằng fast_executemany rồi upsert bằng một câu MERGE."""
+        cursor = cursor or self.cursor
+        cursor.fast_executemany = True
+        for table, columns, keys, update_columns in BULK_TABLES:
+            values = list(rows.get(table, {}).values())
+            if not values:
+                continue
+            staging = f"#stg_{table}"
+            column_list = ", ".join(columns)
+            cursor.execute(f"SELECT TOP 0 {column_list} INTO {staging} FROM {table}")
+            cursor.executemany(
+                f"INSERT INTO {staging} ({column_list}) VALUES ({', '.join('?' for _ in columns)})", values)
+
+            on_clause = " AND ".join(f"tgt.{k} = src.{k}" for k in keys)
+            matched_clause = BULK_MATCHED_CLAUSES.get(table, "")
+            if update_columns:
+                changed = " OR ".join(f"ISNULL(tgt.{c}, '') <> ISNULL(src.{c}, '')" for c in update_columns)
+                assignments = ", ".join(f"tgt.{c} = src.{c}" for c in update_columns)
+                matched_clause = f"WHEN MATCHED AND ({changed}) THEN UPDATE SET {assignments}"
+            cursor.execute(f"""
+                MERGE {table} WITH (HOLDLOCK) AS tgt
+                USING (SELECT s.* FROM {staging} s {BULK_SOURCE_FILTERS.get(table, "")}) AS src
+                ON {on_clause}
+                {matched_clause}
+                WHEN NOT MATCHED BY TARGET THEN
+                    INSERT ({column_list}) VALUES ({", ".join(f"src.{c}" for c in columns)});
+            """)
+            cursor.execute(f"DROP TABLE {staging}")
+            logger.info(f"MERGE {table}: {len(values)} dòng.")
+
+    def _save_manga_to_db_bulk(self, manga_id, user_id, lazy_pages=False):
+        try:
+            self.cursor.execute("SELECT chapterId FROM Chapter WHERE mangaId = ?", manga_id)
+            existing_chapter_ids = {row[0] for row in self.cursor.fetchall()}
+            bundle = self._fetch_manga_bundle(manga_id, existing_chapter_ids, lazy_pages)
+            if bundle is None:
+                return False
+            self._merge_rows(self._collect_manga_rows(bundle, user_id))
+            self.conn.commit()
+            logger.info(f"Đã lưu manga {manga_id} vào cơ sở dữ liệu (ghi hàng loạt).")
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Lỗi khi lưu manga {manga_id}: {e}")
+            return False
+        finally:
+            self.close_db()
+
+    def _write_rows(self, pool, rows, manga_count):
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                self._merge_rows(rows, cursor)
+                conn.commit()
+                logger.info(f"Đã commit {manga_count} manga.")
+                return manga_count
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Lỗi khi ghi lô {manga_count} manga: {e}")
+                return 0
+            finally:
+                cursor.close()
+
+    def save_mangas_to_db(self, manga_ids, user_id, chunk_size=50, max_workers=4, pool_size=2, lazy_pages=False):
+        """Lưu nhiều manga cùng lúc (ví dụ cả thư viện của một người dùng).
+
+        Metadata, thống kê và tác giả được lấy theo lô /manga?ids[], /statistics/manga?manga[]
+        và /author?ids[]; chương của các manga được lấy song song. Mỗi chunk_size manga được
+        ghi bằng đường MERGE hàng loạt trong một transaction, trên một pool nhỏ kết nối pyodbc
+        nên việc ghi lô trước chồng lên việc tải lô sau. lazy_pages giống save_manga_to_db.
+        Trả về số manga đã lưu.
+        """
+        if not self.db_conn_str:
+            logger.warning("Không có chuỗi kết nối cơ sở dữ liệu.")
+            return 0
+
+        pool = DBConnectionPool(self.db_conn_str, pool_size)
+        saved = 0
+        try:
+            with ThreadPoolExecutor(max_workers=pool_size) as writer:
+                pending = []
+                for start in range(0, len(manga_ids), chunk_size):
+                    chunk = manga_ids[start:start + chunk_size]
+                    with pool.connection() as conn:
+                        cursor = conn.cursor()
+                        cursor.execute(f"SELECT chapterId FROM Chapter WHERE mangaId IN ({', '.join('?' for _ in chunk)})", *chunk)
+                        existing_chapter_ids = {row[0] for row in cursor.fetchall()}
+                        cursor.close()
+
+                    rows = None
+                    bundles = self._fetch_manga_bundles(chunk, existing_chapter_ids, max_workers, lazy_pages)
+                    for bundle in bundles:
+                        rows = self._collect_manga_rows(bundle, user_id, rows)
+                    if rows is None:
+                        continue
+                    # Giới hạn số lô đang chờ ghi để bộ nhớ không phình khi DB chậm hơn mạng
+                    if len(pending) >= pool_size:
+                        saved += pending.pop(0).result()
+                    pending.append(writer.submit(self._write_rows, pool, rows, len(bundles)))
+                for future in pending:
+                    saved += future.result()
+        finally:
+            pool.close()
+
+        logger.info(f"Đã lưu {saved}/{len(manga_ids)} manga vào cơ sở dữ liệu.")
+        return saved
+
+    def save_manga_to_db(self, manga_id, user_id, bulk=False, lazy_pages=False):
+        """Lưu thông tin manga, chương, và các dữ liệu liên quan vào cơ sở dữ liệu.
+
+        Với bulk=True toàn bộ dữ liệu mạng được tải trước, sau đó mỗi bảng chỉ tốn một lượt
+        fast_executemany vào bảng tạm và một câu MERGE thay vì SELECT + INSERT cho từng dòng.
+        Với lazy_pages=True không gọi /at-home/server cho từng chương và không ghi bảng Page:
+        totalPages lấy từ attributes của chương, URL trang được lấy khi cần qua get_chapter_images.
+        """
         if not self.connect_db():
             return False
+        if bulk:
+            return self._save_manga_to_db_bulk(manga_id, user_id, lazy_pages)
 
         try:
             # Lấy thông tin manga
@@ -448,10 +1002,7 @@ class MangaDexAPI:
 
             # Lưu chương
             for lang in self.language_priority:
-                chapters_data = self.get_chapters(manga_id=manga_id, translated_language=[lang], includes=["scanlation_group"])
-                if not chapters_data or not chapters_data.get("data"):
-                    continue
-                for ch in chapters_data["data"]:
+                for ch in self.iter_chapters(manga_id=manga_id, translated_language=[lang], includes=["scanlation_group"]):
                     chapter_id = ch["id"]
                     chapter_attr = ch["attributes"]
                     chapter_number = chapter_attr.get("chapter", "")
@@ -463,6 +1014,10 @@ class MangaDexAPI:
                             INSERT INTO Chapter (chapterId, mangaId, chapterNumber, chapterTitle, translatedLanguage, publishedAt)
                             VALUES (?, ?, ?, ?, ?, ?)
                         """, chapter_id, manga_id, chapter_number, chapter_title, lang, published_at)
+                        if lazy_pages:
+                            self.cursor.execute("UPDATE Chapter SET totalPages = ? WHERE chapterId = ?",
+                                               chapter_attr.get("pages"), chapter_id)
+                            continue
                         image_urls = self.get_chapter_images(chapter_id, quality="data")
                         if image_urls:
                             total_pages = len(image_urls)
@@ -493,35 +1048,107 @@ class MangaDexAPI:
         finally:
             self.close_db()
 
-    def download_manga(self, manga_id, manga_title, save_path="DB"):
-        """Tải toàn bộ chương của manga và lưu vào thư mục."""
-        list_chapters = {}
-        chapters_data = self.get_chapters(manga_id=manga_id, limit=100, order={"chapter": "asc"})
-        if not chapters_data or not chapters_data.get("data"):
+    def _plan_rank(self, entry):
+        """Khóa so sánh bản dịch: nhỏ hơn là tốt hơn."""
+        if entry["group_id"] in self.preferred_groups:
+            group_rank = self.preferred_groups.index(entry["group_id"])
+        else:
+            group_rank = len(self.preferred_groups) + (0 if entry["group_id"] else 1)
+        return (self.language_priority.index(entry["language"]), group_rank, -(entry["pages"] or 0))
+
+    def plan_manga_download(self, manga_id):
+        """Duyệt toàn bộ feed và chọn một bản dịch tốt nhất cho mỗi số chương.
+
+        Thứ tự ưu tiên: language_priority, nhóm dịch trong preferred_groups (rồi tới chương có
+        nhóm dịch), cuối cùng là chương nhiều trang hơn.
+        """
+        best = {}
+        for chapter in self.iter_chapters(manga_id=manga_id, translated_language=self.language_priority, includes=["scanlation_group"]):
+            attr = chapter["attributes"]
+            if attr.get("translatedLanguage") not in self.language_priority:
+                continue
+            entry = {
+                "chapter": attr.get("chapter", "Unknown"),
+                "chapter_id": chapter["id"],
+                "language": attr["translatedLanguage"],
+                "group_id": next((rel["id"] for rel in chapter.get("relationships", []) if rel["type"] == "scanlation_group"), None),
+                "pages": attr.get("pages", 0),
+                "downloaded": False
+            }
+            current = best.get(entry["chapter"])
+            if current is None or self._plan_rank(entry) < self._plan_rank(current):
+                best[entry["chapter"]] = entry
+        return sorted(best.values(), key=lambda e: _chapter_sort_key(e["chapter"]))
+
+    def load_manifest(self, manga_folder):
+        """Đọc manifest của lần tải trước (nếu có)."""
+        path = os.path.join(manga_folder, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f).get("chapters", [])
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không đọc được manifest {path}: {e}")
+            return []
+
+    def write_manifest(self, manga_folder, manga_id, plan):
+        """Ghi kế hoạch tải ra manifest.json (sắp xếp ổn định để có thể diff giữa các lần chạy)."""
+        os.makedirs(manga_folder, exist_ok=True)
+        path = os.path.join(manga_folder, MANIFEST_FILE)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "manga_id": manga_id,
+                "language_priority": self.language_priority,
+                "chapters": plan
+            }, f, indent=2, ensure_ascii=False, sort_keys=True)
+        os.replace(f"{path}.tmp", path)
+
+    def download_manga(self, manga_id, manga_title, save_path="DB", concurrent=False, post_processor=None):
+        """Lập kế hoạch rồi tải toàn bộ chương của manga vào thư mục.
+
+        Mỗi số chương chỉ được tải đúng một bản dịch. Chương đã tải ở lần chạy trước (cùng
+        chapter_id trong manifest) được bỏ qua; chương được thay bằng bản dịch tốt hơn sẽ tải lại.
+        """
+        if concurrent and post_processor is None:
+            # Dùng chung một process pool cho mọi chương (không khởi động lại process cho từng chương);
+            # chương chỉ được đánh dấu đã tải khi các trang của nó đã chuyển định dạng xong
+            with ImagePostProcessor() as processor:
+                return self.download_manga(manga_id, manga_title, save_path, concurrent, processor)
+
+        manga_folder = os.path.join(save_path, manga_title)
+        previous = {entry["chapter"]: entry for entry in self.load_manifest(manga_folder)}
+        plan = self.plan_manga_download(manga_id)
+        if not plan:
             logger.error(f"Không tìm thấy chương cho manga {manga_id}.")
             return False
 
-        total_chapters = len(chapters_data["data"])
-        for index, chapter in enumerate(chapters_data["data"], start=1):
-            chapter_number = chapter["attributes"].get("chapter", "Unknown")
-            available_languages = chapter["attributes"].get("translatedLanguage", [])
-            selected_lang = next((lang for lang in self.language_priority if lang in available_languages), None)
-            if not selected_lang:
-                continue
+        for entry in plan:
+            old = previous.get(entry["chapter"])
+            entry["downloaded"] = bool(old and old["chapter_id"] == entry["chapter_id"] and old.get("downloaded"))
+        self.write_manifest(manga_folder, manga_id, plan)
+        pending = [entry for entry in plan if not entry["downloaded"]]
+        logger.info(f"Kế hoạch tải {manga_title}: {len(plan)} chương, {len(pending)} chương cần tải.")
 
-            if chapter_number not in list_chapters:
-                list_chapters[chapter_number] = selected_lang
-            elif list_chapters[chapter_number] == "en" and selected_lang == "vi":
-                list_chapters[chapter_number] = "vi"
-            else:
-                continue
+        try:
+            for index, entry in enumerate(pending, start=1):
+                chapter_number = entry["chapter"]
+                old = previous.get(chapter_number)
+                if old and old["chapter_id"] != entry["chapter_id"]:
+                    # Đã có bản dịch tốt hơn: xóa bản cũ để không lẫn trang của hai bản
+                    shutil.rmtree(os.path.join(manga_folder, f"Chapter {chapter_number}"), ignore_errors=True)
 
-            chapter_id = chapter["id"]
-            success = self.download_chapter_images(chapter_id, manga_title, chapter_number, save_path)
-            if success:
-                logger.info(f"Đã tải chương {chapter_number}/{total_chapters} ({self.map_languages.get(selected_lang)}).")
-            else:
-                logger.warning(f"Thất bại khi tải chương {chapter_number}.")
+                downloaded_pages, total_pages = self.download_chapter_pages(entry["chapter_id"], manga_title, chapter_number, save_path, concurrent=concurrent, post_processor=post_processor)
+                # Thiếu dù chỉ một trang thì chương vẫn ở trạng thái chưa tải để lần chạy sau tải lại
+                entry["downloaded"] = total_pages > 0 and downloaded_pages == total_pages
+                if entry["downloaded"]:
+                    logger.info(f"Đã tải chương {chapter_number} ({index}/{len(pending)}, {self.map_languages.get(entry['language'])}).")
+                else:
+                    logger.warning(f"Thất bại khi tải chương {chapter_number} ({downloaded_pages}/{total_pages} trang).")
+                if index % MANIFEST_FLUSH_INTERVAL == 0:
+                    self.write_manifest(manga_folder, manga_id, plan)
+        finally:
+            self.write_manifest(manga_folder, manga_id, plan)
 
         logger.info(f"Hoàn thành tải manga {manga_title}.")
         return True
@@ -529,4 +1156,5 @@ class MangaDexAPI:
     def close(self):
         """Đóng session HTTP."""
         self.session.close()
-        self.close_db()
\ No newline at end of file
+        self.close_db()
+        self.cache.close()
\ No newline at end of file
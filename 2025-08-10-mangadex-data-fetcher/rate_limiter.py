@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+
+# Giới hạn toàn cục MangaDex công bố: ~5 request/giây cho mỗi IP
+MANGADEX_GLOBAL_RATE = 5
+# /at-home/server/{id} bị giới hạn chặt hơn: 40 request/phút
+MANGADEX_AT_HOME_RATE = 40 / 60
+
+
+class AsyncTokenBucket:
+    """Token bucket dùng chung cho nhiều coroutine trên cùng một event loop."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, tokens=1):
+        """Chờ đến khi đủ token rồi trừ đi. Các coroutine được phục vụ theo thứ tự FIFO."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Tạm dừng toàn bộ bucket, ví dụ khi server trả về Retry-After."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.updated_at = self.paused_until
+        self.tokens = 0
+
+
+class TokenBucket:
+    """Token bucket thread-safe cho code đồng bộ (requests) chạy trên nhiều thread."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens=1):
+        """Block đến khi đủ token rồi trừ đi."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= tokens:
+                        self.tokens -= tokens
+                        return
+                    wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Tạm dừng toàn bộ bucket, mọi thread đang chờ đều phải đợi hết khoảng này."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.updated_at = self.paused_until
+            self.tokens = 0
+
+
+class AIMDController:
+    """Điều khiển tốc độ và số request đồng thời theo kiểu AIMD (như TCP congestion control).
+
+    - Mỗi response tốt (latency dưới latency_target) tăng cộng: rate thêm ~increase req/s
+      mỗi giây, cửa sổ đồng thời thêm ~1 sau mỗi cửa sổ request thành công
+    - 429, 5xx, lỗi mạng hoặc latency vượt ngưỡng giảm nhân (×decrease), tối đa một lần
+      mỗi cooldown giây để một loạt lỗi cùng lúc không đẩy tốc độ xuống đáy
+    - Retry-After tạm dừng toàn bộ bucket, áp dụng cho mọi thread chứ không riêng request đó
+    """
+
+    def __init__(self, max_rate, min_rate=0.2, initial_rate=None, max_window=8, min_window=1,
+                 initial_window=None, increase=0.25, decrease=0.5, latency_target=2.0, cooldown=1.0):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.max_window = max_window
+        self.min_window = min_window
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.bucket = TokenBucket(initial_rate or max_rate / 2, capacity=1)
+        self.window = float(initial_window or max(min_window, max_window // 2))
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def acquire(self):
+        """Chờ một chỗ trong cửa sổ đồng thời rồi một token. Phải gọi release() sau đó."""
+        with self._cond:
+            while self.in_flight >= int(self.window):
+                self._cond.wait()
+            self.in_flight += 1
+        self.bucket.acquire()
+        return time.monotonic()
+
+    def release(self, started_at, ok=True, retry_after=None):
+        """Ghi nhận kết quả của request bắt đầu lúc started_at (giá trị acquire() trả về)."""
+        latency = time.monotonic() - started_at
+        with self._cond:
+            self.in_flight -= 1
+            if retry_after:
+                self.bucket.pause(retry_after)
+            if ok and latency <= self.latency_target:
+                self.window = min(self.max_window, self.window + 1 / self.window)
+                with self.bucket._lock:
+                    self.bucket.rate = min(self.max_rate, self.bucket.rate + self.increase / self.bucket.rate)
+            else:
+                now = time.monotonic()
+                if now - self.last_decrease >= self.cooldown:
+                    self.last_decrease = now
+                    self.window = max(self.min_window, self.window * self.decrease)
+                    with self.bucket._lock:
+                        self.bucket.rate = max(self.min_rate, self.bucket.rate * self.decrease)
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """Trạng thái hiện tại để ghi log."""
+        with self._cond:
+            return {
+                "rate": round(self.bucket.rate, 2),
+                "window": round(self.window, 2),
+                "in_flight": self.in_flight,
+                "paused_for": round(max(0.0, self.bucket.paused_until - time.monotonic()), 2)
+            }
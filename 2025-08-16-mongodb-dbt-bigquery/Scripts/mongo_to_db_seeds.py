@@ -8,10 +8,14 @@ Có thể chạy:
         --db "manga_raw_data" \
         --seed-dir "D:\\Projects\\Học DE\\data-engineering-learning\\2025-08-16\\mongo_to_db\\seeds"
 
-Yêu cầu: pip install pymongo pandas
+Xuất Parquet có kiểu (nạp bằng bq load) thay cho CSV:
+    python mongo_to_db_seeds.py --format parquet [--nested] [--compression snappy]
+
+Yêu cầu: pip install pymongo pandas (Parquet: pyarrow pyyaml)
 """
 
 import argparse
+import functools
 import os
 import re
 from typing import Any, Dict, Iterable, List, Optional
@@ -171,6 +175,16 @@ def write_csv(df: pd.DataFrame, seed_dir: str, filename: str):
     
     print(f"[OK]  {filename}: {len(df)} rows")
 
+def write_parquet(df: pd.DataFrame, seed_dir: str, filename: str, compression: str = "zstd",
+                  schema_path: Optional[str] = None):
+    """Ghi bảng ra <tên>.parquet với kiểu cột từ schema.yml (không cần các bước sửa year/datetime của CSV)."""
+    from parquet_seeds import ParquetSeedWriter
+    writer = ParquetSeedWriter(seed_dir, os.path.splitext(filename)[0], schema_path, compression=compression)
+    if df is not None and not df.empty:
+        writer.write_frame(df.dropna(how='all'))
+    writer.close()
+    print(f"[OK]  {writer.filename}: {writer.rows_out} rows")
+
 def get_attr(d: Dict, *keys, default=None):
     cur = d
     for k in keys:
@@ -190,7 +204,7 @@ def as_list(x: Any) -> List:
 # ------------------------------
 # Extractors cho từng collection
 # ------------------------------
-def extract_mangadex_manga(col, seed_dir: str):
+def extract_mangadex_manga(col, seed_dir: str, write=write_csv, nested: bool = False):
     docs = list(col.find({}))
     print(f"[mangadex_manga] {len(docs)} docs")
 
@@ -242,22 +256,18 @@ def extract_mangadex_manga(col, seed_dir: str):
             "chapter_numbers_reset_on_new_volume": a.get("chapterNumbersResetOnNewVolume"),
         })
 
-        for alt in as_list(a.get("altTitles")):
-            if not isinstance(alt, dict):
-                continue
-            for lang, val in alt.items():
-                alt_rows.append({
-                    "manga_id": d.get("id"),
-                    "lang_code": lang,
-                    "alt_title": val
-                })
-
-        for lang, val in (a.get("description") or {}).items():
-            desc_rows.append({
-                "manga_id": d.get("id"),
-                "lang_code": lang,
-                "description": val
-            })
+        alt_titles = [{"lang_code": lang, "alt_title": val}
+                      for alt in as_list(a.get("altTitles")) if isinstance(alt, dict)
+                      for lang, val in alt.items()]
+        descriptions = [{"lang_code": lang, "description": val}
+                        for lang, val in (a.get("description") or {}).items()]
+        if nested:
+            # Giữ thành cột lặp của dim_manga thay vì bảng bridge
+            dim_rows[-1]["alt_titles"] = alt_titles
+            dim_rows[-1]["descriptions"] = descriptions
+        else:
+            alt_rows.extend({"manga_id": d.get("id"), **t} for t in alt_titles)
+            desc_rows.extend({"manga_id": d.get("id"), **t} for t in descriptions)
 
         links = a.get("links")
         if isinstance(links, dict):
@@ -309,15 +319,16 @@ def extract_mangadex_manga(col, seed_dir: str):
             # Đảm bảo format datetime đúng
             df[col] = df[col].astype(str).str.replace('Z', '').str.replace('+00:00', '')
     
-    write_csv(df, seed_dir, "dim_manga.csv")
-    write_csv(pd.DataFrame(alt_rows), seed_dir, "bridge_manga_alttitle.csv")
-    write_csv(pd.DataFrame(desc_rows), seed_dir, "bridge_manga_description.csv")
-    write_csv(pd.DataFrame(link_rows), seed_dir, "bridge_manga_links.csv")
-    write_csv(pd.DataFrame(tag_rows), seed_dir, "bridge_manga_tag.csv")
-    write_csv(pd.DataFrame(rel_rows), seed_dir, "bridge_manga_relationship.csv")
+    write(df, seed_dir, "dim_manga.csv")
+    if not nested:
+        write(pd.DataFrame(alt_rows), seed_dir, "bridge_manga_alttitle.csv")
+        write(pd.DataFrame(desc_rows), seed_dir, "bridge_manga_description.csv")
+    write(pd.DataFrame(link_rows), seed_dir, "bridge_manga_links.csv")
+    write(pd.DataFrame(tag_rows), seed_dir, "bridge_manga_tag.csv")
+    write(pd.DataFrame(rel_rows), seed_dir, "bridge_manga_relationship.csv")
 
 
-def extract_mangadex_creators(col, seed_dir: str):
+def extract_mangadex_creators(col, seed_dir: str, write=write_csv, nested: bool = False):
     docs = list(col.find({}))
     print(f"[mangadex_creators] {len(docs)} docs")
 
@@ -351,12 +362,11 @@ def extract_mangadex_creators(col, seed_dir: str):
             "youtube": a.get("youtube")
         })
 
-        for lang, val in (a.get("biography") or {}).items():
-            bio_rows.append({
-                "creator_id": data.get("id"),
-                "lang_code": lang,
-                "biography": val
-            })
+        biography = [{"lang_code": lang, "biography": val} for lang, val in (a.get("biography") or {}).items()]
+        if nested:
+            dim_rows[-1]["biography"] = biography
+        else:
+            bio_rows.extend({"creator_id": data.get("id"), **b} for b in biography)
 
         for r in as_list(data.get("relationships")):
             rel_rows.append({
@@ -365,12 +375,13 @@ def extract_mangadex_creators(col, seed_dir: str):
                 "related_type": r.get("type")
             })
 
-    write_csv(pd.DataFrame(dim_rows), seed_dir, "dim_creator.csv")
-    write_csv(pd.DataFrame(bio_rows), seed_dir, "bridge_creator_biography.csv")
-    write_csv(pd.DataFrame(rel_rows), seed_dir, "bridge_creator_relationship.csv")
+    write(pd.DataFrame(dim_rows), seed_dir, "dim_creator.csv")
+    if not nested:
+        write(pd.DataFrame(bio_rows), seed_dir, "bridge_creator_biography.csv")
+    write(pd.DataFrame(rel_rows), seed_dir, "bridge_creator_relationship.csv")
 
 
-def extract_mangadex_cover_arts(col, seed_dir: str):
+def extract_mangadex_cover_arts(col, seed_dir: str, write=write_csv, nested: bool = False):
     docs = list(col.find({}))
     print(f"[mangadex_cover_arts] {len(docs)} docs")
 
@@ -399,11 +410,11 @@ def extract_mangadex_cover_arts(col, seed_dir: str):
                 "related_type": r.get("type")
             })
 
-    write_csv(pd.DataFrame(dim_rows), seed_dir, "dim_cover_art.csv")
-    write_csv(pd.DataFrame(rel_rows), seed_dir, "bridge_cover_relationship.csv")
+    write(pd.DataFrame(dim_rows), seed_dir, "dim_cover_art.csv")
+    write(pd.DataFrame(rel_rows), seed_dir, "bridge_cover_relationship.csv")
 
 
-def extract_mangadex_related(col, seed_dir: str):
+def extract_mangadex_related(col, seed_dir: str, write=write_csv, nested: bool = False):
     docs = list(col.find({}))
     print(f"[mangadex_related] {len(docs)} docs")
 
@@ -420,10 +431,10 @@ def extract_mangadex_related(col, seed_dir: str):
                 "relation_type": r.get("related")
             })
 
-    write_csv(pd.DataFrame(rows), seed_dir, "bridge_related.csv")
+    write(pd.DataFrame(rows), seed_dir, "bridge_related.csv")
 
 
-def extract_mangadex_tags(col, seed_dir: str):
+def extract_mangadex_tags(col, seed_dir: str, write=write_csv, nested: bool = False):
     docs = list(col.find({}))
     print(f"[mangadex_tags] {len(docs)} docs")
 
@@ -440,26 +451,22 @@ def extract_mangadex_tags(col, seed_dir: str):
             "name_en": get_attr(a, "name", "en"),
         })
 
-        for lang, val in (a.get("name") or {}).items():
-            name_rows.append({
-                "tag_id": tag_id,
-                "lang_code": lang,
-                "tag_name": val
-            })
-
-        for lang, val in (a.get("description") or {}).items():
-            desc_rows.append({
-                "tag_id": tag_id,
-                "lang_code": lang,
-                "description": val
-            })
+        names = [{"lang_code": lang, "tag_name": val} for lang, val in (a.get("name") or {}).items()]
+        descriptions = [{"lang_code": lang, "description": val} for lang, val in (a.get("description") or {}).items()]
+        if nested:
+            dim_rows[-1]["names"] = names
+            dim_rows[-1]["descriptions"] = descriptions
+        else:
+            name_rows.extend({"tag_id": tag_id, **n} for n in names)
+            desc_rows.extend({"tag_id": tag_id, **t} for t in descriptions)
 
-    write_csv(pd.DataFrame(dim_rows), seed_dir, "dim_tag.csv")
-    write_csv(pd.DataFrame(name_rows), seed_dir, "bridge_tag_name.csv")
-    write_csv(pd.DataFrame(desc_rows), seed_dir, "bridge_tag_description.csv")
+    write(pd.DataFrame(dim_rows), seed_dir, "dim_tag.csv")
+    if not nested:
+        write(pd.DataFrame(name_rows), seed_dir, "bridge_tag_name.csv")
+        write(pd.DataFrame(desc_rows), seed_dir, "bridge_tag_description.csv")
 
 
-def extract_mangadex_statistics(col, seed_dir: str):
+def extract_mangadex_statistics(col, seed_dir: str, write=write_csv, nested: bool = False):
     docs = list(col.find({}))
     print(f"[mangadex_statistics] {len(docs)} docs")
 
@@ -482,6 +489,9 @@ def extract_mangadex_statistics(col, seed_dir: str):
         })
 
         comments = stat.get("comments")
+        # Cùng cột với delta_fact_statistics của mongo_to_dbt_optimized.py (model incremental fact_statistics)
+        fact_rows[-1]["comments_thread_id"] = comments.get("threadId") if isinstance(comments, dict) else None
+        fact_rows[-1]["comments_replies_count"] = comments.get("repliesCount") if isinstance(comments, dict) else None
         if isinstance(comments, dict):
             cm_rows.append({
                 "stat_id": d.get("_id"),
@@ -489,11 +499,11 @@ def extract_mangadex_statistics(col, seed_dir: str):
                 "replies_count": comments.get("repliesCount")
             })
 
-    write_csv(pd.DataFrame(fact_rows), seed_dir, "fact_statistics.csv")
-    write_csv(pd.DataFrame(cm_rows), seed_dir, "fact_statistics_comments.csv")
+    write(pd.DataFrame(fact_rows), seed_dir, "delta_fact_statistics.csv")
+    write(pd.DataFrame(cm_rows), seed_dir, "fact_statistics_comments.csv")
 
 
-def extract_mangadex_chapters(col, seed_dir: str):
+def extract_mangadex_chapters(col, seed_dir: str, write=write_csv, nested: bool = False):
     docs = list(col.find({}))
     print(f"[mangadex_chapters] {len(docs)} docs")
 
@@ -527,11 +537,11 @@ def extract_mangadex_chapters(col, seed_dir: str):
                 "related_type": r.get("type")
             })
 
-    write_csv(pd.DataFrame(dim_rows), seed_dir, "dim_chapter.csv")
-    write_csv(pd.DataFrame(rel_rows), seed_dir, "bridge_chapter_relationship.csv")
+    write(pd.DataFrame(dim_rows), seed_dir, "dim_chapter.csv")
+    write(pd.DataFrame(rel_rows), seed_dir, "bridge_chapter_relationship.csv")
 
 
-def extract_mangadex_groups(col, seed_dir: str):
+def extract_mangadex_groups(col, seed_dir: str, write=write_csv, nested: bool = False):
     docs = list(col.find({}))
     print(f"[mangadex_groups] {len(docs)} docs")
 
@@ -563,21 +573,16 @@ def extract_mangadex_groups(col, seed_dir: str):
             "version": a.get("version"),
         })
 
-        for alt in as_list(a.get("altNames")):
-            if not isinstance(alt, dict):
-                continue
-            for lang, val in alt.items():
-                alt_rows.append({
-                    "group_id": data.get("id"),
-                    "lang_code": lang,
-                    "alt_name": val
-                })
-
-        for lang in as_list(a.get("focusedLanguages")):
-            lang_rows.append({
-                "group_id": data.get("id"),
-                "lang_code": lang
-            })
+        alt_names = [{"lang_code": lang, "alt_name": val}
+                     for alt in as_list(a.get("altNames")) if isinstance(alt, dict)
+                     for lang, val in alt.items()]
+        languages = as_list(a.get("focusedLanguages"))
+        if nested:
+            dim_rows[-1]["alt_names"] = alt_names
+            dim_rows[-1]["focused_languages"] = languages
+        else:
+            alt_rows.extend({"group_id": data.get("id"), **n} for n in alt_names)
+            lang_rows.extend({"group_id": data.get("id"), "lang_code": lang} for lang in languages)
 
         for r in as_list(data.get("relationships")):
             rel_rows.append({
@@ -586,10 +591,11 @@ def extract_mangadex_groups(col, seed_dir: str):
                 "related_type": r.get("type")
             })
 
-    write_csv(pd.DataFrame(dim_rows), seed_dir, "dim_group.csv")
-    write_csv(pd.DataFrame(alt_rows), seed_dir, "bridge_group_altname.csv")
-    write_csv(pd.DataFrame(lang_rows), seed_dir, "bridge_group_language.csv")
-    write_csv(pd.DataFrame(rel_rows), seed_dir, "bridge_group_relationship.csv")
+    write(pd.DataFrame(dim_rows), seed_dir, "dim_group.csv")
+    if not nested:
+        write(pd.DataFrame(alt_rows), seed_dir, "bridge_group_altname.csv")
+        write(pd.DataFrame(lang_rows), seed_dir, "bridge_group_language.csv")
+    write(pd.DataFrame(rel_rows), seed_dir, "bridge_group_relationship.csv")
 
 
 # ------------------------------
@@ -602,9 +608,25 @@ def main():
     parser.add_argument("--seed-dir", default=r"D:\Projects\Học DE\data-engineering-learning\2025-08-16\mongo_to_db\seeds", help="Output seeds directory")
     # Cho phép bỏ qua collection nào đó nếu muốn
     parser.add_argument("--skip", nargs="*", default=[], help="Danh sách collection (alias) muốn bỏ qua. Ví dụ: mangadex_groups mangadex_chapters")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="csv cho dbt seed, parquet cho bq load")
+    parser.add_argument("--compression", choices=["zstd", "snappy"], default="zstd", help="Codec nén Parquet")
+    parser.add_argument("--schema", default=None, help="schema.yml chứa data_type của các cột (mặc định: <seed-dir>/schema.yml)")
+    parser.add_argument("--nested", action="store_true", help="Chỉ với parquet: giữ alt title, description, biography... thành cột lặp thay vì bảng bridge")
     args = parser.parse_args()
+    if args.nested and args.format != "parquet":
+        parser.error("--nested chỉ dùng được với --format parquet")
 
     ensure_dir(args.seed_dir)
+    # fact_statistics giờ là model incremental (models/facts); seed cùng tên còn sót lại làm dbt báo trùng tên
+    for ext in ("csv", "parquet"):
+        stale = os.path.join(args.seed_dir, f"fact_statistics.{ext}")
+        if os.path.exists(stale):
+            os.remove(stale)
+            print(f"[DEL ] {stale} (thay bằng delta_fact_statistics.{ext})")
+    if args.format == "parquet":
+        write = functools.partial(write_parquet, compression=args.compression, schema_path=args.schema)
+    else:
+        write = write_csv
 
     client = MongoClient(args.mongo_uri)
     db = client[args.db]
@@ -630,8 +652,11 @@ def main():
             continue
         print(f"[RUN ] {alias} -> '{coll_name}'")
         col = db[coll_name]
-        fn(col, args.seed_dir)
+        fn(col, args.seed_dir, write, args.nested)
 
+    if args.format == "parquet":
+        print("\nHoàn tất xuất Parquet. Nạp vào BigQuery:  bq load --source_format=PARQUET --parquet_enable_list_inference <dataset>.<table> <file>.parquet")
+        return
     print("\nHoàn tất xuất CSV seeds. Bạn có thể chạy:  dbt seed")
 
 
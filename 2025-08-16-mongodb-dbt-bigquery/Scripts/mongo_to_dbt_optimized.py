@@ -9,22 +9,56 @@ Có thể chạy:
         --mongo-uri "mongodb://localhost:27017/" \
         --db "manga_raw_data" \
         --seed-dir "D:\\Projects\\Học DE\\data-engineering-learning\\2025-08-16\\mongo_to_db\\seeds"
+
+Export hằng đêm chỉ lấy phần thay đổi kể từ lần trước (xem WATERMARK_FIELDS):
+    python mongo_to_dbt_optimized.py --incremental
 """
 
 import argparse
 import os
 import re
 import csv
+import itertools
 import logging
+import multiprocessing
+import shutil
+import threading
+from collections import defaultdict
 from typing import Any, Dict, Iterable, List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import numpy as np
 import pandas as pd
+from pandas.api.types import (is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype,
+                              is_object_dtype, is_string_dtype)
+from bson import json_util
 from pymongo import MongoClient
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 # Thiết lập logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+DEFAULT_BATCH_SIZE = 5000  # Số document mỗi chunk khi đọc cursor và ghi CSV
+
+# Collection -> trường tăng dần mỗi khi document được ghi (thời điểm fetch/snapshot, không phải updatedAt
+# của MangaDex vì document có thể được ghi muộn hơn updatedAt của nó). Chỉ các collection lớn này được export
+# theo delta vào các seed delta_* (dbt merge bằng model incremental); các collection nhỏ vẫn export toàn bộ.
+WATERMARK_FIELDS = {
+    "mangadex_chapters": "fetched_at",
+    "mangadex_statistics": "snapshotTime",
+}
+# Hai trường trên được gán trước khi document được ghi (fetch_chapters gán fetched_at lúc phân trang rồi mới
+# insert cả manga, _save_statistics chốt snapshotTime trước aggregate + insert_many, nhiều worker ghi xen kẽ),
+# nên document commit sau lần export có thể mang giá trị nhỏ hơn high. Mỗi lần đọc lại từ watermark - lag.
+WATERMARK_LAG = timedelta(hours=1)
+
+# Tên seed trước khi có model incremental cùng tên trong models/facts; file còn sót lại làm dbt báo trùng tên
+LEGACY_SEEDS = ("fact_statistics", "fact_manga_trends", "fact_chapters", "bridge_chapter_group")
+
+# Collection có nhiều document hơn ngưỡng này được chia thành các khoảng _id và ép phẳng song song
+# trong process pool (phần ép phẳng là Python thuần, bị GIL giới hạn ở một core nếu chạy bằng thread).
+PARTITION_MIN_DOCS = 200_000
+PARTITIONS_PER_PROCESS = 2  # Nhiều partition hơn số process để process xong sớm nhận tiếp phần còn lại
+
 # ------------------------------
 # Helpers
 # ------------------------------
@@ -43,6 +77,9 @@ def clean_text(x: Any) -> Any:
     return x if x is not None else ""
 
 def normalize_datetime(dt_str: Any) -> Optional[str]:
+    if isinstance(dt_str, datetime):
+        # snapshotTime của collection time-series là BSON date (UTC)
+        return dt_str.replace(tzinfo=None).isoformat()
     if not dt_str or not isinstance(dt_str, str):
         return None
     if dt_str.endswith('+00:00'):
@@ -87,6 +124,123 @@ def normalize_float(x: Any) -> str:
     except (ValueError, TypeError):
         return ""
 
+# ------------------------------
+# Bản vector hoá của các hàm trên, chạy một lần cho cả cột của chunk.
+# Kết quả phải giống hệt từng byte với bản theo từng giá trị (xem test_mongo_to_dbt_optimized.py);
+# giá trị nào không chắc chắn thì rơi về hàm gốc.
+# ------------------------------
+
+try:
+    import pyarrow  # noqa: F401
+    # Các phép .str trên chuỗi pyarrow chạy bằng kernel C++ (RE2) thay vì vòng lặp Python
+    STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    STRING_DTYPE = pd.StringDtype()
+
+# \r\n -> một khoảng trắng; mọi ký tự ngoài ASCII in được (gồm \r, \n, \t, ký tự điều khiển) -> khoảng trắng
+UNPRINTABLE_PATTERN = r"\r\n|[^\x20-\x7E]"
+ISO_SECONDS_PATTERN = r"[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}(?:\+00:00|Z)?"
+ISO_SECONDS_FORMAT = "%Y-%m-%dT%H:%M:%S"
+DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+FLOAT_EXACT_INT = 2 ** 53  # Trên ngưỡng này float không còn biểu diễn đúng mọi số nguyên
+
+def _is_str_mask(s: pd.Series) -> pd.Series:
+    if is_string_dtype(s) and not is_object_dtype(s):
+        return s.notna()
+    return s.map(type).eq(str)
+
+def _valid_iso_seconds(values: np.ndarray) -> np.ndarray:
+    """Kiểm tra ngày giờ hợp lệ cho mảng chuỗi "YYYY-MM-DDTHH:MM:SS" chỉ gồm chữ số ASCII."""
+    d = values.astype("S19").view(np.uint8).reshape(-1, 19).astype(np.int64) - ord("0")
+    year = d[:, 0] * 1000 + d[:, 1] * 100 + d[:, 2] * 10 + d[:, 3]
+    month, day = d[:, 5] * 10 + d[:, 6], d[:, 8] * 10 + d[:, 9]
+    hour, minute, second = d[:, 11] * 10 + d[:, 12], d[:, 14] * 10 + d[:, 15], d[:, 17] * 10 + d[:, 18]
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = DAYS_IN_MONTH[np.clip(month - 1, 0, 11)] + ((month == 2) & leap)
+    return ((year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+            & (hour < 24) & (minute < 60) & (second < 60))
+
+def _clean_strings(s: pd.Series) -> pd.Series:
+    s = s.astype(STRING_DTYPE)
+    s = s.str.replace(UNPRINTABLE_PATTERN, " ", regex=True)
+    s = s.str.replace('"', '""', regex=False)
+    return s.str.strip(" ")
+
+def clean_series(s: pd.Series) -> pd.Series:
+    """clean_text cho cả cột. Giá trị không phải chuỗi giữ nguyên (None/NaN đều ghi ra ô rỗng)."""
+    if not (is_object_dtype(s) or is_string_dtype(s)):
+        return s
+    kind = pd.api.types.infer_dtype(s, skipna=True)
+    try:
+        if kind in ("string", "empty"):
+            return _clean_strings(s).astype(object).where(s.notna(), "")
+        if kind.startswith("mixed"):
+            mask = _is_str_mask(s)
+            if mask.any():
+                out = s.astype(object).copy()
+                out[mask] = _clean_strings(s[mask]).astype(object)
+                return out.where(s.notna(), "")
+    except (UnicodeError, ValueError):
+        # Chuỗi không mã hoá được sang UTF-8 (vd. surrogate lẻ) -> dùng bản theo từng giá trị
+        return s.map(clean_text)
+    return s
+
+def normalize_datetime_series(s: pd.Series) -> pd.Series:
+    """normalize_datetime cho cả cột."""
+    out = pd.Series([None] * len(s), index=s.index, dtype=object)
+    if is_datetime64_any_dtype(s):
+        naive = s.dt.tz_localize(None) if s.dt.tz is not None else s
+        valid = naive.notna()
+        base = naive[valid].dt.strftime(ISO_SECONDS_FORMAT)
+        micro = naive[valid].dt.microsecond
+        with_micro = base + naive[valid].dt.strftime(".%f")
+        out[valid] = base.where(micro == 0, with_micro).astype(object)
+        return out
+    if not (is_object_dtype(s) or is_string_dtype(s)):
+        return out
+
+    fast = pd.Series(False, index=s.index)
+    mask = s.notna() & _is_str_mask(s)
+    if mask.any():
+        strs = s[mask].astype(STRING_DTYPE)
+        shaped = strs.str.fullmatch(ISO_SECONDS_PATTERN).fillna(False).astype(bool)
+        base = strs[shaped].str.slice(0, 19).astype(object)
+        # Ngày không tồn tại (30/02, năm 0000, giây 60...) để hàm gốc quyết định
+        ok = base.index[_valid_iso_seconds(base.to_numpy())] if len(base) else base.index
+        out[ok] = base[ok]
+        fast[ok] = True
+    rest = s.notna() & ~fast
+    if rest.any():
+        out[rest] = s[rest].map(normalize_datetime)
+    return out.where(out.notna(), None)
+
+def _normalize_numeric(s: pd.Series, scalar_fn, vector_fn, limit: float = np.inf) -> pd.Series:
+    out = pd.Series("", index=s.index, dtype=object)
+    if is_bool_dtype(s):
+        # str(True) không parse được thành số -> "" giống bản gốc
+        return out
+    if not is_numeric_dtype(s):
+        rest = s.notna()
+        out[rest] = s[rest].map(scalar_fn)
+        return out
+    values = s.astype("float64")
+    # inf không thể có trong dữ liệu JSON của MangaDex nên được coi như rỗng
+    ok = np.isfinite(values) & (values.abs() < limit)
+    out[ok] = vector_fn(values[ok])
+    rest = s.notna() & ~ok & np.isfinite(values)
+    if rest.any():
+        out[rest] = s[rest].map(scalar_fn)
+    return out
+
+def normalize_int_series(s: pd.Series) -> pd.Series:
+    """normalize_int cho cả cột."""
+    return _normalize_numeric(s, normalize_int, lambda v: np.trunc(v).astype("int64").astype(str).astype(object),
+                              limit=FLOAT_EXACT_INT)
+
+def normalize_float_series(s: pd.Series) -> pd.Series:
+    """normalize_float cho cả cột."""
+    return _normalize_numeric(s, normalize_float, lambda v: v.to_numpy().astype(str).astype(object))
+
 def get_attr(d: Dict, *keys, default=None):
     cur = d
     for k in keys:
@@ -102,443 +256,750 @@ def as_list(x: Any) -> List:
         return x
     return [x]
 
-def write_csv(df: pd.DataFrame, seed_dir: str, filename: str):
-    path = os.path.join(seed_dir, filename)
-    if df is None or df.empty:
-        pd.DataFrame(columns=df.columns if 'df' in locals() else []).to_csv(path, index=False, quoting=csv.QUOTE_ALL)
-        logging.warning(f"{filename}: DataFrame rỗng -> ghi header trống.")
-        return
-    
-    logging.info(f"{filename}: {len(df)} rows trước khi lọc")
-    
+
+def iter_batches(col, batch_size: int, projection: Optional[Dict] = None,
+                 query: Optional[Dict] = None) -> Iterable[List[Dict]]:
+    """Đọc cursor theo từng lô batch_size document, không giữ cả collection trong RAM."""
+    cursor = col.find(query or {}, projection).batch_size(batch_size)
+    while True:
+        batch = list(itertools.islice(cursor, batch_size))
+        if not batch:
+            break
+        yield batch
+
+def normalize_frame(df: pd.DataFrame, datetimes: Iterable[str] = (), ints: Iterable[str] = (),
+                    floats: Iterable[str] = ()) -> pd.DataFrame:
+    """Chuẩn hoá kiểu cho các cột của một chunk (thay cho việc gọi normalize_* khi dựng từng row)."""
+    for cols, fn in ((datetimes, normalize_datetime_series), (ints, normalize_int_series), (floats, normalize_float_series)):
+        for col in cols:
+            if col in df.columns:
+                df[col] = fn(df[col])
+    return df
+
+def clean_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Lọc và làm sạch một chunk trước khi ghi."""
     # Chỉ dropna trên cột chính
     key_col = next((col for col in ['manga_id', 'creator_id', 'stat_id', 'chapter_id', 'tag_id', 'group_id', 'related_group_id'] if col in df.columns), df.columns[0])
     df = df.dropna(subset=[key_col])
-    
+
     # Xử lý đặc biệt cho trường year
     if 'year' in df.columns:
         df['year'] = df['year'].astype(str).str.replace('.0', '').replace('nan', '').replace('None', '')
         df['year'] = pd.to_numeric(df['year'], errors='coerce').astype('Int64')
-    
-    # Làm sạch dữ liệu
+
+    # Làm sạch dữ liệu (clean_series bỏ qua cột không phải chuỗi như year Int64)
     for col in df.columns:
-        df[col] = df[col].map(clean_text)
-    
-    logging.info(f"{filename}: {len(df)} rows sau khi lọc")
-    
-    # Ghi CSV với quoting all
-    df.to_csv(path, index=False, quoting=csv.QUOTE_ALL)
-    logging.info(f"{filename}: Ghi {len(df)} rows")
+        df[col] = clean_series(df[col])
+    return df
+
+class SeedWriter:
+    """Ghi một file seed CSV theo từng chunk: header ghi một lần, các chunk sau được append.
+
+    Bộ nhớ tối đa chỉ bằng một chunk thay vì cả bảng.
+    """
+
+    def __init__(self, seed_dir: str, filename: str, datetimes: Iterable[str] = (),
+                 ints: Iterable[str] = (), floats: Iterable[str] = ()):
+        self.path = os.path.join(seed_dir, filename)
+        self.filename = filename
+        self.types = {"datetimes": tuple(datetimes), "ints": tuple(ints), "floats": tuple(floats)}
+        self.columns: Optional[List[str]] = None
+        self.rows_in = 0
+        self.rows_out = 0
+        self._fh = None
+
+    def write(self, rows: List[Dict]):
+        if not rows:
+            return
+        df = pd.DataFrame(rows)
+        self.rows_in += len(df)
+        df = clean_frame(normalize_frame(df, **self.types))
+        if self._fh is None:
+            self.columns = list(df.columns)
+            self._fh = open(self.path, "w", newline="", encoding="utf-8")
+            df.to_csv(self._fh, index=False, quoting=csv.QUOTE_ALL)
+        else:
+            df.reindex(columns=self.columns).to_csv(self._fh, index=False, header=False, quoting=csv.QUOTE_ALL)
+        self.rows_out += len(df)
+
+    def close(self):
+        if self._fh is None:
+            pd.DataFrame(columns=self.columns or []).to_csv(self.path, index=False, quoting=csv.QUOTE_ALL)
+            logging.warning(f"{self.filename}: không có dữ liệu -> ghi header trống.")
+            return
+        self._fh.close()
+        self._fh = None
+        logging.info(f"{self.filename}: {self.rows_in} rows trước khi lọc, ghi {self.rows_out} rows")
+
+class SeedOutput:
+    """Mở writer cho từng bảng theo định dạng đầu ra.
+
+    - csv: SeedWriter (QUOTE_ALL, chuẩn hoá datetime/int/float thành chuỗi)
+    - parquet: ParquetSeedWriter (parquet_seeds.py), kiểu cột lấy từ schema.yml
+    nested=True (chỉ với parquet): các bảng bridge theo ngôn ngữ (biography, alt name, tag name...)
+    được giữ thành cột lặp trong bảng dim thay vì tách bảng.
+    """
+
+    def __init__(self, seed_dir: str, fmt: str = "csv", nested: bool = False,
+                 compression: str = "zstd", schema_path: Optional[str] = None):
+        self.seed_dir = seed_dir
+        self.fmt = fmt
+        self.nested = nested
+        self.compression = compression
+        self.schema_path = schema_path or os.path.join(seed_dir, "schema.yml")
+        self.opened: List[str] = []
+
+    def at(self, seed_dir: str) -> "SeedOutput":
+        """Cùng cấu hình nhưng ghi vào thư mục khác (partition delta)."""
+        return SeedOutput(seed_dir, self.fmt, self.nested, self.compression, self.schema_path)
+
+    def open(self, table: str, datetimes: Iterable[str] = (), ints: Iterable[str] = (), floats: Iterable[str] = ()):
+        if self.fmt == "parquet":
+            from parquet_seeds import ParquetSeedWriter
+            writer = ParquetSeedWriter(self.seed_dir, table, self.schema_path, compression=self.compression)
+        else:
+            writer = SeedWriter(self.seed_dir, f"{table}.csv", datetimes=datetimes, ints=ints, floats=floats)
+        self.opened.append(writer.path)
+        return writer
+
+class ExportState:
+    """Watermark đã export của từng collection, lưu trong file JSON (bson json_util để giữ kiểu datetime)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.data = json_util.loads(f.read())
+
+    def watermark(self, collection: str, field: str) -> Any:
+        entry = self.data.get(collection) or {}
+        # Đổi trường watermark -> watermark cũ không còn ý nghĩa, export lại toàn bộ
+        return entry.get("watermark") if entry.get("field") == field else None
+
+    def advance(self, collection: str, field: str, value: Any, partition: Optional[str] = None):
+        with self._lock:
+            self.data[collection] = {
+                "field": field,
+                "watermark": value,
+                "exported_at": datetime.now(timezone.utc).isoformat(),
+                "partition": partition,
+            }
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(json_util.dumps(self.data, indent=2, ensure_ascii=False))
+            os.replace(tmp, self.path)
+
+def max_watermark(col, field: str) -> Any:
+    """Giá trị lớn nhất của field (dùng index, không quét collection)."""
+    doc = col.find_one({field: {"$ne": None}}, {field: 1}, sort=[(field, -1)])
+    return get_attr(doc, *field.split(".")) if doc else None
+
+def remove_legacy_seeds(seed_dir: str):
+    for name in LEGACY_SEEDS:
+        for ext in ("csv", "parquet"):
+            path = os.path.join(seed_dir, f"{name}.{ext}")
+            if os.path.exists(path):
+                os.remove(path)
+                logging.warning(f"Xoá seed cũ {path} (đã thay bằng delta_{name}.{ext} + model incremental {name})")
+
+def run_extractor(col, fn, out: SeedOutput, batch_size: int = DEFAULT_BATCH_SIZE, query: Optional[Dict] = None):
+    fn(col, out, batch_size, query=query)
+
+def id_ranges(col, partitions: int, query: Optional[Dict] = None) -> List[Dict]:
+    """Chia các _id khớp query thành tối đa `partitions` khoảng gần bằng nhau bằng $bucketAuto.
+
+    Trả về [] nếu _id có nhiều kiểu BSON khác nhau: so sánh $gte/$lt chỉ khớp cùng kiểu nên khoảng
+    bắc qua hai kiểu sẽ làm mất document.
+    """
+    pipeline = ([{"$match": query}] if query else []) + [
+        {"$project": {"_id": 1}},
+        {"$bucketAuto": {"groupBy": "$_id", "buckets": partitions}},
+    ]
+    buckets = list(col.aggregate(pipeline, allowDiskUse=True))
+    if len({type(v) for b in buckets for v in (b["_id"]["min"], b["_id"]["max"])}) != 1:
+        return []
+    ranges = []
+    for i, b in enumerate(buckets):
+        # max của bucket là cận trên loại trừ (= min của bucket sau), riêng bucket cuối là bao gồm
+        upper = "$lte" if i == len(buckets) - 1 else "$lt"
+        ranges.append({"_id": {"$gte": b["_id"]["min"], upper: b["_id"]["max"]}})
+    return ranges
+
+def export_partition(mongo_uri: str, db_name: str, coll_name: str, fn, out: SeedOutput,
+                     batch_size: int, query: Dict) -> List[str]:
+    """Chạy trong process con: mở cursor riêng, ghi shard vào out.seed_dir, trả về đường dẫn các shard."""
+    client = MongoClient(mongo_uri)
+    try:
+        ensure_dir(out.seed_dir)
+        fn(client[db_name][coll_name], out, batch_size, query=query)
+    finally:
+        client.close()
+    return out.opened
+
+def concat_csv(paths: List[str], dest: str):
+    """Nối các shard CSV thành một file seed: giữ header của shard đầu tiên có dữ liệu, bỏ shard rỗng."""
+    header = None
+    with open(dest, "w", newline="", encoding="utf-8") as out:
+        for path in paths:
+            with open(path, newline="", encoding="utf-8") as f:
+                first = f.readline()
+                body = f.tell()
+                if not f.read(1):
+                    continue
+                f.seek(body)
+                if header is None:
+                    header = first
+                    out.write(header)
+                elif first != header:
+                    raise ValueError(f"{path}: header khác các shard trước ({first.strip()} != {header.strip()})")
+                shutil.copyfileobj(f, out)
+    if header is None:
+        shutil.copyfile(paths[0], dest)
+
+class PartitionedExport:
+    """Export một collection lớn theo các khoảng _id, mỗi khoảng do một process trong pool ép phẳng và ghi
+    shard riêng; shard được nối lại theo thứ tự _id thành file của từng bảng.
+
+    Collection nhỏ hơn min_docs (hoặc không chia được) chạy trực tiếp như run_extractor.
+    """
+
+    def __init__(self, pool: Optional[Executor], mongo_uri: str, db_name: str, partitions: int,
+                 min_docs: int = PARTITION_MIN_DOCS):
+        self.pool = pool
+        self.mongo_uri = mongo_uri
+        self.db_name = db_name
+        self.partitions = partitions
+        self.min_docs = min_docs
+
+    def __call__(self, col, fn, out: SeedOutput, batch_size: int = DEFAULT_BATCH_SIZE, query: Optional[Dict] = None):
+        if self.pool is None or self.partitions < 2:
+            return run_extractor(col, fn, out, batch_size, query)
+        total = col.count_documents(query) if query else col.estimated_document_count()
+        if total < self.min_docs:
+            return run_extractor(col, fn, out, batch_size, query)
+        ranges = id_ranges(col, self.partitions, query)
+        if len(ranges) < 2:
+            return run_extractor(col, fn, out, batch_size, query)
+
+        logging.info(f"[{col.name}] chia thành {len(ranges)} partition _id")
+        shard_root = os.path.join(os.path.dirname(os.path.abspath(out.seed_dir)), ".shards", col.name)
+        try:
+            futures = [
+                self.pool.submit(export_partition, self.mongo_uri, self.db_name, col.name, fn,
+                                 out.at(os.path.join(shard_root, f"part-{i:05d}")), batch_size,
+                                 {"$and": [query, r]} if query else r)
+                for i, r in enumerate(ranges)
+            ]
+            shards = defaultdict(list)
+            for future in futures:
+                for path in future.result():
+                    shards[os.path.basename(path)].append(path)
+
+            for filename, paths in shards.items():
+                dest = os.path.join(out.seed_dir, filename)
+                if out.fmt == "parquet":
+                    from parquet_seeds import concat_parquet
+                    rows = concat_parquet(paths, dest, compression=out.compression)
+                else:
+                    concat_csv(paths, dest)
+                    rows = None
+                out.opened.append(dest)
+                logging.info(f"{filename}: nối {len(paths)} shard" + (f", {rows} rows" if rows is not None else ""))
+        finally:
+            shutil.rmtree(shard_root, ignore_errors=True)
+
+def shift_watermark(value: Any, lag: timedelta) -> Any:
+    """value - lag, giữ nguyên kiểu: datetime (snapshotTime) hoặc chuỗi ISO 8601 (fetched_at)."""
+    if isinstance(value, datetime):
+        return value - lag
+    if isinstance(value, str):
+        try:
+            return (datetime.fromisoformat(value.replace("Z", "+00:00")) - lag).isoformat()
+        except ValueError:
+            logging.warning(f"Watermark '{value}' không phải ISO 8601 -> không lùi lag")
+    return value
+
+def export_with_watermark(col, fn, out: SeedOutput, state: ExportState, field: str,
+                          batch_size: int = DEFAULT_BATCH_SIZE, incremental: bool = False,
+                          partition_dir: Optional[str] = None, runner=run_extractor,
+                          lag: timedelta = WATERMARK_LAG):
+    """Export một collection rồi lưu watermark.
+
+    Trường watermark được gán trước khi document commit, nên document commit sau khi high được chốt
+    vẫn có thể mang giá trị < high. Vì vậy cận dưới là watermark - lag (WATERMARK_LAG) chứ không phải
+    watermark: mỗi lần đọc lại khoảng chồng lấn đó, dòng lặp lại được model incremental merge theo
+    unique_key. Delta được ghi vào partition_dir rồi chép sang seed dir.
+    """
+    name = col.name
+    col.create_index(field)
+    high = max_watermark(col, field)
+    low = state.watermark(name, field) if incremental else None
+    if low is not None:
+        low = shift_watermark(low, lag)
+
+    if low is None:
+        if incremental:
+            logging.info(f"[{name}] chưa có watermark cho '{field}' -> export toàn bộ")
+        runner(col, fn, out, batch_size)
+    else:
+        query = {field: {"$gte": low, "$lte": high}}
+        target = out.at(partition_dir)
+        ensure_dir(partition_dir)
+        logging.info(f"[{name}] delta {field} từ {low} đến {high} -> {partition_dir}")
+        runner(col, fn, target, batch_size, query)
+        for path in target.opened:
+            shutil.copyfile(path, os.path.join(out.seed_dir, os.path.basename(path)))
+
+    if high is not None:
+        state.advance(name, field, high, partition_dir if low is not None else None)
 
 # ------------------------------
 # Extractors
 # ------------------------------
-def extract_manga_optimized(col, seed_dir: str):
-    docs = list(col.find({}))
-    logging.info(f"[mangadex_manga] {len(docs)} docs")
-
-    manga_rows = []
-    creator_relations = []
-    tag_relations = []
-    cover_relations = []
-    invalid_docs = 0
+def extract_manga_optimized(col, out: SeedOutput, batch_size: int = DEFAULT_BATCH_SIZE, query: Optional[Dict] = None):
+    logging.info(f"[mangadex_manga] ~{col.estimated_document_count()} docs")
 
-    for d in docs:
-        try:
-            manga_id = d.get("id")
-            if not manga_id:
-                invalid_docs += 1
-                logging.warning(f"Document thiếu manga_id: {d.get('_id')}")
-                continue
-
-            a = d.get("attributes", {}) or {}
-            manga_rows.append({
-                "manga_id": manga_id,
-                "title_en": get_attr(a, "title", "en"),
-                "title_ja": get_attr(a, "title", "ja"),
-                "year": normalize_int(a.get("year")),
-                "status": a.get("status"),
-                "demographic": a.get("publicationDemographic"),
-                "content_rating": a.get("contentRating"),
-                "original_language": a.get("originalLanguage"),
-                "created_at": normalize_datetime(a.get("createdAt")),
-                "updated_at": normalize_datetime(a.get("updatedAt")),
-                "is_locked": a.get("isLocked"),
-                "last_chapter": a.get("lastChapter"),
-                "last_volume": a.get("lastVolume"),
-                "latest_uploaded_chapter": a.get("latestUploadedChapter"),
-                "version": a.get("version"),
-                "state": a.get("state"),
-                "chapter_numbers_reset_on_new_volume": a.get("chapterNumbersResetOnNewVolume"),
-            })
-
-            for r in as_list(d.get("relationships")):
-                if r.get("type") in ["author", "artist"]:
-                    creator_relations.append({
-                        "manga_id": manga_id,
-                        "creator_id": r.get("id"),
-                        "role": r.get("type"),
-                        "created_at": normalize_datetime(get_attr(r, "attributes", "createdAt")),
-                        "updated_at": normalize_datetime(get_attr(r, "attributes", "updatedAt")),
-                    })
+    manga_out = out.open("dim_manga", datetimes=("created_at", "updated_at"), ints=("year",))
+    creator_out = out.open("bridge_manga_creator", datetimes=("created_at", "updated_at"))
+    tag_out = out.open("bridge_manga_tag")
+    cover_out = out.open("bridge_manga_cover", datetimes=("created_at", "updated_at"))
+    invalid_docs = 0
 
-                if r.get("type") == "cover_art":
-                    cover_relations.append({
-                        "manga_id": manga_id,
-                        "cover_id": r.get("id"),
-                        "created_at": normalize_datetime(get_attr(r, "attributes", "createdAt")),
-                        "updated_at": normalize_datetime(get_attr(r, "attributes", "updatedAt")),
-                    })
+    for docs in iter_batches(col, batch_size, query=query):
+        manga_rows = []
+        creator_relations = []
+        tag_relations = []
+        cover_relations = []
 
-            for t in as_list(a.get("tags")):
-                tag_id = t.get("id")
-                if not tag_id:
-                    logging.warning(f"Tag thiếu id trong manga_id={manga_id}")
+        for d in docs:
+            try:
+                manga_id = d.get("id")
+                if not manga_id:
+                    invalid_docs += 1
+                    logging.warning(f"Document thiếu manga_id: {d.get('_id')}")
                     continue
-                tag_relations.append({
+
+                a = d.get("attributes", {}) or {}
+                manga_rows.append({
                     "manga_id": manga_id,
-                    "tag_id": tag_id,
-                    "tag_name_en": get_attr(t, "attributes", "name", "en"),
-                    "tag_group": get_attr(t, "attributes", "group"),
+                    "title_en": get_attr(a, "title", "en"),
+                    "title_ja": get_attr(a, "title", "ja"),
+                    "year": a.get("year"),
+                    "status": a.get("status"),
+                    "demographic": a.get("publicationDemographic"),
+                    "content_rating": a.get("contentRating"),
+                    "original_language": a.get("originalLanguage"),
+                    "created_at": a.get("createdAt"),
+                    "updated_at": a.get("updatedAt"),
+                    "is_locked": a.get("isLocked"),
+                    "last_chapter": a.get("lastChapter"),
+                    "last_volume": a.get("lastVolume"),
+                    "latest_uploaded_chapter": a.get("latestUploadedChapter"),
+                    "version": a.get("version"),
+                    "state": a.get("state"),
+                    "chapter_numbers_reset_on_new_volume": a.get("chapterNumbersResetOnNewVolume"),
                 })
 
-        except Exception as e:
-            invalid_docs += 1
-            logging.error(f"Lỗi xử lý document manga_id={d.get('id', d.get('_id'))}: {e}")
+                for r in as_list(d.get("relationships")):
+                    if r.get("type") in ["author", "artist"]:
+                        creator_relations.append({
+                            "manga_id": manga_id,
+                            "creator_id": r.get("id"),
+                            "role": r.get("type"),
+                            "created_at": get_attr(r, "attributes", "createdAt"),
+                            "updated_at": get_attr(r, "attributes", "updatedAt"),
+                        })
 
-    logging.info(f"[mangadex_manga] {invalid_docs} documents không hợp lệ")
-    write_csv(pd.DataFrame(manga_rows), seed_dir, "dim_manga.csv")
-    # Đường dẫn file dim_manga.csv
-    file_path = os.path.join(seed_dir, "dim_manga.csv")
+                    if r.get("type") == "cover_art":
+                        cover_relations.append({
+                            "manga_id": manga_id,
+                            "cover_id": r.get("id"),
+                            "created_at": get_attr(r, "attributes", "createdAt"),
+                            "updated_at": get_attr(r, "attributes", "updatedAt"),
+                        })
 
-    # Đọc lại file
-    df = pd.read_csv(file_path)
+                for t in as_list(a.get("tags")):
+                    tag_id = t.get("id")
+                    if not tag_id:
+                        logging.warning(f"Tag thiếu id trong manga_id={manga_id}")
+                        continue
+                    tag_relations.append({
+                        "manga_id": manga_id,
+                        "tag_id": tag_id,
+                        "tag_name_en": get_attr(t, "attributes", "name", "en"),
+                        "tag_group": get_attr(t, "attributes", "group"),
+                    })
 
-    # Xóa 2 ký tự cuối của cột year (nếu không null và có đủ 2 ký tự)
-    df["year"] = df["year"].astype(str).str[:-2].replace("n", pd.NA)
+            except Exception as e:
+                invalid_docs += 1
+                logging.error(f"Lỗi xử lý document manga_id={d.get('id', d.get('_id'))}: {e}")
+
+        manga_out.write(manga_rows)
+        creator_out.write(creator_relations)
+        tag_out.write(tag_relations)
+        cover_out.write(cover_relations)
 
-    # Ghi đè file đã chỉnh sửa
-    df.to_csv(file_path, index=False)
-    
-    write_csv(pd.DataFrame(creator_relations), seed_dir, "bridge_manga_creator.csv")
-    write_csv(pd.DataFrame(tag_relations), seed_dir, "bridge_manga_tag.csv")
-    write_csv(pd.DataFrame(cover_relations), seed_dir, "bridge_manga_cover.csv")
+    logging.info(f"[mangadex_manga] {invalid_docs} documents không hợp lệ")
+    for out in (manga_out, creator_out, tag_out, cover_out):
+        out.close()
 
 
-def extract_creators_optimized(col, seed_dir: str):
-    docs = list(col.find({}))
-    logging.info(f"[mangadex_creators] {len(docs)} docs")
+def extract_creators_optimized(col, out: SeedOutput, batch_size: int = DEFAULT_BATCH_SIZE, query: Optional[Dict] = None):
+    logging.info(f"[mangadex_creators] ~{col.estimated_document_count()} docs")
 
-    creator_rows = []
-    bio_rows = []
+    creator_out = out.open("dim_creator", datetimes=("created_at", "updated_at"))
+    # --nested: biography là cột lặp của dim_creator, không ghi bảng bridge
+    bio_out = None if out.nested else out.open("bridge_creator_biography")
     invalid_docs = 0
 
-    for d in docs:
-        try:
-            data = d.get("data", {}) or {}
-            creator_id = data.get("id")
-            if not creator_id:
-                invalid_docs += 1
-                logging.warning(f"Document thiếu creator_id: {d.get('_id')}")
-                continue
-
-            a = data.get("attributes", {}) or {}
-            creator_rows.append({
-                "creator_id": creator_id,
-                "name": a.get("name"),
-                "twitter": a.get("twitter"),
-                "pixiv": a.get("pixiv"),
-                "naver": a.get("naver"),
-                "website": a.get("website"),
-                "youtube": a.get("youtube"),
-                "weibo": a.get("weibo"),
-                "tumblr": a.get("tumblr"),
-                "nicoVideo": a.get("nicoVideo"),
-                "booth": a.get("booth"),
-                "fanBox": a.get("fanBox"),
-                "fantia": a.get("fantia"),
-                "melonBook": a.get("melonBook"),
-                "namicomi": a.get("namicomi"),
-                "skeb": a.get("skeb"),
-                "created_at": normalize_datetime(a.get("createdAt")),
-                "updated_at": normalize_datetime(a.get("updatedAt")),
-                "version": a.get("version"),
-            })
-
-            for lang, val in (a.get("biography") or {}).items():
-                bio_rows.append({
+    for docs in iter_batches(col, batch_size, query=query):
+        creator_rows = []
+        bio_rows = []
+
+        for d in docs:
+            try:
+                data = d.get("data", {}) or {}
+                creator_id = data.get("id")
+                if not creator_id:
+                    invalid_docs += 1
+                    logging.warning(f"Document thiếu creator_id: {d.get('_id')}")
+                    continue
+
+                a = data.get("attributes", {}) or {}
+                creator_rows.append({
                     "creator_id": creator_id,
-                    "lang_code": lang,
-                    "biography": val
+                    "name": a.get("name"),
+                    "twitter": a.get("twitter"),
+                    "pixiv": a.get("pixiv"),
+                    "naver": a.get("naver"),
+                    "website": a.get("website"),
+                    "youtube": a.get("youtube"),
+                    "weibo": a.get("weibo"),
+                    "tumblr": a.get("tumblr"),
+                    "nicoVideo": a.get("nicoVideo"),
+                    "booth": a.get("booth"),
+                    "fanBox": a.get("fanBox"),
+                    "fantia": a.get("fantia"),
+                    "melonBook": a.get("melonBook"),
+                    "namicomi": a.get("namicomi"),
+                    "skeb": a.get("skeb"),
+                    "created_at": a.get("createdAt"),
+                    "updated_at": a.get("updatedAt"),
+                    "version": a.get("version"),
                 })
 
-        except Exception as e:
-            invalid_docs += 1
-            logging.error(f"Lỗi xử lý document creator_id={d.get('data', {}).get('id', d.get('_id'))}: {e}")
+                biography = [{"lang_code": lang, "biography": val} for lang, val in (a.get("biography") or {}).items()]
+                if out.nested:
+                    creator_rows[-1]["biography"] = biography
+                else:
+                    bio_rows.extend({"creator_id": creator_id, **b} for b in biography)
+
+            except Exception as e:
+                invalid_docs += 1
+                logging.error(f"Lỗi xử lý document creator_id={d.get('data', {}).get('id', d.get('_id'))}: {e}")
+
+        creator_out.write(creator_rows)
+        if not out.nested:
+            bio_out.write(bio_rows)
 
     logging.info(f"[mangadex_creators] {invalid_docs} documents không hợp lệ")
-    write_csv(pd.DataFrame(creator_rows), seed_dir, "dim_creator.csv")
-    write_csv(pd.DataFrame(bio_rows), seed_dir, "bridge_creator_biography.csv")
+    creator_out.close()
+    if not out.nested:
+        bio_out.close()
 
 
-def extract_statistics_optimized(col, seed_dir: str):
-    docs = list(col.find({}))
-    logging.info(f"[mangadex_statistics] {len(docs)} docs")
+def extract_statistics_optimized(col, out: SeedOutput, batch_size: int = DEFAULT_BATCH_SIZE, query: Optional[Dict] = None):
+    logging.info(f"[mangadex_statistics] ~{col.estimated_document_count()} docs")
 
-    stat_rows = []
-    trend_rows = []
+    stat_out = out.open("delta_fact_statistics", datetimes=("snapshot_time", "fetched_at"),
+                          ints=("follows", "unavailable_chapters_count", "comments_thread_id", "comments_replies_count"),
+                          floats=("rating_avg", "rating_bayesian"))
+    trend_out = out.open("delta_fact_manga_trends", datetimes=("snapshot_time", "fetched_at"),
+                           ints=("follows",), floats=("rating_avg", "rating_bayesian"))
     invalid_docs = 0
 
-    for d in docs:
-        try:
-            stat_id = d.get("_id")
-            manga_id = d.get("mangaId")
-            if not manga_id or not stat_id:
-                invalid_docs += 1
-                logging.warning(f"Document thiếu stat_id/manga_id: {d.get('_id')}")
-                continue
+    for docs in iter_batches(col, batch_size, query=query):
+        stat_rows = []
+        trend_rows = []
 
-            stat = d.get("statistics")
-            if not isinstance(stat, dict):
-                invalid_docs += 1
-                logging.warning(f"Document stat_id={stat_id} thiếu hoặc không hợp lệ trường statistics")
-                continue
-
-            rating = stat.get("rating")
-            if not isinstance(rating, dict):
-                rating = {}  # Nếu rating là None, gán thành dict rỗng
-
-            comments = stat.get("comments")
-            if not isinstance(comments, dict):
-                comments = {}  # Nếu comments là None, gán thành dict rỗng
-
-            stat_rows.append({
-                "stat_id": stat_id,
-                "manga_id": manga_id,
-                "snapshot_time": normalize_datetime(d.get("snapshotTime")),
-                "fetched_at": normalize_datetime(d.get("fetched_at")),
-                "source": d.get("source", ""),
-                "follows": normalize_int(stat.get("follows", "")),
-                "rating_avg": normalize_float(rating.get("average", "")),
-                "rating_bayesian": normalize_float(rating.get("bayesian", "")),
-                "unavailable_chapters_count": normalize_int(stat.get("unavailableChaptersCount", "")),
-                "comments_thread_id": normalize_int(comments.get("threadId", "")),
-                "comments_replies_count": normalize_int(comments.get("repliesCount", "")),
-            })
-
-            if d.get("snapshotTime"):
-                trend_rows.append({
+        for d in docs:
+            try:
+                stat_id = d.get("_id")
+                manga_id = d.get("mangaId")
+                if not manga_id or not stat_id:
+                    invalid_docs += 1
+                    logging.warning(f"Document thiếu stat_id/manga_id: {d.get('_id')}")
+                    continue
+
+                stat = d.get("statistics")
+                if not isinstance(stat, dict):
+                    invalid_docs += 1
+                    logging.warning(f"Document stat_id={stat_id} thiếu hoặc không hợp lệ trường statistics")
+                    continue
+
+                rating = stat.get("rating")
+                if not isinstance(rating, dict):
+                    rating = {}  # Nếu rating là None, gán thành dict rỗng
+
+                comments = stat.get("comments")
+                if not isinstance(comments, dict):
+                    comments = {}  # Nếu comments là None, gán thành dict rỗng
+
+                stat_rows.append({
+                    "stat_id": stat_id,
                     "manga_id": manga_id,
-                    "snapshot_time": normalize_datetime(d.get("snapshotTime")),
-                    "fetched_at": normalize_datetime(d.get("fetched_at")),
-                    "follows": normalize_int(stat.get("follows", "")),
-                    "rating_avg": normalize_float(rating.get("average", "")),
-                    "rating_bayesian": normalize_float(rating.get("bayesian", "")),
+                    "snapshot_time": d.get("snapshotTime"),
+                    "fetched_at": d.get("fetched_at") or d.get("snapshotTime"),
+                    "source": d.get("source", ""),
+                    "follows": stat.get("follows"),
+                    "rating_avg": rating.get("average"),
+                    "rating_bayesian": rating.get("bayesian"),
+                    "unavailable_chapters_count": stat.get("unavailableChaptersCount"),
+                    "comments_thread_id": comments.get("threadId"),
+                    "comments_replies_count": comments.get("repliesCount"),
                 })
 
-        except Exception as e:
-            invalid_docs += 1
-            logging.error(f"Lỗi xử lý document stat_id={d.get('_id', 'unknown')}: {e}")
+                if d.get("snapshotTime"):
+                    trend_rows.append({
+                        "manga_id": manga_id,
+                        "snapshot_time": d.get("snapshotTime"),
+                        "fetched_at": d.get("fetched_at") or d.get("snapshotTime"),
+                        "follows": stat.get("follows"),
+                        "rating_avg": rating.get("average"),
+                        "rating_bayesian": rating.get("bayesian"),
+                    })
+
+            except Exception as e:
+                invalid_docs += 1
+                logging.error(f"Lỗi xử lý document stat_id={d.get('_id', 'unknown')}: {e}")
+
+        stat_out.write(stat_rows)
+        trend_out.write(trend_rows)
 
     logging.info(f"[mangadex_statistics] {invalid_docs} documents không hợp lệ")
-    write_csv(pd.DataFrame(stat_rows), seed_dir, "fact_statistics.csv")
-    write_csv(pd.DataFrame(trend_rows), seed_dir, "fact_manga_trends.csv")
+    stat_out.close()
+    trend_out.close()
 
 
-def extract_chapters_optimized(col, seed_dir: str):
-    docs = list(col.find({}))
-    logging.info(f"[mangadex_chapters] {len(docs)} docs")
+def extract_chapters_optimized(col, out: SeedOutput, batch_size: int = DEFAULT_BATCH_SIZE, query: Optional[Dict] = None):
+    logging.info(f"[mangadex_chapters] ~{col.estimated_document_count()} docs")
 
-    chapter_rows = []
-    group_relations = []
+    chapter_out = out.open("delta_fact_chapters", datetimes=("publish_at", "readable_at", "created_at", "updated_at"))
+    group_out = out.open("delta_bridge_chapter_group", datetimes=("created_at", "updated_at"))
     invalid_docs = 0
 
-    for d in docs:
-        try:
-            a = d.get("attributes", {}) or {}
-            chapter_id = d.get("id") or d.get("_id")
-            manga_id = d.get("mangaId")
-            if not chapter_id or not manga_id:
+    for docs in iter_batches(col, batch_size, query=query):
+        chapter_rows = []
+        group_relations = []
+
+        for d in docs:
+            try:
+                a = d.get("attributes", {}) or {}
+                chapter_id = d.get("id") or d.get("_id")
+                manga_id = d.get("mangaId")
+                if not chapter_id or not manga_id:
+                    invalid_docs += 1
+                    logging.warning(f"Document thiếu chapter_id/manga_id: {d.get('_id')}")
+                    continue
+
+                chapter_rows.append({
+                    "chapter_id": chapter_id,
+                    "manga_id": manga_id,
+                    "volume": a.get("volume"),
+                    "chapter": a.get("chapter"),
+                    "title": a.get("title"),
+                    "translated_language": a.get("translatedLanguage"),
+                    "external_url": a.get("externalUrl"),
+                    "is_unavailable": a.get("isUnavailable"),
+                    "publish_at": a.get("publishAt"),
+                    "readable_at": a.get("readableAt"),
+                    "created_at": a.get("createdAt"),
+                    "updated_at": a.get("updatedAt"),
+                    "pages": a.get("pages"),
+                    "version": a.get("version"),
+                    "fetched_at": d.get("fetched_at"),
+                })
+
+                for r in as_list(d.get("relationships")):
+                    if r.get("type") == "scanlation_group":
+                        group_id = r.get("id")
+                        if not group_id:
+                            logging.warning(f"Scanlation group thiếu id trong chapter_id={chapter_id}")
+                            continue
+                        group_relations.append({
+                            "chapter_id": chapter_id,
+                            "group_id": group_id,
+                            "created_at": get_attr(r, "attributes", "createdAt"),
+                            "updated_at": get_attr(r, "attributes", "updatedAt"),
+                        })
+
+            except Exception as e:
                 invalid_docs += 1
-                logging.warning(f"Document thiếu chapter_id/manga_id: {d.get('_id')}")
-                continue
-
-            chapter_rows.append({
-                "chapter_id": chapter_id,
-                "manga_id": manga_id,
-                "volume": a.get("volume"),
-                "chapter": a.get("chapter"),
-                "title": a.get("title"),
-                "translated_language": a.get("translatedLanguage"),
-                "external_url": a.get("externalUrl"),
-                "is_unavailable": a.get("isUnavailable"),
-                "publish_at": normalize_datetime(a.get("publishAt")),
-                "readable_at": normalize_datetime(a.get("readableAt")),
-                "created_at": normalize_datetime(a.get("createdAt")),
-                "updated_at": normalize_datetime(a.get("updatedAt")),
-                "pages": a.get("pages"),
-                "version": a.get("version"),
-                "fetched_at": d.get("fetched_at"),
-            })
-
-            for r in as_list(d.get("relationships")):
-                if r.get("type") == "scanlation_group":
-                    group_id = r.get("id")
-                    if not group_id:
-                        logging.warning(f"Scanlation group thiếu id trong chapter_id={chapter_id}")
-                        continue
-                    group_relations.append({
-                        "chapter_id": chapter_id,
-                        "group_id": group_id,
-                        "created_at": normalize_datetime(get_attr(r, "attributes", "createdAt")),
-                        "updated_at": normalize_datetime(get_attr(r, "attributes", "updatedAt")),
-                    })
+                logging.error(f"Lỗi xử lý document chapter_id={d.get('id', d.get('_id'))}: {e}")
 
-        except Exception as e:
-            invalid_docs += 1
-            logging.error(f"Lỗi xử lý document chapter_id={d.get('id', d.get('_id'))}: {e}")
+        chapter_out.write(chapter_rows)
+        group_out.write(group_relations)
 
     logging.info(f"[mangadex_chapters] {invalid_docs} documents không hợp lệ")
-    write_csv(pd.DataFrame(chapter_rows), seed_dir, "fact_chapters.csv")
-    write_csv(pd.DataFrame(group_relations), seed_dir, "bridge_chapter_group.csv")
+    chapter_out.close()
+    group_out.close()
 
 
-def extract_tags_optimized(col, seed_dir: str):
-    docs = list(col.find({}))
-    logging.info(f"[mangadex_tags] {len(docs)} docs")
+def extract_tags_optimized(col, out: SeedOutput, batch_size: int = DEFAULT_BATCH_SIZE, query: Optional[Dict] = None):
+    logging.info(f"[mangadex_tags] ~{col.estimated_document_count()} docs")
 
-    tag_rows = []
-    name_rows = []
+    tag_out = out.open("dim_tag")
+    name_out = None if out.nested else out.open("bridge_tag_name")
     invalid_docs = 0
 
-    for d in docs:
-        try:
-            tag_id = d.get("_id")
-            a = d.get("attributes", {}) or {}
-            if not tag_id:
-                invalid_docs += 1
-                logging.warning(f"Document thiếu tag_id: {d.get('_id')}")
-                continue
-
-            tag_rows.append({
-                "tag_id": tag_id,
-                "group": a.get("group"),
-                "version": a.get("version"),
-                "name_en": get_attr(a, "name", "en"),
-            })
-
-            for lang, val in (a.get("name") or {}).items():
-                name_rows.append({
+    for docs in iter_batches(col, batch_size, query=query):
+        tag_rows = []
+        name_rows = []
+
+        for d in docs:
+            try:
+                tag_id = d.get("_id")
+                a = d.get("attributes", {}) or {}
+                if not tag_id:
+                    invalid_docs += 1
+                    logging.warning(f"Document thiếu tag_id: {d.get('_id')}")
+                    continue
+
+                tag_rows.append({
                     "tag_id": tag_id,
-                    "lang_code": lang,
-                    "tag_name": val
+                    "group": a.get("group"),
+                    "version": a.get("version"),
+                    "name_en": get_attr(a, "name", "en"),
                 })
 
-        except Exception as e:
-            invalid_docs += 1
-            logging.error(f"Lỗi xử lý document tag_id={d.get('_id')}: {e}")
+                names = [{"lang_code": lang, "tag_name": val} for lang, val in (a.get("name") or {}).items()]
+                if out.nested:
+                    tag_rows[-1]["names"] = names
+                else:
+                    name_rows.extend({"tag_id": tag_id, **n} for n in names)
+
+            except Exception as e:
+                invalid_docs += 1
+                logging.error(f"Lỗi xử lý document tag_id={d.get('_id')}: {e}")
+
+        tag_out.write(tag_rows)
+        if not out.nested:
+            name_out.write(name_rows)
 
     logging.info(f"[mangadex_tags] {invalid_docs} documents không hợp lệ")
-    write_csv(pd.DataFrame(tag_rows), seed_dir, "dim_tag.csv")
-    write_csv(pd.DataFrame(name_rows), seed_dir, "bridge_tag_name.csv")
+    tag_out.close()
+    if not out.nested:
+        name_out.close()
 
 
-def extract_groups_optimized(col, seed_dir: str):
-    docs = list(col.find({}))
-    logging.info(f"[mangadex_groups] {len(docs)} docs")
+def extract_groups_optimized(col, out: SeedOutput, batch_size: int = DEFAULT_BATCH_SIZE, query: Optional[Dict] = None):
+    logging.info(f"[mangadex_groups] ~{col.estimated_document_count()} docs")
 
-    group_rows = []
-    alt_name_rows = []
-    language_rows = []
+    group_out = out.open("dim_group", datetimes=("created_at", "updated_at"))
+    alt_name_out = None if out.nested else out.open("bridge_group_altname")
+    language_out = None if out.nested else out.open("bridge_group_language")
     invalid_docs = 0
 
-    for d in docs:
-        try:
-            data = d.get("data", {}) or {}
-            a = data.get("attributes", {}) or {}
-            group_id = data.get("id")
-            if not group_id:
-                invalid_docs += 1
-                logging.warning(f"Document thiếu group_id: {d.get('_id')}")
-                continue
-
-            group_rows.append({
-                "group_id": group_id,
-                "name": a.get("name"),
-                "locked": a.get("locked"),
-                "website": a.get("website"),
-                "irc_server": a.get("ircServer"),
-                "irc_channel": a.get("ircChannel"),
-                "discord": a.get("discord"),
-                "contact_email": a.get("contactEmail"),
-                "description": a.get("description"),
-                "twitter": a.get("twitter"),
-                "manga_updates": a.get("mangaUpdates"),
-                "official": a.get("official"),
-                "verified": a.get("verified"),
-                "inactive": a.get("inactive"),
-                "publish_delay": a.get("publishDelay"),
-                "created_at": normalize_datetime(a.get("createdAt")),
-                "updated_at": normalize_datetime(a.get("updatedAt")),
-                "version": a.get("version"),
-            })
-
-            for alt in as_list(a.get("altNames")):
-                if isinstance(alt, dict):
-                    for lang, val in alt.items():
-                        alt_name_rows.append({
-                            "group_id": group_id,
-                            "lang_code": lang,
-                            "alt_name": val
-                        })
+    for docs in iter_batches(col, batch_size, query=query):
+        group_rows = []
+        alt_name_rows = []
+        language_rows = []
 
-            for lang in as_list(a.get("focusedLanguages")):
-                language_rows.append({
+        for d in docs:
+            try:
+                data = d.get("data", {}) or {}
+                a = data.get("attributes", {}) or {}
+                group_id = data.get("id")
+                if not group_id:
+                    invalid_docs += 1
+                    logging.warning(f"Document thiếu group_id: {d.get('_id')}")
+                    continue
+
+                group_rows.append({
                     "group_id": group_id,
-                    "lang_code": lang
+                    "name": a.get("name"),
+                    "locked": a.get("locked"),
+                    "website": a.get("website"),
+                    "irc_server": a.get("ircServer"),
+                    "irc_channel": a.get("ircChannel"),
+                    "discord": a.get("discord"),
+                    "contact_email": a.get("contactEmail"),
+                    "description": a.get("description"),
+                    "twitter": a.get("twitter"),
+                    "manga_updates": a.get("mangaUpdates"),
+                    "official": a.get("official"),
+                    "verified": a.get("verified"),
+                    "inactive": a.get("inactive"),
+                    "publish_delay": a.get("publishDelay"),
+                    "created_at": a.get("createdAt"),
+                    "updated_at": a.get("updatedAt"),
+                    "version": a.get("version"),
                 })
 
-        except Exception as e:
-            invalid_docs += 1
-            logging.error(f"Lỗi xử lý document group_id={d.get('data', {}).get('id', d.get('_id'))}: {e}")
+                alt_names = [{"lang_code": lang, "alt_name": val}
+                             for alt in as_list(a.get("altNames")) if isinstance(alt, dict)
+                             for lang, val in alt.items()]
+                languages = as_list(a.get("focusedLanguages"))
+                if out.nested:
+                    group_rows[-1]["alt_names"] = alt_names
+                    group_rows[-1]["focused_languages"] = languages
+                else:
+                    alt_name_rows.extend({"group_id": group_id, **n} for n in alt_names)
+                    language_rows.extend({"group_id": group_id, "lang_code": lang} for lang in languages)
+
+            except Exception as e:
+                invalid_docs += 1
+                logging.error(f"Lỗi xử lý document group_id={d.get('data', {}).get('id', d.get('_id'))}: {e}")
+
+        group_out.write(group_rows)
+        if not out.nested:
+            alt_name_out.write(alt_name_rows)
+            language_out.write(language_rows)
 
     logging.info(f"[mangadex_groups] {invalid_docs} documents không hợp lệ")
-    write_csv(pd.DataFrame(group_rows), seed_dir, "dim_group.csv")
-    write_csv(pd.DataFrame(alt_name_rows), seed_dir, "bridge_group_altname.csv")
-    write_csv(pd.DataFrame(language_rows), seed_dir, "bridge_group_language.csv")
+    group_out.close()
+    if not out.nested:
+        alt_name_out.close()
+        language_out.close()
 
 
-def extract_related_optimized(col, seed_dir: str):
-    docs = list(col.find({}))
-    logging.info(f"[mangadex_related] {len(docs)} docs")
+def extract_related_optimized(col, out: SeedOutput, batch_size: int = DEFAULT_BATCH_SIZE, query: Optional[Dict] = None):
+    logging.info(f"[mangadex_related] ~{col.estimated_document_count()} docs")
 
-    related_rows = []
+    related_out = out.open("bridge_manga_related")
     invalid_docs = 0
 
-    for d in docs:
-        try:
-            group_id = d.get("_id")
-            fetched_at = d.get("fetched_at")
-            if not group_id:
+    for docs in iter_batches(col, batch_size, query=query):
+        related_rows = []
+
+        for d in docs:
+            try:
+                group_id = d.get("_id")
+                fetched_at = d.get("fetched_at")
+                if not group_id:
+                    invalid_docs += 1
+                    logging.warning(f"Document thiếu related_group_id: {d.get('_id')}")
+                    continue
+
+                for r in as_list(d.get("relationships")):
+                    related_rows.append({
+                        "related_group_id": group_id,
+                        "fetched_at": fetched_at,
+                        "entity_id": r.get("id"),
+                        "entity_type": r.get("type"),
+                        "relation_type": r.get("related")
+                    })
+
+            except Exception as e:
                 invalid_docs += 1
-                logging.warning(f"Document thiếu related_group_id: {d.get('_id')}")
-                continue
-
-            for r in as_list(d.get("relationships")):
-                related_rows.append({
-                    "related_group_id": group_id,
-                    "fetched_at": fetched_at,
-                    "entity_id": r.get("id"),
-                    "entity_type": r.get("type"),
-                    "relation_type": r.get("related")
-                })
+                logging.error(f"Lỗi xử lý document related_group_id={d.get('_id')}: {e}")
 
-        except Exception as e:
-            invalid_docs += 1
-            logging.error(f"Lỗi xử lý document related_group_id={d.get('_id')}: {e}")
+        related_out.write(related_rows)
 
     logging.info(f"[mangadex_related] {invalid_docs} documents không hợp lệ")
-    write_csv(pd.DataFrame(related_rows), seed_dir, "bridge_manga_related.csv")
+    related_out.close()
 
 # ------------------------------
 # Main
@@ -550,9 +1011,37 @@ def main():
     parser.add_argument("--seed-dir", default="mongo_to_db/seeds", help="Output seeds directory")
     parser.add_argument("--skip", nargs="*", default=[], help="Collections to skip")
     parser.add_argument("--max-threads", type=int, default=4, help="Maximum number of threads")
-    
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help=f"Worker processes for collections larger than {PARTITION_MIN_DOCS} docs (1 = no partitioning)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Documents per chunk; peak memory scales with this, not the collection size")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="csv: QUOTE_ALL seeds for dbt seed; parquet: typed files for BigQuery load jobs")
+    parser.add_argument("--compression", choices=["zstd", "snappy"], default="zstd", help="Parquet compression codec")
+    parser.add_argument("--schema", default=None, help="Seed schema.yml with column data_type (default: <seed-dir>/schema.yml)")
+    parser.add_argument("--nested", action="store_true",
+                        help="Parquet only: keep biographies, alt names, tag names as repeated columns instead of bridge tables")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only export documents newer than the last watermark for collections in WATERMARK_FIELDS")
+    parser.add_argument("--state-file", default=None,
+                        help="Watermark state file (default: export_state.json next to the seed dir)")
+    parser.add_argument("--watermark-lag", type=float, default=WATERMARK_LAG.total_seconds() / 60,
+                        help="Minutes re-read below the last watermark to catch documents committed late")
+    parser.add_argument("--delta-dir", default=None,
+                        help="Root of dated delta partitions (default: deltas/ next to the seed dir)")
+
     args = parser.parse_args()
+    if args.nested and args.format != "parquet":
+        parser.error("--nested chỉ dùng được với --format parquet")
     ensure_dir(args.seed_dir)
+    remove_legacy_seeds(args.seed_dir)
+    out = SeedOutput(args.seed_dir, args.format, nested=args.nested,
+                     compression=args.compression, schema_path=args.schema)
+    project_dir = os.path.dirname(os.path.abspath(args.seed_dir))
+    state = ExportState(args.state_file or os.path.join(project_dir, "export_state.json"))
+    # Mỗi lần chạy incremental ghi delta vào một partition theo ngày giờ export
+    partition_dir = os.path.join(args.delta_dir or os.path.join(project_dir, "deltas"),
+                                 datetime.now().strftime("%Y-%m-%dT%H%M%S"))
 
     jobs = [
         ("mangadex_manga", "mangadex_manga", extract_manga_optimized),
@@ -572,9 +1061,20 @@ def main():
             return
         logging.info(f"{alias} -> '{coll_name}'")
         col = db[coll_name]
-        fn(col, args.seed_dir)
+        if coll_name in WATERMARK_FIELDS:
+            export_with_watermark(col, fn, out, state, WATERMARK_FIELDS[coll_name], args.batch_size,
+                                  incremental=args.incremental, partition_dir=partition_dir, runner=runner,
+                                  lag=timedelta(minutes=args.watermark_lag))
+        else:
+            runner(col, fn, out, args.batch_size)
         client.close()
 
+    # Thread cho từng collection; collection lớn chia partition _id cho process pool dùng chung.
+    # spawn thay vì fork: fork từ process đang có thread và MongoClient mở không an toàn với pymongo
+    pool = (ProcessPoolExecutor(max_workers=args.processes, mp_context=multiprocessing.get_context("spawn"))
+            if args.processes > 1 else None)
+    runner = PartitionedExport(pool, args.mongo_uri, args.db, args.processes * PARTITIONS_PER_PROCESS)
+
     with ThreadPoolExecutor(max_workers=args.max_threads) as executor:
         future_to_job = {
             executor.submit(run_job, alias, coll_name, fn): alias
@@ -589,10 +1089,18 @@ def main():
                 logging.info(f"{alias} completed")
             except Exception as e:
                 logging.error(f"{alias} failed: {e}")
+    if pool is not None:
+        pool.shutdown()
 
+    if args.format == "parquet":
+        logging.info("\n✅ Hoàn tất xuất Parquet!")
+        logging.info("📊 Nạp vào BigQuery: bq load --source_format=PARQUET --parquet_enable_list_inference <dataset>.<table> <file>.parquet")
+        return
+    if not args.incremental:
+        logging.info("ℹ️  Lần đầu chuyển sang model incremental (models/facts): dbt seed rồi dbt run --full-refresh --select facts")
     logging.info("\n✅ Hoàn tất xuất CSV seeds tối ưu!")
     logging.info("📊 Bây giờ bạn có thể chạy: dbt seed")
     logging.info("🚀 Sau đó chạy: dbt run để build các models")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,243 @@
+# parquet_seeds.py
+# -*- coding: utf-8 -*-
+"""
+Ghi bảng seed ra Parquet có kiểu (dùng chung cho mongo_to_dbt_optimized.py và mongo_to_db_seeds.py).
+
+Kiểu cột lấy từ `data_type` trong seeds/schema.yml (kiểu BigQuery: STRING, INT64, FLOAT64, BOOL,
+DATETIME, TIMESTAMP, DATE, ARRAY<...>, STRUCT<...>); cột không khai báo được ghi là STRING,
+cột có test `not_null` được ghi là non-nullable và dòng thiếu giá trị bị loại.
+
+Nạp vào BigQuery:
+    bq load --source_format=PARQUET --parquet_enable_list_inference \
+        manga_data.dim_creator seeds/dim_creator.parquet
+
+Yêu cầu: pip install pyarrow pyyaml
+"""
+
+import functools
+import logging
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import yaml
+
+# BigQuery đọc song song theo row group; row group nhỏ (mỗi chunk 5000 document) làm phình metadata
+# và chậm load job, nên các chunk được gom lại tới khi đủ số dòng hoặc đủ dung lượng mới ghi.
+ROW_GROUP_ROWS = 500_000
+ROW_GROUP_BYTES = 64 * 1024 * 1024
+COMPRESSIONS = ("zstd", "snappy")
+
+SCALAR_TYPES = {
+    "STRING": pa.string(),
+    "INT64": pa.int64(),
+    "INTEGER": pa.int64(),
+    "FLOAT64": pa.float64(),
+    "FLOAT": pa.float64(),
+    "BOOL": pa.bool_(),
+    "BOOLEAN": pa.bool_(),
+    # Parquet timestamp không có isAdjustedToUTC được BigQuery nạp thành DATETIME
+    "DATETIME": pa.timestamp("us"),
+    "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+    "DATE": pa.date32(),
+}
+
+
+class ColumnSpec(NamedTuple):
+    data_type: str
+    not_null: bool
+
+
+def _split_top_level(s: str) -> List[str]:
+    """Tách "a STRING, b ARRAY<STRUCT<x INT64, y STRING>>" theo dấu phẩy ngoài cùng."""
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(s):
+        if ch == "<":
+            depth += 1
+        elif ch == ">":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(s[start:i])
+            start = i + 1
+    parts.append(s[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+def arrow_type(bq_type: str) -> pa.DataType:
+    """Chuyển kiểu BigQuery trong schema.yml sang kiểu pyarrow."""
+    t = bq_type.strip()
+    upper = t.upper()
+    if upper.startswith("ARRAY<") and upper.endswith(">"):
+        return pa.list_(arrow_type(t[6:-1]))
+    if upper.startswith("STRUCT<") and upper.endswith(">"):
+        fields = []
+        for part in _split_top_level(t[7:-1]):
+            name, sub = part.split(None, 1)
+            fields.append(pa.field(name, arrow_type(sub)))
+        return pa.struct(fields)
+    if upper not in SCALAR_TYPES:
+        raise ValueError(f"Kiểu BigQuery không hỗ trợ trong schema.yml: {bq_type}")
+    return SCALAR_TYPES[upper]
+
+@functools.lru_cache(maxsize=None)
+def load_seed_schema(path: str) -> Dict[str, Dict[str, ColumnSpec]]:
+    """Đọc schema.yml -> {table: {column: ColumnSpec}}. Thiếu file thì trả về rỗng (mọi cột STRING)."""
+    if not os.path.exists(path):
+        logging.warning(f"Không tìm thấy {path} -> mọi cột Parquet sẽ là STRING.")
+        return {}
+    with open(path, encoding="utf-8") as f:
+        doc = yaml.safe_load(f) or {}
+    tables = {}
+    for seed in doc.get("seeds") or []:
+        columns = {}
+        for col in seed.get("columns") or []:
+            tests = col.get("tests") or col.get("data_tests") or []
+            columns[col["name"]] = ColumnSpec(col.get("data_type") or "STRING", "not_null" in tests)
+        tables[seed["name"]] = columns
+    return tables
+
+def arrow_schema(columns: Iterable[str], specs: Dict[str, ColumnSpec]) -> pa.Schema:
+    fields = []
+    for name in columns:
+        spec = specs.get(name, ColumnSpec("STRING", False))
+        fields.append(pa.field(name, arrow_type(spec.data_type), nullable=not spec.not_null))
+    return pa.schema(fields)
+
+
+# ------------------------------
+# Ép kiểu một cột pandas (giá trị thô từ MongoDB) sang mảng pyarrow
+# ------------------------------
+
+def _is_type_mask(s: pd.Series, kind: type) -> pd.Series:
+    return s.map(type).eq(kind)
+
+def _to_datetime(s: pd.Series, tz: Optional[str]) -> pd.Series:
+    # Chuỗi ISO 8601 (có/không +00:00, Z, phần giây lẻ) và datetime của pymongo (UTC naive);
+    # chuỗi không hợp lệ hoặc năm 0000 (ngoài miền của BigQuery) -> null
+    out = pd.to_datetime(s.astype(object), errors="coerce", utc=True, format="ISO8601")
+    out = out.where(out.dt.year >= 1)
+    return out if tz else out.dt.tz_localize(None)
+
+def to_arrow_array(s: pd.Series, type_: pa.DataType) -> pa.Array:
+    """Ép một cột về type_. Thử chuyển thẳng trước, lỗi kiểu thì chuẩn hoá từng giá trị."""
+    if pa.types.is_timestamp(type_):
+        return pa.array(_to_datetime(s, type_.tz), type=type_, from_pandas=True)
+    if pa.types.is_date32(type_):
+        return pa.array(_to_datetime(s, None).dt.date, type=type_, from_pandas=True)
+    try:
+        return pa.array(s, type=type_, from_pandas=True)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        if pa.types.is_nested(type_):
+            raise
+    s = s.astype(object)
+    if pa.types.is_string(type_):
+        s = s.where(s.isna() | _is_type_mask(s, str), s.astype(str))
+    elif pa.types.is_boolean(type_):
+        s = s.where(_is_type_mask(s, bool), None)
+    else:
+        # "12", "12.0" -> số; True/False và chuỗi không phải số -> null (giống normalize_int/float)
+        s = pd.to_numeric(s.where(~_is_type_mask(s, bool), None), errors="coerce")
+        if pa.types.is_integer(type_):
+            s = np.trunc(s.where(s.abs() < 2 ** 63))
+    return pa.array(s, type=type_, from_pandas=True)
+
+def to_arrow_table(df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    arrays = [to_arrow_array(df[field.name], field.type) for field in schema]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class ParquetSeedWriter:
+    """Ghi một bảng ra file Parquet theo từng chunk, cùng giao diện write()/close() với SeedWriter CSV.
+
+    Cột và thứ tự cột lấy theo chunk đầu tiên, kiểu lấy theo schema.yml. Các chunk được gom
+    thành row group khoảng ROW_GROUP_ROWS dòng / ROW_GROUP_BYTES byte trước khi ghi.
+    """
+
+    def __init__(self, seed_dir: str, table: str, schema_path: Optional[str] = None,
+                 compression: str = "zstd", row_group_rows: int = ROW_GROUP_ROWS,
+                 row_group_bytes: int = ROW_GROUP_BYTES):
+        self.path = os.path.join(seed_dir, f"{table}.parquet")
+        self.filename = f"{table}.parquet"
+        self.specs = load_seed_schema(schema_path or os.path.join(seed_dir, "schema.yml")).get(table, {})
+        self.compression = compression
+        self.row_group_rows = row_group_rows
+        self.row_group_bytes = row_group_bytes
+        self.schema: Optional[pa.Schema] = None
+        self.rows_in = 0
+        self.rows_out = 0
+        self._pending: List[pa.Table] = []
+        self._pending_rows = 0
+        self._pending_bytes = 0
+        self._writer: Optional[pq.ParquetWriter] = None
+
+    def write(self, rows: List[Dict]):
+        if rows:
+            self.write_frame(pd.DataFrame(rows))
+
+    def write_frame(self, df: pd.DataFrame):
+        if df.empty:
+            return
+        self.rows_in += len(df)
+        if self.schema is None:
+            self.schema = arrow_schema(df.columns, self.specs)
+        required = [f.name for f in self.schema if not f.nullable]
+        df = df.reindex(columns=self.schema.names).dropna(subset=required)
+        if df.empty:
+            return
+        table = to_arrow_table(df, self.schema)
+        self._pending.append(table)
+        self._pending_rows += table.num_rows
+        self._pending_bytes += table.nbytes
+        if self._pending_rows >= self.row_group_rows or self._pending_bytes >= self.row_group_bytes:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        table = pa.concat_tables(self._pending)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, self.schema, compression=self.compression)
+        self._writer.write_table(table, row_group_size=self.row_group_rows)
+        self.rows_out += table.num_rows
+        self._pending, self._pending_rows, self._pending_bytes = [], 0, 0
+
+    def close(self):
+        self._flush()
+        if self._writer is None:
+            # Vẫn ghi file rỗng có schema (lấy từ schema.yml nếu chưa có chunk nào)
+            schema = self.schema or arrow_schema(self.specs, self.specs)
+            pq.write_table(schema.empty_table(), self.path, compression=self.compression)
+            logging.warning(f"{self.filename}: không có dữ liệu -> ghi file Parquet rỗng.")
+            return
+        self._writer.close()
+        self._writer = None
+        logging.info(f"{self.filename}: {self.rows_in} rows trước khi lọc, ghi {self.rows_out} rows")
+
+
+def concat_parquet(paths: List[str], dest: str, compression: str = "zstd",
+                   row_group_rows: int = ROW_GROUP_ROWS) -> int:
+    """Nối các shard Parquet cùng schema thành một file, gom lại row group (shard nhỏ không để lại
+    row group lẻ). Shard rỗng (schema lấy từ schema.yml) bị bỏ qua. Trả về số dòng đã ghi."""
+    shards = [(path, pq.ParquetFile(path)) for path in paths]
+    shards = [(path, shard) for path, shard in shards if shard.metadata.num_rows] or shards[:1]
+    schema = shards[0][1].schema_arrow
+    rows = 0
+    with pq.ParquetWriter(dest, schema, compression=compression) as writer:
+        pending, pending_rows = [], 0
+        for path, shard in shards:
+            if shard.schema_arrow != schema:
+                raise ValueError(f"{path}: schema khác shard đầu tiên")
+            for i in range(shard.num_row_groups):
+                table = shard.read_row_group(i)
+                pending.append(table)
+                pending_rows += table.num_rows
+                if pending_rows >= row_group_rows:
+                    writer.write_table(pa.concat_tables(pending), row_group_size=row_group_rows)
+                    rows += pending_rows
+                    pending, pending_rows = [], 0
+        if pending:
+            writer.write_table(pa.concat_tables(pending), row_group_size=row_group_rows)
+            rows += pending_rows
+    return rows
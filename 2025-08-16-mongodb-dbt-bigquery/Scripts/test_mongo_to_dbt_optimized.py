@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Regression test: các hàm làm sạch/chuẩn hoá vector hoá phải cho ra CSV giống hệt từng byte
+với bản chạy theo từng giá trị (clean_text, normalize_datetime, normalize_int, normalize_float).
+
+Chạy:
+    cd Scripts
+    python -m pytest -q test_mongo_to_dbt_optimized.py
+"""
+
+import csv
+import os
+import random
+import sys
+from datetime import datetime, timezone
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mongo_to_dbt_optimized as m  # noqa: E402
+
+TEXT_VALUES = [
+    "plain", "  padded  ", "line\r\nbreak", "cr\ronly", "lf\nonly", "tab\there", 'say "hi"',
+    "ctrl\x00\x07\x1f\x7f\x85end", "Tiếng Việt có dấu", "日本語タイトル", "emoji 😀 here",
+    "", "   ", "\r\n", '"', "mixed\t\"quote\"\r\n", None,
+]
+DATETIME_VALUES = [
+    "2018-03-19T13:37:36+00:00", "2021-12-31T23:59:59Z", "2021-12-31T23:59:59",
+    "2021-12-31T23:59:59.123456+00:00", "2021-02-30T00:00:00+00:00", "2021-12-31T23:59:60+00:00",
+    "0000-01-01T00:00:00+00:00", "1500-06-01T10:00:00+00:00", "2021-12-31", "2021-12-31T23:59:59+07:00",
+    "2021-12-31T23:59:59\n", "not a date", "", None,
+    datetime(2025, 1, 1), datetime(2025, 1, 1, 12, 30, 5, 120), datetime(2025, 1, 1, tzinfo=timezone.utc),
+]
+INT_VALUES = [0, 1, -1, 42, 2019, 3.0, 2.5, -2.5, -0.5, 2 ** 53 + 1, 2 ** 60, "12", "12.0", " 7 ", "1e3",
+              "abc", "", None, True, float("nan")]
+FLOAT_VALUES = [0, 1, 5, 0.1, 1 / 3, 1e16, 1e-5, -2.75, 123456789.123, "4.5", "7", "x", "", None, True]
+
+
+def old_clean_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """clean_frame như trước khi vector hoá (map(clean_text) từng ô, trừ year đã là Int64)."""
+    key_col = next((col for col in ['manga_id', 'creator_id', 'stat_id', 'chapter_id', 'tag_id', 'group_id', 'related_group_id'] if col in df.columns), df.columns[0])
+    df = df.dropna(subset=[key_col])
+    if 'year' in df.columns:
+        df['year'] = df['year'].astype(str).str.replace('.0', '').replace('nan', '').replace('None', '')
+        df['year'] = pd.to_numeric(df['year'], errors='coerce').astype('Int64')
+    for col in df.columns.drop('year', errors='ignore'):
+        df[col] = df[col].map(m.clean_text)
+    return df
+
+
+def to_csv_bytes(df: pd.DataFrame) -> str:
+    return df.to_csv(index=False, quoting=csv.QUOTE_ALL)
+
+
+def random_rows(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        rows.append({
+            "stat_id": f"s{i}" if rng.random() > 0.05 else None,
+            "title": rng.choice(TEXT_VALUES),
+            "created_at": rng.choice(DATETIME_VALUES),
+            "year": rng.choice([2001, 1999, None, 2020.0]),
+            "follows": rng.choice([rng.randint(0, 10 ** 6), None]),
+            "rating_avg": rng.choice([round(rng.uniform(0, 10), rng.randint(0, 6)), None]),
+            "is_locked": rng.choice([True, False, None]),
+        })
+    return rows
+
+
+def test_clean_series_matches_clean_text():
+    s = pd.Series(TEXT_VALUES * 3, dtype=object)
+    assert to_csv_bytes(m.clean_series(s).to_frame("x")) == to_csv_bytes(s.map(m.clean_text).to_frame("x"))
+
+
+def test_clean_series_mixed_column():
+    s = pd.Series(["a\nb", 1, True, None, 2.5, 'q"'], dtype=object)
+    assert to_csv_bytes(m.clean_series(s).to_frame("x")) == to_csv_bytes(s.map(m.clean_text).to_frame("x"))
+
+
+def test_normalize_datetime_series_matches_scalar():
+    s = pd.Series(DATETIME_VALUES, dtype=object)
+    assert list(m.normalize_datetime_series(s)) == [m.normalize_datetime(v) for v in DATETIME_VALUES]
+
+
+def test_normalize_datetime_series_datetime_column():
+    values = [datetime(2025, 1, 1), datetime(2025, 3, 4, 5, 6, 7, 890), None]
+    s = pd.DataFrame({"t": values})["t"]
+    assert list(m.normalize_datetime_series(s)) == [m.normalize_datetime(v) for v in values]
+
+
+def test_normalize_int_series_matches_scalar():
+    s = pd.Series(INT_VALUES, dtype=object)
+    assert list(m.normalize_int_series(s)) == [m.normalize_int(v) for v in INT_VALUES]
+    numeric = [v for v in INT_VALUES if isinstance(v, (int, float)) and not isinstance(v, bool)]
+    s = pd.Series(numeric)
+    assert list(m.normalize_int_series(s)) == [m.normalize_int(None if pd.isna(v) else v) for v in numeric]
+
+
+def test_normalize_float_series_matches_scalar():
+    s = pd.Series(FLOAT_VALUES, dtype=object)
+    assert list(m.normalize_float_series(s)) == [m.normalize_float(v) for v in FLOAT_VALUES]
+    rng = random.Random(3)
+    values = [rng.uniform(-1e6, 1e6) for _ in range(2000)] + [rng.random() * 10 ** rng.randint(-8, 20) for _ in range(2000)]
+    assert list(m.normalize_float_series(pd.Series(values))) == [m.normalize_float(v) for v in values]
+
+
+def test_seed_writer_byte_identical(tmp_path):
+    rows = random_rows(2500)
+    types = {"datetimes": ("created_at",), "ints": ("year", "follows"), "floats": ("rating_avg",)}
+
+    writer = m.SeedWriter(str(tmp_path), "fact_statistics.csv", **types)
+    for i in range(0, len(rows), 700):
+        writer.write(rows[i:i + 700])
+    writer.close()
+
+    # Bản cũ: chuẩn hoá khi dựng row rồi map(clean_text), ghi theo cùng các chunk
+    expected = []
+    for i in range(0, len(rows), 700):
+        chunk = []
+        for row in rows[i:i + 700]:
+            row = dict(row)
+            row["created_at"] = m.normalize_datetime(row["created_at"])
+            row["year"] = m.normalize_int(row["year"])
+            row["follows"] = m.normalize_int(row["follows"])
+            row["rating_avg"] = m.normalize_float(row["rating_avg"])
+            chunk.append(row)
+        csv_text = to_csv_bytes(old_clean_frame(pd.DataFrame(chunk)))
+        expected.append(csv_text if i == 0 else csv_text.split("\n", 1)[1])
+
+    with open(os.path.join(str(tmp_path), "fact_statistics.csv"), encoding="utf-8", newline="") as f:
+        assert f.read() == "".join(expected)
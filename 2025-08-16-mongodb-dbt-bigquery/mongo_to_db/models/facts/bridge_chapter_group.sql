@@ -0,0 +1,11 @@
+-- models/facts/bridge_chapter_group.sql
+
+{{ config(
+    materialized='incremental',
+    incremental_strategy='merge',
+    unique_key=['chapter_id', 'group_id'],
+    on_schema_change='append_new_columns'
+) }}
+
+SELECT *
+FROM {{ ref('delta_bridge_chapter_group') }}
@@ -0,0 +1,13 @@
+-- models/facts/fact_chapters.sql
+-- Merge delta chapter (seed delta_fact_chapters, xuất bởi mongo_to_dbt_optimized.py --incremental).
+-- Lần đầu hoặc sau export toàn bộ: dbt run --full-refresh --select fact_chapters
+
+{{ config(
+    materialized='incremental',
+    incremental_strategy='merge',
+    unique_key='chapter_id',
+    on_schema_change='append_new_columns'
+) }}
+
+SELECT *
+FROM {{ ref('delta_fact_chapters') }}
@@ -0,0 +1,11 @@
+-- models/facts/fact_manga_trends.sql
+
+{{ config(
+    materialized='incremental',
+    incremental_strategy='merge',
+    unique_key=['manga_id', 'snapshot_time'],
+    on_schema_change='append_new_columns'
+) }}
+
+SELECT *
+FROM {{ ref('delta_fact_manga_trends') }}
@@ -0,0 +1,12 @@
+-- models/facts/fact_statistics.sql
+-- Merge delta snapshot thống kê (seed delta_fact_statistics); stat_id là _id của snapshot trong MongoDB.
+
+{{ config(
+    materialized='incremental',
+    incremental_strategy='merge',
+    unique_key='stat_id',
+    on_schema_change='append_new_columns'
+) }}
+
+SELECT *
+FROM {{ ref('delta_fact_statistics') }}